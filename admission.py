@@ -0,0 +1,154 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+# Admission control and load shedding for interactive chat turns (/api/chat, /ws/chat).
+#
+# At most CHAT_MAX_CONCURRENT_TURNS turns run at once in this worker. Later turns wait in
+# a queue of at most CHAT_MAX_QUEUED_TURNS, ordered by priority and then arrival.
+# A turn that cannot be queued, or that waits longer than CHAT_QUEUE_TIMEOUT_SECONDS, is
+# refused with Overloaded. The caller answers 503 with Retry-After, estimated from recent
+# turn durations and the queue length. When the queue is full, a higher-priority turn
+# takes the place of the newest lowest-priority waiter.
+#
+# Priorities: a turn that completes a booking (a conversation this worker has served
+# before, whose message has an email address or booking words) goes first, then other
+# follow-up turns, then first turns of new conversations (mostly FAQ).
+# Background jobs (/api/chat/jobs) are not admitted here; CHAT_JOB_WORKERS bounds them.
+#
+# Env:
+#   CHAT_MAX_CONCURRENT_TURNS  - turns running at once; 0 disables admission control (default 16)
+#   CHAT_MAX_QUEUED_TURNS      - turns waiting for a slot (default 64)
+#   CHAT_QUEUE_TIMEOUT_SECONDS - longest wait for a slot before 503 (default 10)
+
+T = TypeVar("T")
+
+PRIORITY_BOOKING = 0
+PRIORITY_FOLLOW_UP = 1
+PRIORITY_NEW = 2
+PRIORITY_NAMES = {PRIORITY_BOOKING: "booking", PRIORITY_FOLLOW_UP: "follow_up", PRIORITY_NEW: "new"}
+
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.\w+")
+BOOKING_RE = re.compile(r"\b(book|confirm|reserve|go ahead)\b", re.IGNORECASE)
+MAX_REMEMBERED_CONVERSATIONS = 10000
+MAX_RETRY_AFTER = 60
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: Optional[int] = None, max_queued: Optional[int] = None,
+                 queue_timeout: Optional[float] = None):
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(
+            os.getenv("CHAT_MAX_CONCURRENT_TURNS") or "16")
+        self.max_queued = max_queued if max_queued is not None else int(os.getenv("CHAT_MAX_QUEUED_TURNS") or "64")
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(
+            os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS") or "10")
+        self._running = 0
+        # (priority, arrival, future): a resolved future means the slot was handed to that waiter
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._conversations: "OrderedDict[str, None]" = OrderedDict()
+        self._avg_turn_seconds = 2.0
+        self.counters = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_timeout": 0, "shed": 0}
+        self.admitted_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    def classify(self, conversation_key: str, message: str) -> int:
+        if conversation_key not in self._conversations:
+            return PRIORITY_NEW
+        if EMAIL_RE.search(message) or BOOKING_RE.search(message):
+            return PRIORITY_BOOKING
+        return PRIORITY_FOLLOW_UP
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, from recent turn durations and the queue length."""
+        slots = max(1, self.max_concurrent)
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(self._avg_turn_seconds * (len(self._waiters) + 1) / slots)))
+
+    async def run(self, conversation_key: str, message: str, turn: Callable[[], Awaitable[T]]) -> T:
+        """Runs turn() once a slot is free; raises Overloaded when the queue is full or the wait too long."""
+        priority = self.classify(conversation_key, message)
+        await self._acquire(priority)
+        self.counters["admitted"] += 1
+        self.admitted_by_priority[PRIORITY_NAMES[priority]] += 1
+        self._conversations[conversation_key] = None
+        self._conversations.move_to_end(conversation_key)
+        while len(self._conversations) > MAX_REMEMBERED_CONVERSATIONS:
+            self._conversations.popitem(last=False)
+        started = time.monotonic()
+        try:
+            return await turn()
+        finally:
+            self._avg_turn_seconds = 0.8 * self._avg_turn_seconds + 0.2 * (time.monotonic() - started)
+            self._release()
+
+    async def _acquire(self, priority: int):
+        if self.max_concurrent <= 0 or (self._running < self.max_concurrent and not self._waiters):
+            self._running += 1
+            return
+        if len(self._waiters) >= self.max_queued:
+            worst = max(self._waiters)
+            if worst[0] <= priority:
+                self.counters["rejected_full"] += 1
+                raise Overloaded("Too many chat turns waiting", self.retry_after())
+            # Shed the newest of the lowest-priority waiters to make room
+            self._remove(worst)
+            worst[2].set_exception(Overloaded("Displaced by a higher-priority turn", self.retry_after()))
+            self.counters["shed"] += 1
+
+        entry = (priority, next(self._arrivals), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        self.counters["queued"] += 1
+        try:
+            done, _ = await asyncio.wait({entry[2]}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(entry)
+            raise
+        if not done:
+            self._abandon(entry)
+            self.counters["rejected_timeout"] += 1
+            raise Overloaded(f"No free turn slot within {self.queue_timeout:g}s", self.retry_after())
+        entry[2].result()  # raises Overloaded if this waiter was shed
+
+    def _remove(self, entry):
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+
+    def _abandon(self, entry):
+        """A waiter that gives up; if a slot was already handed to it, pass the slot on."""
+        future = entry[2]
+        if future.done():
+            if not future.cancelled() and future.exception() is None:
+                self._release()
+            return
+        self._remove(entry)
+        future.cancel()
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # the slot passes straight to the waiter
+                return
+        self._running -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self._running,
+            "waiting": len(self._waiters),
+            "avg_turn_seconds": round(self._avg_turn_seconds, 3),
+            "retry_after": self.retry_after(),
+            **self.counters,
+            "admitted_by_priority": dict(self.admitted_by_priority),
+        }
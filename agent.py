@@ -1,6 +1,6 @@
 from google.adk.agents import Agent, SequentialAgent, ParallelAgent, LlmAgent
 from google.adk.tools.agent_tool import AgentTool
-from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
+from google.adk.tools.mcp_tool.mcp_toolset import StdioServerParameters
 from google.genai import types
 from dotenv import load_dotenv
 import os
@@ -9,6 +9,10 @@ import sys
 # Ensure we can import from local subdirectories if running this script directly
 sys.path.append(os.path.dirname(__file__))
 
+from mcp_pool import PooledMCPToolset
+from model_hedging import hedged
+from model_limiter import RateLimitedGemini
+
 load_dotenv()
 
 # Define paths to MCP Servers
@@ -23,7 +27,7 @@ GMAIL_MCP = os.path.join(MCP_SERVERS_DIR, "gmail_mcp.py")
 # 1. Booking Agent (Zoom)
 Booking_Agent = LlmAgent(
     name="Booking_Agent",
-    model="gemini-2.5-flash",
+    model=hedged(RateLimitedGemini(model="gemini-2.5-flash")),
     description="Creates a Zoom meeting.",
     instruction=(
         "You create a Zoom meeting using the 'create_meeting' tool. "
@@ -32,7 +36,7 @@ Booking_Agent = LlmAgent(
         "Output the Zoom Meeting ID, Join URL, and Time."
     ),
     tools=[
-        MCPToolset(
+        PooledMCPToolset(
             connection_params=StdioServerParameters(
                 command='python',
                 args=[ZOOM_MCP],
@@ -40,7 +44,11 @@ Booking_Agent = LlmAgent(
                     "PYTHONUNBUFFERED": "1",
                     "ZOOM_ACCOUNT_ID": os.getenv("ZOOM_ACCOUNT_ID", ""),
                     "ZOOM_CLIENT_ID": os.getenv("ZOOM_CLIENT_ID", ""),
-                    "ZOOM_CLIENT_SECRET": os.getenv("ZOOM_CLIENT_SECRET", "")
+                    "ZOOM_CLIENT_SECRET": os.getenv("ZOOM_CLIENT_SECRET", ""),
+                    "ZOOM_API_BASE_URL": os.getenv("ZOOM_API_BASE_URL", ""),
+                    "CREDENTIAL_STORE_PATH": os.getenv("CREDENTIAL_STORE_PATH", ""),
+                    "CREDENTIAL_STORE_KEY": os.getenv("CREDENTIAL_STORE_KEY", ""),
+                    "MCP_CLIENT_CACHE_SIZE": os.getenv("MCP_CLIENT_CACHE_SIZE", "")
                 }
             )
         )
@@ -53,15 +61,16 @@ Booking_Agent = LlmAgent(
 # 2a. Email Confirmation (Gmail)
 Email_Confirmation_Agent = LlmAgent(
     name="Email_Confirmation_Agent",
-    model="gemini-2.5-flash",
+    model=hedged(RateLimitedGemini(model="gemini-2.5-flash")),
     description="Sends a confirmation email.",
     instruction=(
-        "Send a confirmation email using 'send_email' tool. "
+        "Send a confirmation email using 'send_email' tool with queue=true, so the booking doesn't wait on delivery. "
         "To: [User Email]. Subject: 'Strategy Session with [User Name]'. "
-        "Body: Include Zoom Meeting ID, Join URL, and Time from the previous steps."
+        "Body: Include Zoom Meeting ID, Join URL, and Time from the previous steps. "
+        "Report that the confirmation email is on its way (do not call 'get_send_status' unless asked)."
     ),
     tools=[
-        MCPToolset(
+        PooledMCPToolset(
             connection_params=StdioServerParameters(
                 command='python',
                 args=[GMAIL_MCP],
@@ -69,7 +78,11 @@ Email_Confirmation_Agent = LlmAgent(
                     "PYTHONUNBUFFERED": "1",
                     "GMAIL_CLIENT_ID": os.getenv("GMAIL_CLIENT_ID", ""),
                     "GMAIL_CLIENT_SECRET": os.getenv("GMAIL_CLIENT_SECRET", ""),
-                    "GMAIL_REFRESH_TOKEN": os.getenv("GMAIL_REFRESH_TOKEN", "")
+                    "GMAIL_REFRESH_TOKEN": os.getenv("GMAIL_REFRESH_TOKEN", ""),
+                    "GMAIL_API_BASE_URL": os.getenv("GMAIL_API_BASE_URL", ""),
+                    "CREDENTIAL_STORE_PATH": os.getenv("CREDENTIAL_STORE_PATH", ""),
+                    "CREDENTIAL_STORE_KEY": os.getenv("CREDENTIAL_STORE_KEY", ""),
+                    "MCP_CLIENT_CACHE_SIZE": os.getenv("MCP_CLIENT_CACHE_SIZE", "")
                 }
             )
         )
@@ -79,7 +92,7 @@ Email_Confirmation_Agent = LlmAgent(
 # 2b. Calendar Booking (Calendar)
 Calendar_Booking_Agent = LlmAgent(
     name="Calendar_Booking_Agent",
-    model="gemini-2.5-flash",
+    model=hedged(RateLimitedGemini(model="gemini-2.5-flash")),
     description="Adds the meeting to the consultant's calendar.",
     instruction=(
         "Add the meeting to the calendar using 'create_event' tool. "
@@ -89,7 +102,7 @@ Calendar_Booking_Agent = LlmAgent(
         "Description: Youtube Zoom Link: [Zoom Join URL]. User Email: [User Email]"
     ),
     tools=[
-        MCPToolset(
+        PooledMCPToolset(
             connection_params=StdioServerParameters(
                 command='python',
                 args=[CALENDAR_MCP],
@@ -97,7 +110,11 @@ Calendar_Booking_Agent = LlmAgent(
                     "PYTHONUNBUFFERED": "1",
                     "CALENDAR_CLIENT_ID": os.getenv("CALENDAR_CLIENT_ID", ""),
                     "CALENDAR_CLIENT_SECRET": os.getenv("CALENDAR_CLIENT_SECRET", ""),
-                    "CALENDAR_REFRESH_TOKEN": os.getenv("CALENDAR_REFRESH_TOKEN", "")
+                    "CALENDAR_REFRESH_TOKEN": os.getenv("CALENDAR_REFRESH_TOKEN", ""),
+                    "CALENDAR_API_BASE_URL": os.getenv("CALENDAR_API_BASE_URL", ""),
+                    "CREDENTIAL_STORE_PATH": os.getenv("CREDENTIAL_STORE_PATH", ""),
+                    "CREDENTIAL_STORE_KEY": os.getenv("CREDENTIAL_STORE_KEY", ""),
+                    "MCP_CLIENT_CACHE_SIZE": os.getenv("MCP_CLIENT_CACHE_SIZE", "")
                 }
             )
         )
@@ -122,7 +139,7 @@ Booking_Execution_Workflow = SequentialAgent(
 execution_tool = AgentTool(Booking_Execution_Workflow)
 
 # Create Calendar Tool for Negotiation (Check Availability)
-calendar_negotiation_tool = MCPToolset(
+calendar_negotiation_tool = PooledMCPToolset(
     connection_params=StdioServerParameters(
         command='python',
         args=[CALENDAR_MCP],
@@ -130,7 +147,11 @@ calendar_negotiation_tool = MCPToolset(
             "PYTHONUNBUFFERED": "1",
             "CALENDAR_CLIENT_ID": os.getenv("CALENDAR_CLIENT_ID", ""),
             "CALENDAR_CLIENT_SECRET": os.getenv("CALENDAR_CLIENT_SECRET", ""),
-            "CALENDAR_REFRESH_TOKEN": os.getenv("CALENDAR_REFRESH_TOKEN", "")
+            "CALENDAR_REFRESH_TOKEN": os.getenv("CALENDAR_REFRESH_TOKEN", ""),
+            "CALENDAR_API_BASE_URL": os.getenv("CALENDAR_API_BASE_URL", ""),
+            "CREDENTIAL_STORE_PATH": os.getenv("CREDENTIAL_STORE_PATH", ""),
+            "CREDENTIAL_STORE_KEY": os.getenv("CREDENTIAL_STORE_KEY", ""),
+            "MCP_CLIENT_CACHE_SIZE": os.getenv("MCP_CLIENT_CACHE_SIZE", "")
         }
     )
 )
@@ -146,7 +167,7 @@ cangro_context = load_cangro_context()
 
 root_agent = Agent(
     name="Personal_Orchestrator",
-    model="gemini-2.5-flash",
+    model=hedged(RateLimitedGemini(model="gemini-2.5-flash")),
     description="The main orchestrator agent.",
     instruction=(
         "You are the Personal Orchestrator Agent and the main assistant for CANGRO. "
@@ -164,6 +185,21 @@ root_agent = Agent(
     tools=[execution_tool, calendar_negotiation_tool]
 )
 
+# Light path for small talk and FAQ turns (see intent_router.py): a smaller model, the
+# CANGRO context and no tools. Scheduling turns go to root_agent.
+faq_agent = Agent(
+    name="CANGRO_FAQ",
+    model=hedged(RateLimitedGemini(model=os.getenv("FAQ_MODEL", "gemini-2.5-flash-lite"))),
+    description="Answers greetings and questions about CANGRO.",
+    instruction=(
+        "You are the assistant for CANGRO. Answer greetings and questions about CANGRO briefly, "
+        "using only the CANGRO CONTEXT below. If the user wants to schedule or book a meeting, ask "
+        "which day and time suits them; do not promise availability.\n\n"
+        "### CANGRO CONTEXT ###\n"
+        f"{cangro_context}\n"
+    ),
+)
+
 
 if __name__ == "__main__":
     import asyncio
@@ -0,0 +1,48 @@
+from typing import Callable, Iterator, List
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.tools.agent_tool import AgentTool
+from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
+
+# Helpers to walk the agent graph built in agent.py.
+# Agents are reachable either as sub_agents or wrapped in an AgentTool.
+
+
+def iter_agents(root: BaseAgent) -> Iterator[BaseAgent]:
+    """Yields every agent reachable from root (each agent once)."""
+    seen = set()
+    stack: List[BaseAgent] = [root]
+    while stack:
+        agent = stack.pop()
+        if id(agent) in seen:
+            continue
+        seen.add(id(agent))
+        yield agent
+        stack.extend(agent.sub_agents)
+        for tool in getattr(agent, "tools", []):
+            if isinstance(tool, AgentTool):
+                stack.append(tool.agent)
+
+
+def iter_llm_agents(root: BaseAgent) -> Iterator[LlmAgent]:
+    for agent in iter_agents(root):
+        if isinstance(agent, LlmAgent):
+            yield agent
+
+
+def replace_mcp_toolsets(
+    root: BaseAgent,
+    transform: Callable[[StdioServerParameters], StdioServerParameters],
+) -> int:
+    """Rebuilds every stdio MCPToolset (keeping its class) with connection params returned by transform."""
+    replaced = 0
+    for agent in iter_llm_agents(root):
+        new_tools = []
+        for tool in agent.tools:
+            params = getattr(tool, "_connection_params", None)
+            if isinstance(tool, MCPToolset) and isinstance(params, StdioServerParameters):
+                tool = type(tool)(connection_params=transform(params))
+                replaced += 1
+            new_tools.append(tool)
+        agent.tools = new_tools
+    return replaced
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Offline load test for POST /api/chat.
+# Drives server.app in-process (httpx ASGI transport, no sockets) with a scripted
+# fake Gemini model and stubbed Gmail/Calendar/Zoom MCP backends, then reports
+# latency percentiles, throughput, RSS and MCP subprocess count as JSON.
+# With --backend fake-api the real MCP services talk HTTP to the local fake_apis server instead.
+#
+# Usage:
+#   python -m benchmarks.chat_bench --conversations 200 --concurrency 16
+#   python -m benchmarks.chat_bench --backend fake-api --fake-threads 5000 --fake-events 2000
+#   GEMINI_HEDGING=1 python -m benchmarks.chat_bench --model-tail-rate 0.03 --model-tail-ms 2000
+#   python -m benchmarks.compare benchmarks/results/a.json benchmarks/results/b.json
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+STUB_MCP = os.path.join(BASE_DIR, "benchmarks", "stub_mcp.py")
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+
+logger = logging.getLogger("chat_bench")
+
+# --- Scenarios ---
+# Each scenario is a list of (turn_kind, message) sent on one conversation_id.
+SCENARIOS: Dict[str, List] = {
+    "faq": [
+        ("faq", "What does CANGRO do and who is it for?"),
+    ],
+    "negotiation": [
+        ("negotiation", "I'd like to book a meeting. What slots are available next week?"),
+        ("negotiation", "Is there availability on Tuesday morning for a 30 minute meeting?"),
+    ],
+    "booking": [
+        ("negotiation", "Can we schedule a meeting? Which slots are available?"),
+        ("booking", "Please book 2030-01-07T08:00:00+00:00. My name is Ana Perez and my email is ana@example.com"),
+    ],
+}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parses 'faq=0.5,negotiation=0.3,booking=0.2' into weights."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}'. Choose from {list(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# --- Environment setup ---
+def stub_backends(root_agent, backend_latency_ms: float) -> int:
+    """Points every MCP toolset at the stub MCP server for the same service."""
+    from google.adk.tools.mcp_tool.mcp_toolset import StdioServerParameters
+    from benchmarks.agent_graph import replace_mcp_toolsets
+
+    def transform(params: StdioServerParameters) -> StdioServerParameters:
+        script = os.path.basename(params.args[0])
+        kind = script.replace("_mcp.py", "")
+        env = dict(params.env or {})
+        env["STUB_BACKEND_LATENCY_MS"] = str(backend_latency_ms)
+        return StdioServerParameters(command=sys.executable, args=[STUB_MCP, kind], env=env)
+
+    return replace_mcp_toolsets(root_agent, transform)
+
+
+def fake_api_backends(root_agent, base_url: str) -> int:
+    """Keeps the real MCP servers but points their services at the fake API server."""
+    from google.adk.tools.mcp_tool.mcp_toolset import StdioServerParameters
+    from benchmarks.agent_graph import replace_mcp_toolsets
+
+    overrides = {"GMAIL_API_BASE_URL": base_url, "CALENDAR_API_BASE_URL": base_url, "ZOOM_API_BASE_URL": base_url}
+    for prefix in ("GMAIL", "CALENDAR"):
+        overrides.update({f"{prefix}_CLIENT_ID": "bench", f"{prefix}_CLIENT_SECRET": "bench",
+                          f"{prefix}_REFRESH_TOKEN": "bench"})
+    overrides.update({"ZOOM_ACCOUNT_ID": "bench", "ZOOM_CLIENT_ID": "bench", "ZOOM_CLIENT_SECRET": "bench"})
+
+    def transform(params: StdioServerParameters) -> StdioServerParameters:
+        env = {**(params.env or {}), **overrides}
+        return StdioServerParameters(command=sys.executable, args=list(params.args), env=env)
+
+    return replace_mcp_toolsets(root_agent, transform)
+
+
+# --- Resource sampling ---
+def _read_status_kb(pid: int, field: str) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def child_pids(pid: int) -> List[int]:
+    """All descendant PIDs of pid (Linux /proc only)."""
+    parents: Dict[int, List[int]] = {}
+    try:
+        entries = [e for e in os.listdir("/proc") if e.isdigit()]
+    except OSError:
+        return []
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+
+    found, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+async def sample_peaks(peaks: Dict, interval: float = 0.1):
+    """Tracks the peak subprocess count and child RSS while the benchmark runs."""
+    while True:
+        sample = sample_resources()
+        peaks["max_subprocess_count"] = max(peaks.get("max_subprocess_count", 0), sample["subprocess_count"])
+        peaks["max_children_rss_mb"] = max(peaks.get("max_children_rss_mb", 0), sample["children_rss_mb"])
+        await asyncio.sleep(interval)
+
+
+def sample_resources() -> Dict:
+    pid = os.getpid()
+    children = child_pids(pid)
+    rss_kb = _read_status_kb(pid, "VmRSS")
+    children_kb = sum(_read_status_kb(c, "VmRSS") or 0 for c in children)
+    return {
+        "rss_mb": round(rss_kb / 1024, 1) if rss_kb is not None else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children_rss_mb": round(children_kb / 1024, 1),
+        "subprocess_count": len(children),
+    }
+
+
+# --- Stats ---
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[Dict], elapsed: float) -> Dict:
+    latencies = [s["latency_ms"] for s in samples if s["ok"]]
+    return {
+        "turns": len(samples),
+        "errors": sum(1 for s in samples if not s["ok"]),
+        "p50_ms": _round(percentile(latencies, 50)),
+        "p95_ms": _round(percentile(latencies, 95)),
+        "p99_ms": _round(percentile(latencies, 99)),
+        "mean_ms": _round(sum(latencies) / len(latencies)) if latencies else None,
+        "max_ms": _round(max(latencies)) if latencies else None,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+# --- Driver ---
+async def run_job(client, payload: Dict, poll_seconds: float = 0.02):
+    """Submits a turn to /api/chat/jobs and polls until it finishes; returns (ok, error)."""
+    response = await client.post("/api/chat/jobs", json=payload)
+    if response.status_code != 202:
+        return False, response.text[:300]
+    job_id = response.json()["job_id"]
+    while True:
+        await asyncio.sleep(poll_seconds)
+        job = (await client.get(f"/api/chat/jobs/{job_id}")).json()
+        if job.get("status") == "succeeded":
+            return True, None
+        if job.get("status") != "queued" and job.get("status") != "running":
+            return False, str(job.get("error") or job)[:300]
+
+
+async def run_conversation(client, scenario: str, samples: List[Dict], api: str = "chat"):
+    conversation_id = f"bench-{scenario}-{uuid.uuid4().hex[:12]}"
+    for turn_kind, message in SCENARIOS[scenario]:
+        payload = {"messages": [], "new_message": message, "conversation_id": conversation_id}
+        started = time.perf_counter()
+        try:
+            if api == "jobs":
+                ok, detail = await run_job(client, payload)
+            else:
+                response = await client.post("/api/chat", json=payload)
+                ok = response.status_code == 200
+                detail = None if ok else response.text[:300]
+        except Exception as e:
+            ok, detail = False, str(e)
+        samples.append({
+            "scenario": scenario,
+            "turn_kind": turn_kind,
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            "ok": ok,
+            "error": detail,
+        })
+
+
+async def run_benchmark(args) -> Dict:
+    import httpx
+    import server
+    from benchmarks.fake_model import install_fake_model
+    from model_hedging import hedge_stats, hedging_enabled
+
+    if server.root_agent is None:
+        server.load_runtime()  # FAST_STARTUP defers it to app startup, which the ASGI transport doesn't run
+    for agent in (server.root_agent, server.faq_agent):
+        install_fake_model(agent, args.model_latency_ms, args.model_jitter_ms,
+                           args.model_tail_rate, args.model_tail_ms)
+    fake_api = None
+    if args.backend == "fake-api":
+        from fake_apis import BackgroundServer, FaultConfig, create_app
+
+        faults = FaultConfig(latency_ms=args.backend_latency_ms, seed=args.seed)
+        fake_api = BackgroundServer(create_app(threads=args.fake_threads, events=args.fake_events,
+                                               meetings=100, seed=args.seed, faults=faults)).start()
+        fake_api_backends(server.root_agent, fake_api.base_url)
+    else:
+        stub_backends(server.root_agent, args.backend_latency_ms)
+
+    rng = random.Random(args.seed)
+    names = list(args.mix)
+    weights = [args.mix[n] for n in names]
+    plan = [rng.choices(names, weights)[0] for _ in range(args.conversations)]
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+        # Warm-up spawns the MCP subprocesses so the measured window is steady state.
+        warmup: List[Dict] = []
+        for name in SCENARIOS:
+            for _ in range(args.warmup):
+                await run_conversation(client, name, warmup, args.api)
+        warmup_errors = [s["error"] for s in warmup if not s["ok"]]
+
+        samples: List[Dict] = []
+        queue: asyncio.Queue = asyncio.Queue()
+        for name in plan:
+            queue.put_nowait(name)
+
+        async def worker():
+            while not queue.empty():
+                await run_conversation(client, queue.get_nowait(), samples, args.api)
+
+        peaks: Dict = {}
+        sampler = asyncio.create_task(sample_peaks(peaks))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    backend_requests = None
+    if fake_api:
+        backend_requests = fake_api.app.state.faults.stats()["requests"]
+        fake_api.stop()
+
+    by_scenario = {name: summarize([s for s in samples if s["scenario"] == name], elapsed) for name in names}
+    by_turn_kind = {
+        kind: summarize([s for s in samples if s["turn_kind"] == kind], elapsed)
+        for kind in sorted({s["turn_kind"] for s in samples})
+    }
+    errors = [s["error"] for s in samples if not s["ok"]]
+
+    return {
+        "timestamp": datetime.now().astimezone().isoformat(),
+        "git_commit": _git_commit(),
+        "config": {
+            "conversations": args.conversations,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "model_latency_ms": args.model_latency_ms,
+            "model_jitter_ms": args.model_jitter_ms,
+            "model_tail_rate": args.model_tail_rate,
+            "model_tail_ms": args.model_tail_ms,
+            "model_hedging": hedging_enabled(),
+            "backend": args.backend,
+            "api": args.api,
+            "backend_latency_ms": args.backend_latency_ms,
+            "seed": args.seed,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarize(samples, elapsed),
+        "by_scenario": by_scenario,
+        "by_turn_kind": by_turn_kind,
+        "resources": {**sample_resources(), **peaks},
+        "backend_requests": backend_requests,
+        "model_hedging": hedge_stats() if hedging_enabled() else None,
+        "intent_router": server.intent_router.stats(),
+        "warmup_errors": warmup_errors[:5],
+        "sample_errors": errors[:5],
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for /api/chat.")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("faq=0.5,negotiation=0.3,booking=0.2"))
+    parser.add_argument("--model-latency-ms", type=float, default=50.0)
+    parser.add_argument("--model-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--model-tail-rate", type=float, default=0.0,
+                        help="Fraction of model calls that are slow (see --model-tail-ms); try with GEMINI_HEDGING=1.")
+    parser.add_argument("--model-tail-ms", type=float, default=2000.0)
+    parser.add_argument("--backend", choices=["stub", "fake-api"], default="stub",
+                        help="stub: in-memory services inside the MCP servers; fake-api: real services over HTTP "
+                             "to a local fake_apis server.")
+    parser.add_argument("--api", choices=["chat", "jobs"], default="chat",
+                        help="chat: POST /api/chat; jobs: submit to /api/chat/jobs and poll for the result.")
+    parser.add_argument("--backend-latency-ms", type=float, default=20.0)
+    parser.add_argument("--fake-threads", type=int, default=2000, help="Gmail threads seeded in fake-api mode.")
+    parser.add_argument("--fake-events", type=int, default=1000, help="Calendar events seeded in fake-api mode.")
+    parser.add_argument("--warmup", type=int, default=1, help="Warm-up conversations per scenario.")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/chat-<timestamp>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("google_adk").setLevel(logging.ERROR)
+    result = asyncio.run(run_benchmark(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"chat-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    overall = result["overall"]
+    print(f"Turns: {overall['turns']} (errors: {overall['errors']}) in {result['elapsed_s']}s")
+    print(f"p50 {overall['p50_ms']} ms | p95 {overall['p95_ms']} ms | p99 {overall['p99_ms']} ms | "
+          f"{overall['throughput_rps']} turns/s")
+    res = result["resources"]
+    print(f"RSS {res['rss_mb']} MB (peak {res['peak_rss_mb']} MB), "
+          f"{res['subprocess_count']} subprocesses using {res['children_rss_mb']} MB "
+          f"(peak {res.get('max_subprocess_count')} / {res.get('max_children_rss_mb')} MB)")
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
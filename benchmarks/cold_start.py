@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+# Cold-start benchmark: launches `python server.py` as a fresh process and measures
+# how long until the port answers /api/health, until the agent graph is loaded, and
+# until every MCP server pool reports all of its instances healthy. Runs with and
+# without FAST_STARTUP.
+#
+# Usage:
+#   python -m benchmarks.cold_start --runs 3
+#   python -m benchmarks.cold_start --modes fast --runs 5 --output benchmarks/results/cold.json
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.chat_bench import RESULTS_DIR, _git_commit  # noqa: E402
+from benchmarks.import_profile import MODES  # noqa: E402
+
+POLL_SECONDS = 0.02
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure(env: Dict[str, str], timeout: float) -> Dict[str, Optional[float]]:
+    """One cold start; times are milliseconds from process launch."""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "server.py"], cwd=BASE_DIR,
+        env={**os.environ, **env, "PORT": str(port)}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    times: Dict[str, Optional[float]] = {"port_ms": None, "agent_ready_ms": None, "mcp_warm_ms": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=2.0) as client:
+            while time.perf_counter() - started < timeout and process.poll() is None:
+                elapsed = round((time.perf_counter() - started) * 1000, 1)
+                try:
+                    health = client.get("/api/health").json()
+                except httpx.HTTPError:
+                    time.sleep(POLL_SECONDS)
+                    continue
+                if times["port_ms"] is None:
+                    times["port_ms"] = elapsed
+                if times["agent_ready_ms"] is None and health.get("status") == "ok":
+                    times["agent_ready_ms"] = elapsed
+                if times["agent_ready_ms"] is not None:
+                    pools = client.get("/api/metrics").json()["mcp_pools"]
+                    if pools and all(p["healthy"] >= p["size"] for p in pools.values()):
+                        times["mcp_warm_ms"] = elapsed
+                        break
+                time.sleep(POLL_SECONDS)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return times
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    summary = {}
+    for key in ("port_ms", "agent_ready_ms", "mcp_warm_ms"):
+        values = [r[key] for r in runs if r[key] is not None]
+        summary[key] = {"median": round(statistics.median(values), 1) if values else None,
+                        "min": min(values) if values else None, "missing": len(runs) - len(values)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for server.py.")
+    parser.add_argument("--modes", default="default,fast", help=f"Comma-separated, from {list(MODES)}")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for one start.")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/cold-start-<timestamp>.json)")
+    args = parser.parse_args()
+
+    modes = {}
+    for mode in args.modes.split(","):
+        runs = [measure(MODES[mode], args.timeout) for _ in range(args.runs)]
+        modes[mode] = {"summary": summarize(runs), "runs": runs}
+        s = modes[mode]["summary"]
+        print(f"{mode}: port {s['port_ms']['median']} ms | agent ready {s['agent_ready_ms']['median']} ms | "
+              f"MCP pools warm {s['mcp_warm_ms']['median']} ms (median of {args.runs})")
+
+    result = {
+        "timestamp": datetime.now().astimezone().isoformat(),
+        "git_commit": _git_commit(),
+        "modes": modes,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"cold-start-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import json
+from typing import Dict, Optional
+
+# Compares two chat_bench result files.
+# Usage: python -m benchmarks.compare baseline.json candidate.json
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "mean_ms", "throughput_rps", "errors"]
+RESOURCES = ["rss_mb", "peak_rss_mb", "children_rss_mb", "subprocess_count",
+             "max_subprocess_count", "max_children_rss_mb"]
+
+
+def _delta(old: Optional[float], new: Optional[float]) -> str:
+    if old is None or new is None:
+        return "n/a"
+    if old == 0:
+        return f"{new - old:+g}"
+    return f"{new - old:+.2f} ({(new - old) / old * 100:+.1f}%)"
+
+
+def _print_row(label: str, old, new):
+    print(f"  {label:<20} {str(old):>12} {str(new):>12}   {_delta(old, new)}")
+
+
+def compare(baseline: Dict, candidate: Dict):
+    print(f"Baseline:  {baseline.get('git_commit')} @ {baseline.get('timestamp')}")
+    print(f"Candidate: {candidate.get('git_commit')} @ {candidate.get('timestamp')}")
+    if baseline.get("config") != candidate.get("config"):
+        print("WARNING: benchmark configs differ; deltas may not be comparable.")
+
+    sections = [("overall", baseline["overall"], candidate["overall"])]
+    for name in sorted(set(baseline["by_turn_kind"]) & set(candidate["by_turn_kind"])):
+        sections.append((f"turn:{name}", baseline["by_turn_kind"][name], candidate["by_turn_kind"][name]))
+
+    for title, old, new in sections:
+        print(f"\n[{title}]")
+        for metric in METRICS:
+            _print_row(metric, old.get(metric), new.get(metric))
+
+    print("\n[resources]")
+    for metric in RESOURCES:
+        _print_row(metric, baseline["resources"].get(metric), candidate["resources"].get(metric))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two chat benchmark results.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    compare(baseline, candidate)
+
+
+if __name__ == "__main__":
+    main()
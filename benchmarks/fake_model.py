@@ -0,0 +1,147 @@
+import asyncio
+import random
+import re
+from typing import AsyncGenerator, Dict, List
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from benchmarks.agent_graph import iter_llm_agents
+
+# Scripted stand-in for gemini-2.5-flash.
+# It never touches the network: every reply is decided from the request contents
+# and the tools declared for the calling agent, so the whole agent graph
+# (orchestrator -> booking workflow -> zoom/gmail/calendar agents) can be driven offline.
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+ISO_RE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2})?([+-]\d{2}:\d{2}|Z)?")
+
+SCHEDULING_WORDS = ("book", "meeting", "meet", "available", "availability", "slot", "schedule")
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _content_text(content: types.Content) -> str:
+    return " ".join(p.text for p in (content.parts or []) if p.text)
+
+
+class ScriptedGemini(BaseLlm):
+    """Deterministic fake model that answers FAQ, negotiation and booking turns."""
+
+    model: str = "scripted-gemini"
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    tail_rate: float = 0.0
+    tail_ms: float = 0.0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+        if self.tail_rate and random.random() < self.tail_rate:
+            delay += self.tail_ms / 1000.0  # an occasional slow response, as from the real model
+        if delay:
+            await asyncio.sleep(delay)
+
+        prompt_text = self._prompt_text(llm_request)
+        part = self._next_part(llm_request)
+        reply_text = part.text or (part.function_call.name if part.function_call else "")
+
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[part]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=_estimate_tokens(prompt_text),
+                candidates_token_count=_estimate_tokens(reply_text),
+                total_token_count=_estimate_tokens(prompt_text) + _estimate_tokens(reply_text),
+            ),
+        )
+
+    def _prompt_text(self, llm_request: LlmRequest) -> str:
+        chunks = [_content_text(c) for c in llm_request.contents]
+        if llm_request.config and isinstance(llm_request.config.system_instruction, str):
+            chunks.append(llm_request.config.system_instruction)
+        return "\n".join(chunks)
+
+    def _next_part(self, llm_request: LlmRequest) -> types.Part:
+        """Picks the next step: a tool call for a fresh request, text after a tool result."""
+        last = llm_request.contents[-1] if llm_request.contents else None
+        if last and any(p.function_response for p in (last.parts or [])):
+            responses = [p.function_response for p in last.parts if p.function_response]
+            names = ", ".join(r.name for r in responses)
+            return types.Part(text=f"Done ({names}). {self._summarize(responses)}")
+
+        tools = llm_request.tools_dict
+        user_text = self._latest_user_text(llm_request.contents)
+
+        if not tools:  # the light FAQ agent
+            return types.Part(text="CANGRO helps teams design and deliver strategy sessions. How can I help?")
+        if "Booking_Execution_Workflow" in tools:
+            return self._orchestrator_part(tools, user_text)
+        if "create_meeting" in tools:
+            return self._call("create_meeting", {
+                "topic": "Strategy Session",
+                "start_time": self._start_time(user_text),
+                "duration": 30,
+            })
+        if "send_email" in tools:
+            return self._call("send_email", {
+                "to": self._email(user_text),
+                "subject": "Strategy Session",
+                "body": f"Your meeting is confirmed. {user_text[:200]}",
+                "queue": True,
+            })
+        if "create_event" in tools:
+            return self._call("create_event", {
+                "summary": "Strategy Session",
+                "start_time": self._start_time(user_text),
+                "end_time": self._start_time(user_text),
+                "description": f"User Email: {self._email(user_text)}",
+            })
+        return types.Part(text="Done.")
+
+    def _orchestrator_part(self, tools: Dict, user_text: str) -> types.Part:
+        """FAQ answer, availability lookup or booking hand-off for the root agent."""
+        lowered = user_text.lower()
+        if EMAIL_RE.search(user_text) and "book" in lowered:
+            return self._call("Booking_Execution_Workflow", {"request": user_text})
+        if "find_free_slots" in tools and any(w in lowered for w in SCHEDULING_WORDS):
+            return self._call("find_free_slots", {"duration_minutes": 30, "max_slots": 5})
+        return types.Part(text="CANGRO helps teams design and deliver strategy sessions. How can I help?")
+
+    def _latest_user_text(self, contents: List[types.Content]) -> str:
+        for content in reversed(contents):
+            if content.role == "user":
+                text = _content_text(content)
+                if text:
+                    return text
+        return ""
+
+    def _call(self, name: str, args: Dict) -> types.Part:
+        return types.Part(function_call=types.FunctionCall(name=name, args=args))
+
+    def _summarize(self, responses: List[types.FunctionResponse]) -> str:
+        return " ".join(str(r.response)[:300] for r in responses)
+
+    def _email(self, text: str) -> str:
+        match = EMAIL_RE.search(text)
+        return match.group(0) if match else "guest@example.com"
+
+    def _start_time(self, text: str) -> str:
+        match = ISO_RE.search(text)
+        return match.group(0) if match else "2030-01-07T10:00:00Z"
+
+
+def install_fake_model(root_agent, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                       tail_rate: float = 0.0, tail_ms: float = 0.0) -> ScriptedGemini:
+    """Replaces the model of every LlmAgent reachable from root_agent (hedged if GEMINI_HEDGING is on)."""
+    from model_hedging import hedged
+
+    model = ScriptedGemini(latency_ms=latency_ms, jitter_ms=jitter_ms, tail_rate=tail_rate, tail_ms=tail_ms)
+    for agent in iter_llm_agents(root_agent):
+        agent.model = hedged(model)
+    return model
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List
+
+# Import-time profile of the server module (python -X importtime), with and without
+# FAST_STARTUP, to show what module load costs before uvicorn can bind the port.
+#
+# Usage:
+#   python -m benchmarks.import_profile
+#   python -m benchmarks.import_profile --module server --top 15 --repeat 3
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.chat_bench import RESULTS_DIR, _git_commit  # noqa: E402
+
+MODES = {"default": {"FAST_STARTUP": "0"}, "fast": {"FAST_STARTUP": "1"}}
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Parses '-X importtime' lines into {module, depth, self_us, cumulative_us}."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append({"module": name.strip(), "depth": depth, "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return rows
+
+
+def profile(module: str, env: Dict[str, str]) -> List[Dict]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", f"import {module}"],
+        cwd=BASE_DIR, env={**os.environ, **env}, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def summarize(rows: List[Dict], module: str, top: int) -> Dict:
+    # importtime lists a module after its imports: the target's direct imports are the
+    # depth-1 rows since the previous top-level row (what each of its import lines costs)
+    children: List[Dict] = []
+    for row in rows:
+        if row["depth"] == 0 and row["module"] == module:
+            target = row
+            break
+        if row["depth"] == 0:
+            children = []
+        elif row["depth"] == 1:
+            children.append(row)
+    return {
+        "total_ms": round(target["cumulative_us"] / 1000, 1),
+        "modules_imported": len(rows),
+        "top_direct_imports": [
+            {"module": r["module"], "ms": round(r["cumulative_us"] / 1000, 1)}
+            for r in sorted(children, key=lambda r: -r["cumulative_us"])[:top]
+        ],
+        "top_self": [
+            {"module": r["module"], "ms": round(r["self_us"] / 1000, 1)}
+            for r in sorted(rows, key=lambda r: -r["self_us"])[:top]
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of the server module.")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--modes", default="default,fast", help=f"Comma-separated, from {list(MODES)}")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode; the fastest is reported.")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/imports-<timestamp>.json)")
+    args = parser.parse_args()
+
+    modes = {}
+    for mode in args.modes.split(","):
+        runs = [summarize(profile(args.module, MODES[mode]), args.module, args.top) for _ in range(args.repeat)]
+        modes[mode] = min(runs, key=lambda r: r["total_ms"])
+        print(f"{mode}: import {args.module} {modes[mode]['total_ms']} ms "
+              f"({modes[mode]['modules_imported']} modules)")
+        for item in modes[mode]["top_direct_imports"][:5]:
+            print(f"    {item['ms']:>9} ms  {item['module']}")
+
+    result = {
+        "timestamp": datetime.now().astimezone().isoformat(),
+        "git_commit": _git_commit(),
+        "module": args.module,
+        "modes": modes,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"imports-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
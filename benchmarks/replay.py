@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+# Replays conversations recorded by turn_recorder.TurnRecorder (CHAT_RECORD_DIR)
+# against the current code. Recorded model responses and MCP tool results are
+# substituted, so what is measured is this version's own overhead and prompt size.
+# Each turn runs on the agent it was recorded on (the orchestrator, or the light FAQ
+# agent for turns intent_router routed there); recordings without one use the orchestrator.
+#
+# Usage:
+#   python -m benchmarks.replay recordings/turns-20261019.jsonl.gz [--conversation ID] [--output report.json]
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+logger = logging.getLogger("replay")
+
+
+def group_conversations(turns: List[Dict]) -> "OrderedDict[str, List[Dict]]":
+    conversations: "OrderedDict[str, List[Dict]]" = OrderedDict()
+    for turn in turns:
+        conversations.setdefault(turn["conversation_id"], []).append(turn)
+    return conversations
+
+
+async def replay_conversation(agents: Dict, default_agent: str, conversation_id: str,
+                              turns: List[Dict]) -> List[Dict]:
+    """Replays one conversation; agents maps agent names to agents, default_agent names the orchestrator."""
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+    from google.genai import types
+    from turn_recorder import ReplayPlugin, estimate_request_tokens
+
+    session_service = InMemorySessionService()
+    replay = ReplayPlugin()
+    # One runner per agent, sharing the session as the server's routes do
+    runners = {name: Runner(agent=a, app_name="personal_orchestrator", session_service=session_service,
+                            plugins=[replay])
+               for name, a in agents.items()}
+    user_id = turns[0].get("user_id", "user")
+    await session_service.create_session(app_name="personal_orchestrator", user_id=user_id,
+                                         session_id=conversation_id)
+
+    results = []
+    for index, turn in enumerate(turns):
+        agent_name = turn.get("agent") or default_agent
+        if agent_name not in runners:
+            logger.warning(f"Turn {index} of {conversation_id} was recorded on unknown agent {agent_name}; "
+                           f"replaying it on {default_agent}")
+            agent_name = default_agent
+        runner = runners[agent_name]
+        replay.load(turn)
+        content = types.Content(role="user", parts=[types.Part(text=turn["input"])])
+        response_text, error = "", None
+        started = time.perf_counter()
+        try:
+            async for event in runner.run_async(user_id=user_id, session_id=conversation_id, new_message=content):
+                if event.is_final_response() and event.content and event.content.parts:
+                    response_text = event.content.parts[0].text or ""
+        except Exception as e:
+            error = str(e)
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        recorded_tokens = sum(estimate_request_tokens(c["request"]) for c in turn["model_calls"])
+        replay_tokens = sum(estimate_request_tokens(r) for r in replay.requests)
+        recorded_usage = sum((c.get("usage") or {}).get("prompt") or 0 for c in turn["model_calls"])
+        results.append({
+            "conversation_id": conversation_id,
+            "turn": index,
+            "input": turn["input"][:80],
+            "agent": agent_name,
+            "recorded_latency_ms": turn.get("latency_ms"),
+            "replay_latency_ms": round(latency_ms, 2),
+            "recorded_model_calls": len(turn["model_calls"]),
+            "replay_model_calls": len(replay.requests),
+            "recorded_prompt_tokens": recorded_usage or None,
+            "recorded_prompt_tokens_est": recorded_tokens,
+            "replay_prompt_tokens_est": replay_tokens,
+            "prompt_tokens_delta": replay_tokens - recorded_tokens,
+            "diverged": bool(replay.misses) or response_text != (turn.get("response_text") or ""),
+            "misses": replay.misses,
+            "error": error,
+        })
+    return results
+
+
+def print_report(rows: List[Dict]):
+    print(f"{'conversation':<28} {'turn':>4} {'rec ms':>9} {'replay ms':>9} {'rec tok':>8} {'new tok':>8} "
+          f"{'delta':>7}  diverged")
+    for row in rows:
+        print(f"{row['conversation_id'][:28]:<28} {row['turn']:>4} {row['recorded_latency_ms'] or 0:>9.1f} "
+              f"{row['replay_latency_ms']:>9.1f} {row['recorded_prompt_tokens_est']:>8} "
+              f"{row['replay_prompt_tokens_est']:>8} {row['prompt_tokens_delta']:>+7}  "
+              f"{'yes' if row['diverged'] else 'no'}")
+    if rows:
+        delta = sum(r["prompt_tokens_delta"] for r in rows)
+        diverged = sum(1 for r in rows if r["diverged"])
+        print(f"\n{len(rows)} turns replayed, {diverged} diverged, total prompt token delta {delta:+d}")
+
+
+async def run(args) -> List[Dict]:
+    import agent
+    from benchmarks.chat_bench import stub_backends
+    from turn_recorder import load_recordings
+
+    # Tool results come from the recording; stub servers only provide the tool declarations.
+    stub_backends(agent.root_agent, 0)
+
+    conversations = group_conversations(load_recordings(args.recordings))
+    if args.conversation:
+        conversations = OrderedDict((k, v) for k, v in conversations.items() if k == args.conversation)
+
+    agents = {a.name: a for a in (agent.root_agent, agent.faq_agent)}
+    rows: List[Dict] = []
+    for conversation_id, turns in list(conversations.items())[:args.limit]:
+        rows.extend(await replay_conversation(agents, agent.root_agent.name, conversation_id, turns))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded chat turns against the current code.")
+    parser.add_argument("recordings", nargs="+", help="turns-*.jsonl.gz files written by CHAT_RECORD_DIR")
+    parser.add_argument("--conversation", help="Only replay this conversation_id.")
+    parser.add_argument("--limit", type=int, default=None, help="Max conversations to replay.")
+    parser.add_argument("--output", help="Write the per-turn report as JSON.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("google_adk").setLevel(logging.ERROR)
+    rows = asyncio.run(run(args))
+    print_report(rows)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+# Runs one of the real MCP servers (calendar / gmail / zoom) with its Google/Zoom
+# service replaced by an in-memory stub. The MCP layer (tool schemas, argument
+# handling, result serialization) is the production code; only the backend is fake.
+#
+# Usage: python benchmarks/stub_mcp.py calendar|gmail|zoom
+# Env:   STUB_BACKEND_LATENCY_MS - simulated backend latency per call (default 0)
+
+MCP_SERVERS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp_servers")
+sys.path.insert(0, MCP_SERVERS_DIR)
+
+LATENCY = float(os.getenv("STUB_BACKEND_LATENCY_MS", "0")) / 1000.0
+
+
+def _backend_call():
+    """Simulates the blocking round trip the real service would make."""
+    if LATENCY:
+        time.sleep(LATENCY)
+
+
+# --- Stub Services ---
+class StubCalendarService:
+    account = "stub"
+
+    def __init__(self):
+        self.events: Dict[str, Dict] = {}
+
+    def list_events(self, max_results: int = 10, time_min: Optional[str] = None, time_max: Optional[str] = None,
+                    page_token: Optional[str] = None) -> Dict:
+        _backend_call()
+        start = int(page_token or 0)
+        events = list(self.events.values())
+        result = {'events': events[start:start + max_results]}
+        if start + max_results < len(events):
+            result['next_page_token'] = str(start + max_results)
+        return result
+
+    def create_event(self, summary: str, start_time: str, end_time: str, description: str = "") -> Dict:
+        _backend_call()
+        event_id = uuid.uuid4().hex
+        self.events[event_id] = {'id': event_id, 'summary': summary, 'start': start_time, 'status': 'confirmed'}
+        return {'id': event_id, 'status': 'Event created', 'link': f"https://calendar.example/{event_id}"}
+
+    def delete_event(self, event_id: str) -> Dict:
+        _backend_call()
+        self.events.pop(event_id, None)
+        return {'status': 'Event deleted', 'id': event_id}
+
+    def create_events(self, events: List[Dict]) -> Dict:
+        results = [{'index': i, 'id': self.create_event(e.get('summary', ''), e.get('start_time'), e.get('end_time'))['id'],
+                    'status': 'created'} for i, e in enumerate(events)]
+        return {'created': len(results), 'failed': 0, 'results': results}
+
+    def delete_events(self, event_ids: List[str]) -> Dict:
+        results = [{'id': event_id, 'status': 'deleted' if self.events.pop(event_id, None) else 'not found'}
+                   for event_id in event_ids]
+        deleted = sum(1 for r in results if r['status'] == 'deleted')
+        return {'deleted': deleted, 'not_found': len(results) - deleted, 'failed': 0, 'results': results}
+
+    def find_free_slots(self, duration_minutes: int = 30, start_date: str = None, max_slots: int = 5) -> List[Dict]:
+        _backend_call()
+        start = datetime(2030, 1, 7, 8, 0, tzinfo=timezone.utc)
+        slots = []
+        for i in range(max_slots):
+            slot_start = start + timedelta(minutes=i * duration_minutes)
+            slots.append({
+                "start_time": slot_start.isoformat(),
+                "end_time": (slot_start + timedelta(minutes=duration_minutes)).isoformat(),
+            })
+        return slots
+
+
+class StubGmailService:
+    def __init__(self):
+        self.sent: List[Dict] = []
+
+    def list_threads(self, query: str = '', limit: int = 5) -> List[Dict]:
+        _backend_call()
+        return [{'id': f"t{i}", 'subject': f"Subject {i}", 'sender': 'someone@example.com',
+                 'snippet': 'Hello there', 'message_count': 1} for i in range(limit)]
+
+    def read_thread(self, thread_id: str) -> Dict:
+        _backend_call()
+        return {'id': thread_id, 'messages': [{'id': 'm1', 'from': 'someone@example.com', 'body': 'Hello there'}]}
+
+    def get_attachment(self, message_id: str, part_id: str) -> Dict:
+        _backend_call()
+        return {'message_id': message_id, 'part_id': part_id, 'filename': 'proposal.pdf',
+                'mime_type': 'application/pdf', 'size': 1024, 'path': f"/tmp/{message_id}-{part_id}-proposal.pdf"}
+
+    def create_draft(self, to: str, subject: str, body: str, attachments: List[str] = None, progress=None) -> Dict:
+        _backend_call()
+        return {'id': uuid.uuid4().hex, 'status': 'Draft created'}
+
+    def send_email(self, to: str, subject: str, body: str, queue: bool = False, attachments: List[str] = None,
+                   progress=None) -> Dict:
+        if queue:
+            outbox_id = f"out_{uuid.uuid4().hex[:16]}"
+            self.sent.append({'id': outbox_id, 'to': to, 'subject': subject})
+            return {'outbox_id': outbox_id, 'status': 'queued'}
+        _backend_call()
+        message_id = uuid.uuid4().hex
+        self.sent.append({'id': message_id, 'to': to, 'subject': subject})
+        return {'id': message_id, 'status': 'Email sent'}
+
+    def reply_to_thread(self, thread_id: str, body: str, queue: bool = False) -> Dict:
+        if queue:
+            return {'outbox_id': f"out_{uuid.uuid4().hex[:16]}", 'status': 'queued'}
+        _backend_call()
+        return {'id': uuid.uuid4().hex, 'threadId': thread_id, 'status': 'Reply sent'}
+
+    def get_send_status(self, outbox_id: str = None, limit: int = 10):
+        return {'outbox_id': outbox_id, 'status': 'sent', 'attempts': 1}
+
+    def add_label(self, message_id: str, label_id: str) -> Dict:
+        _backend_call()
+        return {'id': message_id, 'labels': [label_id], 'status': 'Label added'}
+
+    def remove_label(self, message_id: str, label_id: str) -> Dict:
+        _backend_call()
+        return {'id': message_id, 'labels': [], 'status': 'Label removed'}
+
+    def mark_as_read(self, message_id: str) -> Dict:
+        return self.remove_label(message_id, 'UNREAD')
+
+    def mark_as_unread(self, message_id: str) -> Dict:
+        return self.add_label(message_id, 'UNREAD')
+
+    def bulk_modify_labels(self, message_ids: List[str] = None, thread_ids: List[str] = None,
+                           add_label_ids: List[str] = None, remove_label_ids: List[str] = None) -> Dict:
+        _backend_call()
+        count = len(message_ids or []) + len(thread_ids or [])
+        return {'modified': count, 'requested': count, 'chunks': [{'chunk': 1, 'count': count, 'status': 'ok'}]}
+
+
+class StubZoomService:
+    def __init__(self):
+        self.meetings: List[Dict] = []
+
+    def list_meetings(self, user_id: str = "me", page_size: int = 10) -> List[Dict]:
+        _backend_call()
+        return self.meetings[:page_size]
+
+    def create_meeting(self, topic: str, start_time: str, duration: int, user_id: str = "me") -> Dict:
+        _backend_call()
+        meeting_id = int(uuid.uuid4().int % 10**11)
+        meeting = {
+            "id": meeting_id,
+            "topic": topic,
+            "start_time": start_time,
+            "join_url": f"https://zoom.example/j/{meeting_id}",
+            "password": "stub",
+        }
+        self.meetings.append(meeting)
+        return meeting
+
+
+def main(kind: str):
+    if kind == "calendar":
+        import calendar_mcp as server
+        server.calendar_service = StubCalendarService()
+    elif kind == "gmail":
+        import gmail_mcp as server
+        server.gmail_service = StubGmailService()
+    elif kind == "zoom":
+        import zoom_mcp as server
+        server.zoom_service = StubZoomService()
+    else:
+        raise SystemExit(f"Unknown MCP server kind: {kind}")
+    # Always use the stub above, even for users with stored credentials.
+    if kind == "zoom":
+        server.stored_credentials = lambda identity, provider: None
+    else:
+        server.require_credentials = lambda identity, provider, account_name: None
+    # Per-request INFO logs from the MCP servers would flood the benchmark output.
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(server.run())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise SystemExit("Usage: python benchmarks/stub_mcp.py calendar|gmail|zoom")
+    main(sys.argv[1])
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+# Background jobs for /api/chat/jobs: long agent turns (bookings) outlive proxy and
+# Cloud Run request timeouts and client disconnects.
+#
+# submit() stores the job and puts it on a queue served by a fixed number of worker
+# tasks; the caller gets the job ID at once and polls describe(). A job runs to the end
+# whether or not anyone is still polling. Finished jobs are kept for the TTL in a
+# bounded store (oldest finished jobs are dropped first); when the store is full of
+# unfinished jobs, submit() raises JobsFull. A job belongs to the identity that submitted
+# it: describe() with any other owner answers as if the job didn't exist.
+#
+# Env:
+#   CHAT_JOB_WORKERS     - turns run at the same time (default 4)
+#   CHAT_JOB_MAX         - jobs kept, queued and finished (default 1000)
+#   CHAT_JOB_TTL_SECONDS - how long a finished job's result can be fetched (default 3600)
+
+logger = logging.getLogger(__name__)
+
+
+class JobsFull(Exception):
+    pass
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp)) if timestamp else None
+
+
+class ChatJobs:
+    def __init__(self, workers: Optional[int] = None, max_jobs: Optional[int] = None, ttl: Optional[float] = None):
+        self.workers = workers or int(os.getenv("CHAT_JOB_WORKERS") or "4")
+        self.max_jobs = max_jobs or int(os.getenv("CHAT_JOB_MAX") or "1000")
+        self.ttl = ttl or float(os.getenv("CHAT_JOB_TTL_SECONDS") or "3600")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._turns: Dict[str, Callable[[], Awaitable[str]]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.counters = {"submitted": 0, "succeeded": 0, "failed": 0, "rejected": 0, "expired": 0}
+
+    def _start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def submit(self, conversation_id: str, turn: Callable[[], Awaitable[str]],
+               owner: Optional[Hashable] = None) -> Dict[str, Any]:
+        """Queues turn() for owner and returns the job description (status "queued")."""
+        self._start()
+        self._expire()
+        if len(self._jobs) >= self.max_jobs and not self._evict_finished():
+            self.counters["rejected"] += 1
+            raise JobsFull(f"{len(self._jobs)} jobs pending")
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {"conversation_id": conversation_id, "owner": owner, "status": "queued",
+                              "created": time.time(), "started": None, "finished": None,
+                              "text": None, "error": None}
+        self._turns[job_id] = turn
+        self._queue.put_nowait(job_id)
+        self.counters["submitted"] += 1
+        return self.describe(job_id, owner)
+
+    def describe(self, job_id: str, owner: Optional[Hashable] = None) -> Optional[Dict[str, Any]]:
+        """The job's status and result, or None if it doesn't exist, expired or isn't owner's."""
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is None or job["owner"] != owner:
+            return None
+        result = {"job_id": job_id, "conversation_id": job["conversation_id"], "status": job["status"],
+                  "created_at": _iso(job["created"])}
+        if job["status"] == "queued":
+            queued = [j for j in self._turns if self._jobs[j]["status"] == "queued"]
+            result["queue_position"] = queued.index(job_id) + 1
+        if job["started"]:
+            result["started_at"] = _iso(job["started"])
+        if job["finished"]:
+            result["finished_at"] = _iso(job["finished"])
+            result["duration_seconds"] = round(job["finished"] - job["started"], 3)
+        if job["status"] == "succeeded":
+            result["text"] = job["text"]
+        elif job["status"] == "failed":
+            result["error"] = job["error"]
+        return result
+
+    def _running(self) -> int:
+        return sum(1 for job_id in self._turns if self._jobs[job_id]["status"] == "running")
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs[job_id]
+            job.update(status="running", started=time.time())
+            try:
+                job["text"] = await self._turns[job_id]()
+                job["status"] = "succeeded"
+                self.counters["succeeded"] += 1
+            except asyncio.CancelledError:
+                job.update(status="failed", error="Server shutting down")
+                raise
+            except Exception as e:
+                job.update(status="failed", error=str(getattr(e, "detail", e)))
+                self.counters["failed"] += 1
+                logger.warning(f"Chat job {job_id} failed: {job['error']}")
+            finally:
+                job["finished"] = time.time()
+                del self._turns[job_id]
+                # Finished jobs move to the end so the store expires them in finish order
+                self._jobs.move_to_end(job_id)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j for j, job in self._jobs.items() if job["finished"] and job["finished"] < cutoff]:
+            del self._jobs[job_id]
+            self.counters["expired"] += 1
+
+    def _evict_finished(self) -> bool:
+        for job_id, job in self._jobs.items():
+            if job["finished"]:
+                del self._jobs[job_id]
+                self.counters["expired"] += 1
+                return True
+        return False
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": len(self._turns) - self._running(),
+            "running": self._running(),
+            "stored": len(self._jobs),
+            **self.counters,
+        }
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+# Protocol and flow control for /ws/chat: one WebSocket bound to one conversation.
+#
+# Client -> server:
+#   {"type": "message", "text": "..."}  starts a turn (queued if one is running)
+#   {"type": "ping"}                    answered with {"type": "pong"}
+# Server -> client:
+#   {"type": "ready", "conversation_id"} once, then per turn {"type": "turn_started"},
+#   "text" / "tool_call" / "tool_result" events as the agents produce them (tool
+#   arguments and results are not sent), and {"type": "final", "text"} (what /api/chat
+#   would return) or {"type": "error", "detail"}. {"type": "heartbeat"} is sent when
+#   the socket has been quiet for WS_HEARTBEAT_SECONDS, to keep proxies from closing it.
+#
+# Turns run one at a time. Up to WS_MAX_PENDING_MESSAGES more can wait; beyond that the
+# client gets an error "busy". Outgoing messages go through a bounded queue
+# (WS_SEND_QUEUE_SIZE), so a client that reads slowly slows its own turn down. A client
+# that stops reading for WS_SEND_TIMEOUT_SECONDS is disconnected. A turn that has started
+# finishes even if the client goes away, so the conversation history stays consistent.
+#
+# Env:
+#   WS_HEARTBEAT_SECONDS     - idle time before a heartbeat is sent (default 20)
+#   WS_MAX_PENDING_MESSAGES  - messages queued behind the running turn (default 4)
+#   WS_SEND_QUEUE_SIZE       - outgoing messages buffered per connection (default 64)
+#   WS_SEND_TIMEOUT_SECONDS  - how long a full send queue may block before disconnecting (default 30)
+
+logger = logging.getLogger(__name__)
+
+# run_turn(text, on_event) runs one turn, awaiting on_event for every ADK event, and returns the final text
+RunTurn = Callable[[str, Callable[[Any], Awaitable[None]]], Awaitable[str]]
+
+_stats = {"open": 0, "connections": 0, "turns": 0, "busy_rejections": 0, "slow_disconnects": 0, "messages_sent": 0}
+
+
+def describe_event(event) -> List[Dict[str, Any]]:
+    """Client messages for one ADK event: text parts and tool call/result names."""
+    messages = []
+    for part in (event.content.parts if event.content and event.content.parts else []):
+        if part.text:
+            messages.append({"type": "text", "author": event.author, "text": part.text,
+                             "partial": bool(event.partial)})
+        elif part.function_call:
+            messages.append({"type": "tool_call", "author": event.author, "name": part.function_call.name})
+        elif part.function_response:
+            messages.append({"type": "tool_result", "author": event.author, "name": part.function_response.name})
+    return messages
+
+
+class ChatSocket:
+    def __init__(self, websocket: WebSocket, conversation_id: str, run_turn: RunTurn):
+        self.ws = websocket
+        self.conversation_id = conversation_id
+        self._run_turn = run_turn
+        self.heartbeat = float(os.getenv("WS_HEARTBEAT_SECONDS") or "20")
+        self.send_timeout = float(os.getenv("WS_SEND_TIMEOUT_SECONDS") or "30")
+        self._outgoing: asyncio.Queue = asyncio.Queue(maxsize=int(os.getenv("WS_SEND_QUEUE_SIZE") or "64"))
+        self._messages: asyncio.Queue = asyncio.Queue(maxsize=int(os.getenv("WS_MAX_PENDING_MESSAGES") or "4"))
+        self._closed = asyncio.Event()
+        self._in_turn = False
+        self._last_sent = time.monotonic()
+        self.turns = 0
+
+    async def serve(self):
+        await self.ws.accept()
+        _stats["open"] += 1
+        _stats["connections"] += 1
+        await self.emit({"type": "ready", "conversation_id": self.conversation_id})
+        tasks = [asyncio.create_task(c) for c in (self._read(), self._write(), self._send_heartbeats())]
+        turns = asyncio.create_task(self._run_turns())
+        try:
+            await self._closed.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not self._in_turn:
+                turns.cancel()
+            try:
+                await self.ws.close()
+            except Exception:
+                pass  # already closed by the client
+            _stats["open"] -= 1
+        # A turn in progress runs to the end (its remaining events are dropped)
+        await asyncio.gather(turns, return_exceptions=True)
+
+    async def emit(self, message: Dict[str, Any]):
+        """Queues a message for the client; waits while the queue is full (backpressure)."""
+        if self._closed.is_set():
+            return
+        try:
+            await asyncio.wait_for(self._outgoing.put(message), self.send_timeout)
+        except asyncio.TimeoutError:
+            _stats["slow_disconnects"] += 1
+            logger.warning(f"/ws/chat {self.conversation_id}: client stopped reading, disconnecting")
+            self._closed.set()
+
+    async def emit_event(self, event):
+        for message in describe_event(event):
+            await self.emit(message)
+
+    async def _read(self):
+        try:
+            while True:
+                try:
+                    message = json.loads(await self.ws.receive_text())
+                except ValueError:
+                    await self.emit({"type": "error", "detail": "Messages must be JSON"})
+                    continue
+                kind = message.get("type") if isinstance(message, dict) else None
+                text = message.get("text") if kind == "message" else None
+                if kind == "ping":
+                    await self.emit({"type": "pong"})
+                elif isinstance(text, str) and text.strip():
+                    try:
+                        self._messages.put_nowait(text)
+                    except asyncio.QueueFull:
+                        _stats["busy_rejections"] += 1
+                        await self.emit({"type": "error", "detail": "busy: too many messages waiting for a turn"})
+                else:
+                    await self.emit({"type": "error", "detail": "Expected {\"type\": \"message\", \"text\": ...}"})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed.set()
+
+    async def _write(self):
+        try:
+            while True:
+                message = await self._outgoing.get()
+                await self.ws.send_text(json.dumps(message))
+                self._last_sent = time.monotonic()
+                _stats["messages_sent"] += 1
+        except Exception:
+            pass  # disconnected
+        finally:
+            self._closed.set()
+
+    async def _send_heartbeats(self):
+        while True:
+            await asyncio.sleep(max(0.1, self._last_sent + self.heartbeat - time.monotonic()))
+            if time.monotonic() - self._last_sent >= self.heartbeat and self._outgoing.empty():
+                await self.emit({"type": "heartbeat"})
+                self._last_sent = time.monotonic()
+
+    async def _run_turns(self):
+        while not self._closed.is_set():
+            text = await self._messages.get()
+            self._in_turn = True
+            self.turns += 1
+            _stats["turns"] += 1
+            turn = self.turns
+            started = time.perf_counter()
+            await self.emit({"type": "turn_started", "turn": turn})
+            try:
+                final = await self._run_turn(text, self.emit_event)
+                await self.emit({"type": "final", "turn": turn, "text": final,
+                                 "duration_ms": round((time.perf_counter() - started) * 1000, 1)})
+            except Exception as e:
+                error = {"type": "error", "turn": turn, "detail": str(getattr(e, "detail", e))}
+                if getattr(e, "retry_after", None):
+                    error["retry_after"] = e.retry_after  # refused by admission control
+                await self.emit(error)
+            finally:
+                self._in_turn = False
+
+
+def stats() -> Dict[str, int]:
+    return dict(_stats)
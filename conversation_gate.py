@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, Tuple, TypeVar
+
+# Per-conversation serialization and duplicate-request coalescing for /api/chat.
+#
+# Turns for the same conversation run one at a time (later turns queue behind the
+# in-flight one), so two runner.run_async calls never race on one ADK session.
+# An exact duplicate (same conversation + same message) submitted within the
+# coalesce window of the first submission shares its result instead of running again,
+# whether or not that turn has finished. Later duplicates run as new turns.
+
+T = TypeVar("T")
+
+
+class ConversationGate:
+    def __init__(self, coalesce_window: float = 5.0):
+        self.coalesce_window = coalesce_window
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._waiting: Dict[str, int] = {}
+        # (conversation, message hash) -> (shared result future, submitted at)
+        self._recent: Dict[Tuple[str, str], Tuple[asyncio.Future, float]] = {}
+        self.turns_started = 0
+        self.turns_queued = 0
+        self.coalesced = 0
+        self.max_queue_depth = 0
+
+    async def run(self, conversation_id: str, message: str, turn: Callable[[], Awaitable[T]]) -> T:
+        """Runs turn() serialized per conversation, coalescing exact duplicates."""
+        self._expire()
+        key = (conversation_id, hashlib.sha256(message.encode("utf-8")).hexdigest())
+        entry = self._recent.get(key)
+        if entry:
+            self.coalesced += 1
+            return await asyncio.shield(entry[0])
+
+        future = asyncio.get_running_loop().create_future()
+        self._recent[key] = (future, time.monotonic())
+        try:
+            result = await self._serialized(conversation_id, turn)
+        except BaseException as e:
+            # Failed turns are not cached: a retry of the same message should run again.
+            if self._recent.get(key, (None,))[0] is future:
+                del self._recent[key]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark retrieved when nobody coalesced onto it
+            raise
+        future.set_result(result)
+        return result
+
+    async def _serialized(self, conversation_id: str, turn: Callable[[], Awaitable[T]]) -> T:
+        lock = self._locks.setdefault(conversation_id, asyncio.Lock())
+        if lock.locked():
+            self.turns_queued += 1
+        self._waiting[conversation_id] = self._waiting.get(conversation_id, 0) + 1
+        self.max_queue_depth = max(self.max_queue_depth, self._waiting[conversation_id] - 1)
+        try:
+            async with lock:
+                self.turns_started += 1
+                return await turn()
+        finally:
+            self._waiting[conversation_id] -= 1
+            if not self._waiting[conversation_id]:
+                del self._waiting[conversation_id]
+                self._locks.pop(conversation_id, None)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.coalesce_window
+        # In-flight turns expire too: the window runs from submission, not completion
+        for key in [k for k, (_, submitted) in self._recent.items() if submitted < cutoff]:
+            del self._recent[key]
+
+    def stats(self) -> Dict:
+        return {
+            "active_conversations": len(self._locks),
+            "queue_depth": sum(max(0, n - 1) for n in self._waiting.values()),
+            "max_queue_depth": self.max_queue_depth,
+            "turns_started": self.turns_started,
+            "turns_queued": self.turns_queued,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,5 @@
+"""Local stand-in servers for the Gmail, Calendar and Zoom APIs used by mcp_servers/."""
+from fake_apis.app import BackgroundServer, create_app
+from fake_apis.faults import FaultConfig
+
+__all__ = ["BackgroundServer", "FaultConfig", "create_app"]
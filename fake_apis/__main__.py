@@ -0,0 +1,40 @@
+import argparse
+
+import uvicorn
+
+from fake_apis.app import create_app
+from fake_apis.faults import FaultConfig
+
+# Usage:
+#   python -m fake_apis --port 8787 --threads 5000 --events 2000 --latency-ms 40 --error-429-rate 0.02
+# Then point the MCP servers at it:
+#   GMAIL_API_BASE_URL=http://127.0.0.1:8787 CALENDAR_API_BASE_URL=http://127.0.0.1:8787 ZOOM_API_BASE_URL=http://127.0.0.1:8787
+# For push notifications to server.py, add --gmail-push-endpoint "http://127.0.0.1:8000/api/push/gmail?token=..."
+# and run server.py with PUSH_WEBHOOK_BASE_URL=http://127.0.0.1:8000 GMAIL_PUSH_TOPIC=projects/fake/topics/gmail
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gmail, Calendar and Zoom APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--threads", type=int, default=1000, help="Gmail threads to seed.")
+    parser.add_argument("--events", type=int, default=1000, help="Calendar events to seed.")
+    parser.add_argument("--meetings", type=int, default=100, help="Zoom meetings to seed.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-429-rate", type=float, default=0.0)
+    parser.add_argument("--error-5xx-rate", type=float, default=0.0)
+    parser.add_argument("--gmail-push-endpoint", default=None,
+                        help="Where Gmail watch notifications are pushed (Pub/Sub push subscription stand-in).")
+    args = parser.parse_args()
+
+    faults = FaultConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_429_rate=args.error_429_rate,
+                         error_5xx_rate=args.error_5xx_rate, seed=args.seed)
+    app = create_app(threads=args.threads, events=args.events, meetings=args.meetings, seed=args.seed, faults=faults,
+                     gmail_push_endpoint=args.gmail_push_endpoint)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
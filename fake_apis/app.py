@@ -0,0 +1,122 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from typing import Dict, Optional
+
+import uvicorn
+from fastapi import Body, FastAPI
+
+from fake_apis.calendar_api import CalendarStore, build_batch_router as calendar_batch_router, build_router as calendar_router
+from fake_apis.faults import FaultConfig, FaultInjector, install_fault_middleware
+from fake_apis.gmail_api import GmailStore, build_router as gmail_router, build_upload_router as gmail_upload_router
+from fake_apis.push import PushSender
+from fake_apis.zoom_api import ZoomStore, build_router as zoom_router
+
+
+def create_app(threads: int = 0, events: int = 0, meetings: int = 0, seed: int = 1,
+               faults: Optional[FaultConfig] = None, gmail_push_endpoint: Optional[str] = None) -> FastAPI:
+    """Builds the fake Gmail + Calendar + Zoom API with seeded data.
+
+    Calendar channels push to the address given to events.watch. Gmail changes are pushed
+    (Pub/Sub style) to gmail_push_endpoint or FAKE_GMAIL_PUSH_ENDPOINT once users.watch is called,
+    e.g. http://localhost:8000/api/push/gmail?token=<PUSH_VERIFICATION_TOKEN>.
+    """
+    app = FastAPI(title="Fake Google/Zoom APIs")
+    app.state.push = PushSender()
+    app.state.gmail = GmailStore(threads=threads, seed=seed, push=app.state.push,
+                                 push_endpoint=gmail_push_endpoint or os.getenv("FAKE_GMAIL_PUSH_ENDPOINT"))
+    app.state.calendar = CalendarStore(events=events, seed=seed, push=app.state.push)
+    app.state.zoom = ZoomStore(meetings=meetings, seed=seed)
+    app.state.faults = FaultInjector(faults or FaultConfig(seed=seed))
+
+    install_fault_middleware(app, app.state.faults)
+    app.include_router(gmail_router(app.state.gmail))
+    app.include_router(gmail_upload_router(app.state.gmail))
+    app.include_router(calendar_router(app.state.calendar))
+    app.include_router(calendar_batch_router(app.state.calendar, app.state.faults.pick_fault))
+    app.include_router(zoom_router(app.state.zoom))
+
+    @app.post("/token")
+    def google_token():
+        """Google OAuth token endpoint (refresh_token grant)."""
+        return {
+            "access_token": "ya29.fake-" + uuid.uuid4().hex,
+            "expires_in": 3599,
+            "scope": "https://www.googleapis.com/auth/gmail.modify https://www.googleapis.com/auth/calendar",
+            "token_type": "Bearer",
+        }
+
+    # --- Admin ---
+    @app.get("/_admin/faults")
+    def get_faults():
+        return app.state.faults.stats()
+
+    @app.post("/_admin/faults")
+    def set_faults(changes: Dict = Body(...)):
+        return asdict(app.state.faults.update(**changes))
+
+    @app.post("/_admin/gmail/expire_history")
+    def expire_gmail_history():
+        """Makes older startHistoryIds return 404, as after Gmail's history retention window."""
+        app.state.gmail.expire_history()
+        return {"historyId": str(app.state.gmail.history_id)}
+
+    @app.post("/_admin/gmail/deliver")
+    def deliver_gmail_message():
+        """Simulates incoming mail (and its push notification, if a watch is active)."""
+        message = app.state.gmail.receive()
+        return {"id": message["id"], "threadId": message["threadId"], "historyId": message["historyId"]}
+
+    @app.get("/_admin/push")
+    def push_stats():
+        return {
+            **app.state.push.stats,
+            "calendar_channels": len(app.state.calendar.channels),
+            "gmail_watch": app.state.gmail.watch_topic,
+        }
+
+    @app.get("/_admin/stats")
+    def stats():
+        return {
+            "threads": len(app.state.gmail.threads),
+            "messages": len(app.state.gmail.messages),
+            "events": len(app.state.calendar.events),
+            "meetings": len(app.state.zoom.meetings),
+            **app.state.faults.stats(),
+        }
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """Runs an app with uvicorn in a daemon thread (for benchmarks and scripts)."""
+
+    def __init__(self, app: FastAPI, port: Optional[int] = None, host: str = "127.0.0.1"):
+        self.app = app
+        self.port = port or free_port()
+        self.base_url = f"http://{host}:{self.port}"
+        config = uvicorn.Config(app, host=host, port=self.port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self, timeout: float = 10.0) -> "BackgroundServer":
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake API server did not start in time")
+            time.sleep(0.02)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
@@ -0,0 +1,304 @@
+import email
+import hashlib
+import json
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from fastapi import APIRouter, Body, HTTPException, Request, Response
+
+from fake_apis.push import PushSender
+
+# In-memory stand-in for the Calendar v3 endpoints used by mcp_servers/calendar_mcp.py.
+# Resources follow https://developers.google.com/workspace/calendar/api/v3/reference
+
+SUMMARIES = ["Strategy Session", "Team sync", "Client call", "Workshop prep", "1:1", "Focus time", "Lunch"]
+
+
+def parse_time(value: str) -> datetime:
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _etag() -> str:
+    return f"\"{uuid.uuid4().int % 10**16}\""
+
+
+def parse_fields(spec: str) -> Dict[str, Optional[Dict]]:
+    """Parses a partial-response mask like "etag,items(id,start)" into a nested selector."""
+    fields: Dict[str, Optional[Dict]] = {}
+    name, depth, inner = "", 0, ""
+    for char in spec + ",":
+        if depth:
+            depth += {"(": 1, ")": -1}.get(char, 0)
+            if depth:
+                inner += char
+            else:
+                fields[name.strip()] = parse_fields(inner)
+                name, inner = "", ""
+        elif char == "(":
+            depth = 1
+        elif char == ",":
+            if name.strip():
+                fields[name.strip()] = None
+            name = ""
+        else:
+            name += char
+    return fields
+
+
+def apply_fields(value, fields: Optional[Dict[str, Optional[Dict]]]):
+    """Keeps only the selected fields, like the real API's `fields` parameter."""
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [apply_fields(item, fields) for item in value]
+    return {k: apply_fields(v, fields[k]) for k, v in value.items() if k in fields}
+
+
+class CalendarStore:
+    """Events of the fake primary calendar (shared by every calendarId)."""
+
+    def __init__(self, events: int = 0, seed: int = 1, owner: str = "me@example.com",
+                 push: Optional[PushSender] = None):
+        self.owner = owner
+        self.events: Dict[str, Dict] = {}
+        # events.watch channels by id; each change notifies them through push
+        self.channels: Dict[str, Dict] = {}
+        self.push = push
+        self.lock = threading.RLock()
+        self._rng = random.Random(seed)
+        self.seed(events)
+
+    def seed(self, count: int):
+        """Spreads events over working hours starting today."""
+        day = datetime.now(timezone.utc).replace(hour=8, minute=0, second=0, microsecond=0)
+        for _ in range(count):
+            start = day + timedelta(days=self._rng.randint(0, 60), minutes=30 * self._rng.randint(0, 17))
+            self.insert({
+                "summary": self._rng.choice(SUMMARIES),
+                "start": {"dateTime": start.isoformat()},
+                "end": {"dateTime": (start + timedelta(minutes=self._rng.choice([30, 60, 90]))).isoformat()},
+            })
+
+    def insert(self, body: Dict) -> Dict:
+        event_id = uuid.uuid4().hex
+        now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        event = {
+            "kind": "calendar#event",
+            "etag": _etag(),
+            "id": event_id,
+            "status": "confirmed",
+            "htmlLink": f"https://www.google.com/calendar/event?eid={event_id}",
+            "created": now,
+            "updated": now,
+            "summary": body.get("summary", ""),
+            "description": body.get("description", ""),
+            "creator": {"email": self.owner, "self": True},
+            "organizer": {"email": self.owner, "self": True},
+            "start": body["start"],
+            "end": body["end"],
+            "iCalUID": f"{event_id}@google.com",
+            "sequence": 0,
+            "reminders": {"useDefault": True},
+            "eventType": "default",
+        }
+        with self.lock:
+            self.events[event_id] = event
+        self._changed()
+        return event
+
+    def delete(self, event_id: str) -> bool:
+        with self.lock:
+            if self.events.pop(event_id, None) is None:
+                return False
+        self._changed()
+        return True
+
+    # --- Push channels ---
+    def watch(self, body: Dict) -> Dict:
+        ttl = int((body.get("params") or {}).get("ttl") or 604800)
+        channel = {
+            "kind": "api#channel",
+            "id": body["id"],
+            "resourceId": uuid.uuid4().hex,
+            "resourceUri": "https://www.googleapis.com/calendar/v3/calendars/primary/events?alt=json",
+            "token": body.get("token"),
+            "expiration": str(int((datetime.now(timezone.utc).timestamp() + ttl) * 1000)),
+            "address": body["address"],
+        }
+        with self.lock:
+            self.channels[channel["id"]] = channel
+        if self.push:
+            self.push.calendar(channel, "sync")
+        return {k: v for k, v in channel.items() if k != "address"}
+
+    def stop_channel(self, channel_id: str, resource_id: str) -> bool:
+        with self.lock:
+            channel = self.channels.get(channel_id)
+            if not channel or channel["resourceId"] != resource_id:
+                return False
+            del self.channels[channel_id]
+        return True
+
+    def _changed(self):
+        if not self.push:
+            return
+        now_ms = datetime.now(timezone.utc).timestamp() * 1000
+        with self.lock:
+            channels = [c for c in self.channels.values() if int(c["expiration"]) > now_ms]
+        for channel in channels:
+            self.push.calendar(channel, "exists")
+
+    def in_range(self, time_min: Optional[str], time_max: Optional[str]) -> List[Dict]:
+        low = parse_time(time_min) if time_min else None
+        high = parse_time(time_max) if time_max else None
+        with self.lock:
+            events = list(self.events.values())
+        selected = []
+        for event in events:
+            start = parse_time(event["start"].get("dateTime") or event["start"]["date"])
+            end = parse_time(event["end"].get("dateTime") or event["end"]["date"])
+            if (low is None or end > low) and (high is None or start < high):
+                selected.append((start, event))
+        selected.sort(key=lambda item: item[0])
+        return [event for _, event in selected]
+
+
+def build_router(store: CalendarStore) -> APIRouter:
+    router = APIRouter(prefix="/calendar/v3")
+
+    @router.get("/calendars/{calendarId}/events")
+    def list_events(request: Request, calendarId: str, timeMin: Optional[str] = None,
+                    timeMax: Optional[str] = None, maxResults: int = 250, pageToken: Optional[str] = None,
+                    singleEvents: bool = False, orderBy: Optional[str] = None, fields: Optional[str] = None):
+        try:
+            events = store.in_range(timeMin, timeMax)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Bad Request")
+        start = int(pageToken or 0)
+        page = events[start:start + min(maxResults, 2500)]
+        more = start + len(page) < len(events)
+        etag = "\"" + hashlib.md5(("".join(e["etag"] for e in page) + str(more)).encode()).hexdigest() + "\""
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        result = {
+            "kind": "calendar#events",
+            "etag": etag,
+            "summary": store.owner,
+            "updated": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "timeZone": "UTC",
+            "accessRole": "owner",
+            "items": page,
+        }
+        if more:
+            result["nextPageToken"] = str(start + len(page))
+        return apply_fields(result, parse_fields(fields)) if fields else result
+
+    @router.post("/calendars/{calendarId}/events")
+    def insert_event(calendarId: str, body: Dict = Body(...)):
+        if "start" not in body or "end" not in body:
+            raise HTTPException(status_code=400, detail="Missing end time.")
+        return store.insert(body)
+
+    @router.delete("/calendars/{calendarId}/events/{eventId}")
+    def delete_event(calendarId: str, eventId: str):
+        if not store.delete(eventId):
+            raise HTTPException(status_code=404, detail="Not Found")
+        return Response(status_code=204)
+
+    @router.post("/calendars/{calendarId}/events/watch")
+    def watch_events(calendarId: str, body: Dict = Body(...)):
+        if body.get("type") != "web_hook" or not body.get("id") or not body.get("address"):
+            raise HTTPException(status_code=400, detail="id, type=web_hook and address are required.")
+        return store.watch(body)
+
+    @router.post("/channels/stop")
+    def stop_channel(body: Dict = Body(...)):
+        if not store.stop_channel(body.get("id", ""), body.get("resourceId", "")):
+            raise HTTPException(status_code=404, detail="Channel not found.")
+        return Response(status_code=204)
+
+    @router.post("/freeBusy")
+    def free_busy(body: Dict = Body(...)):
+        busy = [{"start": e["start"].get("dateTime"), "end": e["end"].get("dateTime")}
+                for e in store.in_range(body.get("timeMin"), body.get("timeMax"))
+                if e["start"].get("dateTime")]
+        return {
+            "kind": "calendar#freeBusy",
+            "timeMin": body.get("timeMin"),
+            "timeMax": body.get("timeMax"),
+            "calendars": {item["id"]: {"busy": busy} for item in body.get("items", [])},
+        }
+
+    return router
+
+
+# --- Batch ---
+STATUS_TEXT = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 410: "Gone",
+               429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def _batch_item(store: CalendarStore, method: str, path: str, body: Optional[Dict]) -> Tuple[int, Optional[Dict]]:
+    """Runs one batched events.insert / events.delete."""
+    parts = path.strip("/").split("/")  # calendar/v3/calendars/{id}/events[/{eventId}]
+    if len(parts) < 5 or parts[:3] != ["calendar", "v3", "calendars"] or parts[4] != "events":
+        return 404, {"error": {"code": 404, "message": "Not Found"}}
+    if method == "POST" and len(parts) == 5:
+        if not body or "start" not in body or "end" not in body:
+            return 400, {"error": {"code": 400, "message": "Missing end time."}}
+        return 200, store.insert(body)
+    if method == "DELETE" and len(parts) == 6:
+        if not store.delete(parts[5]):
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        return 204, None
+    return 400, {"error": {"code": 400, "message": f"{method} is not supported in batches here."}}
+
+
+def build_batch_router(store: CalendarStore, pick_fault: Optional[Callable[[str], Optional[int]]] = None) -> APIRouter:
+    """Google batch endpoint (multipart/mixed of application/http parts) for Calendar.
+
+    Like the real endpoint, each item succeeds or fails on its own; pick_fault lets the
+    fault injector fail individual items.
+    """
+    router = APIRouter()
+
+    @router.post("/batch/calendar/v3")
+    async def batch(request: Request):
+        content_type = request.headers.get("content-type", "")
+        envelope = email.message_from_bytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + await request.body())
+        if not envelope.is_multipart():
+            raise HTTPException(status_code=400, detail="Expected a multipart/mixed batch request.")
+        items = envelope.get_payload()
+        if len(items) > 1000:
+            raise HTTPException(status_code=400, detail="Too many requests in batch.")
+
+        boundary = "batch_" + uuid.uuid4().hex
+        out = []
+        for item in items:
+            raw = item.get_payload(decode=True) or item.get_payload().encode()
+            head, _, body = raw.replace(b"\r\n", b"\n").partition(b"\n\n")
+            method, target = head.split(b"\n")[0].decode().split(" ")[:2]
+            path = urlsplit(target).path
+            status = pick_fault(path) if pick_fault else None
+            if status is not None:
+                payload = {"error": {"code": status, "message": STATUS_TEXT.get(status, "Error"),
+                                     "errors": [{"reason": "rateLimitExceeded" if status == 429 else "backendError"}]}}
+            else:
+                status, payload = _batch_item(store, method, path, json.loads(body) if body.strip() else None)
+            content_id = (item.get("Content-ID") or "").strip("<>")
+            response = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            if payload is not None:
+                response += f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(payload)}"
+            else:
+                response += "Content-Length: 0\r\n\r\n"
+            out.append(f"--{boundary}\r\nContent-Type: application/http\r\n"
+                       f"Content-ID: <response-{content_id}>\r\n\r\n{response}\r\n")
+        return Response(content="".join(out) + f"--{boundary}--\r\n",
+                        media_type=f"multipart/mixed; boundary={boundary}")
+
+    return router
@@ -0,0 +1,101 @@
+import asyncio
+import random
+import threading
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class FaultConfig:
+    """Latency and error injection applied to every non-admin request."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_429_rate: float = 0.0
+    error_5xx_rate: float = 0.0
+    error_5xx_status: int = 503
+    retry_after_s: int = 1
+    # Only requests whose path starts with this prefix are affected (e.g. "/gmail").
+    path_prefix: str = ""
+    # Deterministically fail the next N matching requests with fail_next_status.
+    fail_next: int = 0
+    fail_next_status: int = 503
+    seed: Optional[int] = None
+
+
+@dataclass
+class FaultInjector:
+    config: FaultConfig = field(default_factory=FaultConfig)
+    requests: Counter = field(default_factory=Counter)
+    faults: Counter = field(default_factory=Counter)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+
+    def update(self, **changes) -> FaultConfig:
+        with self._lock:
+            self.config = FaultConfig(**{**asdict(self.config), **changes})
+            if "seed" in changes:
+                self._rng = random.Random(self.config.seed)
+            return self.config
+
+    def pick_fault(self, path: str) -> Optional[int]:
+        """Returns the HTTP status to fail with, or None to serve normally."""
+        config = self.config
+        if not path.startswith(config.path_prefix):
+            return None
+        with self._lock:
+            if config.fail_next > 0:
+                config.fail_next -= 1
+                return config.fail_next_status
+            roll = self._rng.random()
+        if roll < config.error_429_rate:
+            return 429
+        if roll < config.error_429_rate + config.error_5xx_rate:
+            return config.error_5xx_status
+        return None
+
+    def delay(self) -> float:
+        config = self.config
+        return max(0.0, self._rng.gauss(config.latency_ms, config.jitter_ms)) / 1000.0
+
+    def stats(self) -> Dict:
+        return {"config": asdict(self.config), "requests": dict(self.requests), "faults": dict(self.faults)}
+
+
+def error_body(path: str, status: int) -> Dict:
+    """Error payload in the format of the API that owns the path."""
+    if path.startswith("/v2") or path.startswith("/oauth"):
+        message = "You have reached the maximum per-second rate limit for this API." if status == 429 else "Internal Error"
+        return {"code": status, "message": message}
+    google_status = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 502: "UNAVAILABLE", 503: "UNAVAILABLE"}
+    message = "Rate Limit Exceeded" if status == 429 else "The service is currently unavailable."
+    return {"error": {"code": status, "message": message, "status": google_status.get(status, "UNKNOWN"),
+                      "errors": [{"message": message, "domain": "global",
+                                  "reason": "rateLimitExceeded" if status == 429 else "backendError"}]}}
+
+
+def install_fault_middleware(app, injector: FaultInjector):
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        path = request.url.path
+        if path.startswith("/_admin"):
+            return await call_next(request)
+
+        route = f"{request.method} {path.split('/')[1] if '/' in path else path}"
+        injector.requests[route] += 1
+
+        delay = injector.delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+        status = injector.pick_fault(path)
+        if status is not None:
+            injector.faults[f"{route} {status}"] += 1
+            headers = {"Retry-After": str(injector.config.retry_after_s)} if status == 429 else {}
+            return JSONResponse(error_body(path, status), status_code=status, headers=headers)
+        return await call_next(request)
@@ -0,0 +1,471 @@
+import base64
+import copy
+import email
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from email.utils import format_datetime, parseaddr
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Body, HTTPException, Query, Request, Response
+
+from fake_apis.push import PushSender
+
+# In-memory stand-in for the Gmail v1 endpoints used by mcp_servers/gmail_mcp.py.
+# Resources follow the shapes documented at
+# https://developers.google.com/gmail/api/reference/rest
+
+FIRST_NAMES = ["Ana", "Luis", "Maria", "John", "Priya", "Chen", "Fatima", "Omar", "Sofia", "Lucas"]
+LAST_NAMES = ["Perez", "Garcia", "Smith", "Patel", "Wang", "Haddad", "Rossi", "Silva", "Kim", "Novak"]
+DOMAINS = ["example.com", "acme.io", "contoso.org", "globex.net"]
+TOPICS = ["Strategy session follow-up", "Invoice #{n}", "Quarterly planning", "Workshop agenda",
+          "Proposal review", "Re: Meeting notes", "Partnership opportunity", "Onboarding checklist"]
+SENTENCES = [
+    "Thanks for the call earlier today.",
+    "Please find the updated proposal attached.",
+    "Could we move our meeting to next week?",
+    "Let me know which slot works best for you.",
+    "I have shared the deck with the rest of the team.",
+    "Looking forward to the strategy session.",
+]
+
+# historyTypes query values -> record fields
+HISTORY_KINDS = {"messageAdded": "messagesAdded", "messageDeleted": "messagesDeleted",
+                 "labelAdded": "labelsAdded", "labelRemoved": "labelsRemoved"}
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def _query_date_ms(value: str) -> int:
+    """after:/before: operand (YYYY/MM/DD, YYYY-MM-DD or epoch seconds) as epoch ms."""
+    if value.isdigit():
+        return int(value) * 1000
+    parsed = datetime.strptime(value.replace("-", "/"), "%Y/%m/%d").replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _headers(msg: Dict) -> Dict[str, str]:
+    return {h["name"].lower(): h["value"] for h in msg["payload"]["headers"]}
+
+
+class GmailStore:
+    """Threads and messages for one fake mailbox (shared by every userId)."""
+
+    def __init__(self, threads: int = 0, seed: int = 1, email_address: str = "me@example.com",
+                 push: Optional[PushSender] = None, push_endpoint: Optional[str] = None):
+        self.email_address = email_address
+        # users.watch state; changes are pushed to push_endpoint, standing in for the
+        # Pub/Sub push subscription on the watched topic
+        self.watch_topic: Optional[str] = None
+        self.watch_expiration = 0
+        self.push = push
+        self.push_endpoint = push_endpoint
+        self.threads: "OrderedDict[str, Dict]" = OrderedDict()
+        self.messages: Dict[str, Dict] = {}
+        self.drafts: Dict[str, Dict] = {}
+        self.history_id = 1000
+        # Change log served by users.history.list; records before history_floor have "expired"
+        self.history: List[Dict] = []
+        self.history_floor = self.history_id
+        self.lock = threading.RLock()
+        self._rng = random.Random(seed)
+        self.seed(threads)
+        # Seeded mail predates the retained history, as for a mailbox with old mail
+        self.expire_history()
+
+    # --- Seeding ---
+    def seed(self, count: int):
+        now = int(time.time())
+        for i in range(count):
+            sent_at = now - (count - i) * 600
+            thread_id = uuid.uuid4().hex[:16]
+            for j in range(self._rng.randint(1, 4)):
+                self._add_message(thread_id, self._random_message(i, sent_at + j * 60))
+
+    def _random_person(self) -> str:
+        first, last = self._rng.choice(FIRST_NAMES), self._rng.choice(LAST_NAMES)
+        return f"{first} {last} <{first.lower()}.{last.lower()}@{self._rng.choice(DOMAINS)}>"
+
+    def _random_message(self, n: int, sent_at: int) -> Dict:
+        body = " ".join(self._rng.sample(SENTENCES, 3))
+        labels = ["INBOX"] + (["UNREAD"] if self._rng.random() < 0.3 else [])
+        if self._rng.random() < 0.2:
+            labels.append("IMPORTANT")
+        return self._build_message(
+            sender=self._random_person(),
+            to=self.email_address,
+            subject=self._rng.choice(TOPICS).format(n=n),
+            body=body,
+            labels=labels,
+            sent_at=sent_at,
+            html=self._rng.random() < 0.3,
+            attachment=self._rng.random() < 0.1,
+        )
+
+    def _build_message(self, sender: str, to: str, subject: str, body: str, labels: List[str],
+                       sent_at: int, html: bool = False, attachment: bool = False,
+                       files: Optional[List[Dict]] = None) -> Dict:
+        message_id = uuid.uuid4().hex[:16]
+        headers = [
+            {"name": "From", "value": sender},
+            {"name": "To", "value": to},
+            {"name": "Subject", "value": subject},
+            {"name": "Date", "value": format_datetime(datetime.fromtimestamp(sent_at, timezone.utc))},
+            {"name": "Message-ID", "value": f"<{message_id}@mail.example.com>"},
+        ]
+        text_part = {"partId": "0", "mimeType": "text/plain", "filename": "",
+                     "headers": [{"name": "Content-Type", "value": "text/plain; charset=\"UTF-8\""}],
+                     "body": {"size": len(body), "data": _b64(body.encode())}}
+        if attachment and not files:
+            files = [{"filename": "proposal.pdf", "mimeType": "application/pdf",
+                      "size": self._rng.randint(20_000, 2_000_000)}]
+        if not html and not files:
+            payload = {**text_part, "partId": "", "headers": headers}
+        else:
+            parts = [text_part]
+            if html:
+                markup = f"<html><body><p>{body}</p></body></html>"
+                parts.append({"partId": "1", "mimeType": "text/html", "filename": "",
+                              "headers": [{"name": "Content-Type", "value": "text/html; charset=\"UTF-8\""}],
+                              "body": {"size": len(markup), "data": _b64(markup.encode())}})
+            for file in files or []:
+                parts.append({"partId": str(len(parts)), "mimeType": file["mimeType"], "filename": file["filename"],
+                              "headers": [{"name": "Content-Disposition",
+                                           "value": f"attachment; filename=\"{file['filename']}\""}],
+                              "body": {"size": file["size"], "attachmentId": "ANGjdJ" + uuid.uuid4().hex}})
+            payload = {"partId": "", "mimeType": "multipart/mixed" if files else "multipart/alternative",
+                       "filename": "", "headers": headers, "body": {"size": 0}, "parts": parts}
+        return {
+            "id": message_id,
+            "labelIds": labels,
+            "snippet": body[:100],
+            "internalDate": str(sent_at * 1000),
+            "payload": payload,
+            "sizeEstimate": len(body) + 600,
+        }
+
+    def _record(self, kind: str, message: Dict, label_ids: Optional[List[str]] = None):
+        """Appends a history record (caller holds the lock and has bumped history_id)."""
+        ref = {"id": message["id"], "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+        change = {"message": ref} if label_ids is None else {"message": ref, "labelIds": label_ids}
+        self.history.append({"id": str(self.history_id), "messages": [ref], kind: [change]})
+        if self.push and self.push_endpoint and self.watch_topic and self.watch_expiration > time.time() * 1000:
+            subscription = self.watch_topic.replace("/topics/", "/subscriptions/") + "-push"
+            self.push.gmail(self.push_endpoint, self.email_address, self.history_id, subscription)
+
+    def expire_history(self):
+        """Drops the change log, so older startHistoryIds get 404 (forces clients to full-sync)."""
+        with self.lock:
+            self.history.clear()
+            self.history_floor = self.history_id
+
+    def _add_message(self, thread_id: str, message: Dict) -> Dict:
+        with self.lock:
+            self.history_id += 1
+            message["threadId"] = thread_id
+            message["historyId"] = str(self.history_id)
+            self._record("messagesAdded", message)
+            thread = self.threads.pop(thread_id, None) or {"id": thread_id, "messages": []}
+            thread["messages"].append(message)
+            thread["historyId"] = message["historyId"]
+            # Most recently active thread first, like the real threads.list ordering.
+            self.threads[thread_id] = thread
+            self.threads.move_to_end(thread_id, last=False)
+            self.messages[message["id"]] = message
+            return message
+
+    def send_raw(self, raw: bytes, thread_id: Optional[str] = None) -> Dict:
+        """Adds an RFC 822 message (as sent via raw or a media upload) to the mailbox."""
+        parsed = email.message_from_bytes(raw)
+        text, files = b"", []
+        for part in parsed.walk():
+            if part.is_multipart():
+                continue
+            if part.get_filename():
+                files.append({"filename": part.get_filename(), "mimeType": part.get_content_type(),
+                              "size": len(part.get_payload(decode=True) or b"")})
+            elif part.get_content_type() == "text/plain" and not text:
+                text = part.get_payload(decode=True) or b""
+        message = self._build_message(
+            sender=self.email_address,
+            to=parseaddr(parsed.get("To", ""))[1],
+            subject=str(parsed.get("Subject", "")),
+            body=text.decode("utf-8", "replace"),
+            labels=["SENT"],
+            sent_at=int(time.time()),
+            files=files,
+        )
+        thread_id = thread_id if thread_id in self.threads else uuid.uuid4().hex[:16]
+        return self._add_message(thread_id, message)
+
+    def receive(self) -> Dict:
+        """Delivers a new random message to the inbox, as if someone had just written."""
+        message = self._random_message(len(self.threads), int(time.time()))
+        return self._add_message(uuid.uuid4().hex[:16], message)
+
+    def create_draft(self, thread_id: Optional[str] = None) -> Dict:
+        draft_id = "r" + uuid.uuid4().hex[:15]
+        message_id = uuid.uuid4().hex[:16]
+        draft = {"id": draft_id, "message": {"id": message_id, "threadId": thread_id or message_id,
+                                             "labelIds": ["DRAFT"]}}
+        self.drafts[draft_id] = draft
+        return draft
+
+    # --- Queries ---
+    def matches(self, thread: Dict, query: str) -> bool:
+        if not query:
+            return True
+        messages = thread["messages"]
+        for token in query.split():
+            key, _, value = token.partition(":")
+            value = value.strip('"').lower()
+            if token == "is:unread":
+                ok = any("UNREAD" in m["labelIds"] for m in messages)
+            elif token == "is:read":
+                ok = all("UNREAD" not in m["labelIds"] for m in messages)
+            elif key == "from" and value:
+                ok = any(value in _headers(m).get("from", "").lower() for m in messages)
+            elif key == "to" and value:
+                ok = any(value in _headers(m).get("to", "").lower() for m in messages)
+            elif key == "subject" and value:
+                ok = any(value in _headers(m).get("subject", "").lower() for m in messages)
+            elif key in ("after", "before") and value:
+                bound = _query_date_ms(value)
+                dates = [int(m["internalDate"]) for m in messages]
+                ok = any(d >= bound for d in dates) if key == "after" else any(d < bound for d in dates)
+            elif key in ("label", "in") and value:
+                ok = any(value.upper() in m["labelIds"] for m in messages)
+            else:
+                needle = token.strip('"').lower()
+                ok = any(needle in (m["snippet"] + _headers(m).get("subject", "")).lower() for m in messages)
+            if not ok:
+                return False
+        return True
+
+
+def render_message(message: Dict, fmt: str = "full", metadata_headers: Optional[List[str]] = None) -> Dict:
+    """Applies the Gmail `format` parameter to a stored message."""
+    if fmt == "minimal":
+        return {k: v for k, v in message.items() if k != "payload"}
+    rendered = copy.deepcopy(message)
+    if fmt == "metadata":
+        payload = rendered["payload"]
+        headers = payload["headers"]
+        if metadata_headers:
+            wanted = {h.lower() for h in metadata_headers}
+            headers = [h for h in headers if h["name"].lower() in wanted]
+        rendered["payload"] = {"partId": "", "mimeType": payload["mimeType"], "filename": "", "headers": headers}
+    return rendered
+
+
+def _complete_upload(store: GmailStore, kind: str, metadata: Dict, raw: bytes) -> Dict:
+    if kind == "drafts":
+        return store.create_draft(metadata.get("message", {}).get("threadId"))
+    message = store.send_raw(raw, metadata.get("threadId"))
+    return {"id": message["id"], "threadId": message["threadId"], "labelIds": message["labelIds"]}
+
+
+def build_upload_router(store: GmailStore) -> APIRouter:
+    """Media upload endpoints (uploadType=multipart and resumable) for messages.send and drafts.create."""
+    router = APIRouter(prefix="/upload/gmail/v1/users/{userId}")
+    sessions: Dict[str, Dict] = {}
+
+    async def upload(kind: str, userId: str, request: Request, uploadType: str, upload_id: Optional[str]):
+        content = await request.body()
+        if uploadType == "multipart":
+            envelope = email.message_from_bytes(
+                b"Content-Type: " + request.headers["content-type"].encode() + b"\r\n\r\n" + content)
+            metadata_part, media_part = envelope.get_payload()
+            metadata = json.loads(metadata_part.get_payload(decode=True) or b"{}")
+            return _complete_upload(store, kind, metadata, media_part.as_bytes())
+        if uploadType != "resumable":
+            raise HTTPException(status_code=400, detail=f"Unsupported uploadType {uploadType}")
+        if upload_id is None:
+            # Session start: metadata now, content in later PUTs to the returned Location
+            upload_id = uuid.uuid4().hex
+            sessions[upload_id] = {"metadata": json.loads(content or b"{}"), "data": bytearray()}
+            location = f"{str(request.base_url).rstrip('/')}{request.url.path}?uploadType=resumable&upload_id={upload_id}"
+            return Response(status_code=200, headers={"Location": location})
+        session = sessions.get(upload_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload session not found.")
+        content_range = request.headers.get("content-range", "")
+        total = content_range.rpartition("/")[2]
+        if not content_range.startswith("bytes */"):  # "bytes */N" only asks for the upload status
+            first = int(content_range.split(" ")[1].split("-")[0])
+            if first != len(session["data"]):
+                raise HTTPException(status_code=400, detail="Chunk does not continue the upload.")
+            session["data"] += content
+        if total != "*" and len(session["data"]) >= int(total):
+            del sessions[upload_id]
+            return _complete_upload(store, kind, session["metadata"], bytes(session["data"]))
+        headers = {"Range": f"bytes=0-{len(session['data']) - 1}"} if session["data"] else {}
+        return Response(status_code=308, headers=headers)
+
+    @router.api_route("/messages/send", methods=["POST", "PUT"])
+    async def upload_message(userId: str, request: Request, uploadType: str = "multipart",
+                             upload_id: Optional[str] = None):
+        return await upload("messages", userId, request, uploadType, upload_id)
+
+    @router.api_route("/drafts", methods=["POST", "PUT"])
+    async def upload_draft(userId: str, request: Request, uploadType: str = "multipart",
+                           upload_id: Optional[str] = None):
+        return await upload("drafts", userId, request, uploadType, upload_id)
+
+    return router
+
+
+def build_router(store: GmailStore) -> APIRouter:
+    router = APIRouter(prefix="/gmail/v1/users/{userId}")
+
+    @router.get("/profile")
+    def get_profile(userId: str):
+        with store.lock:
+            return {
+                "emailAddress": store.email_address,
+                "messagesTotal": len(store.messages),
+                "threadsTotal": len(store.threads),
+                "historyId": str(store.history_id),
+            }
+
+    @router.post("/watch")
+    def watch(userId: str, body: Dict = Body(...)):
+        topic = body.get("topicName") or ""
+        if not topic.startswith("projects/") or "/topics/" not in topic:
+            raise HTTPException(status_code=400, detail="Invalid topicName.")
+        with store.lock:
+            store.watch_topic = topic
+            store.watch_expiration = int((time.time() + 7 * 86400) * 1000)
+            return {"historyId": str(store.history_id), "expiration": str(store.watch_expiration)}
+
+    @router.post("/stop", status_code=204)
+    def stop(userId: str):
+        with store.lock:
+            store.watch_topic = None
+        return Response(status_code=204)
+
+    @router.get("/history")
+    def list_history(userId: str, startHistoryId: int, maxResults: int = 100, pageToken: Optional[str] = None,
+                     historyTypes: Optional[List[str]] = Query(None)):
+        with store.lock:
+            if startHistoryId < store.history_floor:
+                raise HTTPException(status_code=404, detail="Requested entity was not found.")
+            records = [r for r in store.history if int(r["id"]) > startHistoryId]
+            if historyTypes:
+                kinds = {HISTORY_KINDS[t] for t in historyTypes if t in HISTORY_KINDS}
+                records = [r for r in records if kinds & set(r)]
+            current = str(store.history_id)
+        start = int(pageToken or 0)
+        page = records[start:start + min(maxResults, 500)]
+        result = {"historyId": current}
+        if page:
+            result["history"] = page
+        if start + len(page) < len(records):
+            result["nextPageToken"] = str(start + len(page))
+        return result
+
+    @router.get("/threads")
+    def list_threads(userId: str, q: str = "", maxResults: int = 100, pageToken: Optional[str] = None,
+                     labelIds: Optional[List[str]] = Query(None)):
+        with store.lock:
+            threads = [t for t in store.threads.values()
+                       if store.matches(t, q)
+                       and (not labelIds or any(l in m["labelIds"] for m in t["messages"] for l in labelIds))]
+        start = int(pageToken or 0)
+        page = threads[start:start + min(maxResults, 500)]
+        result = {
+            "threads": [{"id": t["id"], "snippet": t["messages"][-1]["snippet"], "historyId": t["historyId"]}
+                        for t in page],
+            "resultSizeEstimate": len(threads),
+        }
+        if start + len(page) < len(threads):
+            result["nextPageToken"] = str(start + len(page))
+        return result
+
+    @router.get("/threads/{threadId}")
+    def get_thread(userId: str, threadId: str, format: str = "full",
+                   metadataHeaders: Optional[List[str]] = Query(None)):
+        thread = store.threads.get(threadId)
+        if not thread:
+            raise HTTPException(status_code=404, detail="Requested entity was not found.")
+        return {
+            "id": thread["id"],
+            "historyId": thread["historyId"],
+            "messages": [render_message(m, format, metadataHeaders) for m in thread["messages"]],
+        }
+
+    @router.get("/messages/{messageId}")
+    def get_message(userId: str, messageId: str, format: str = "full",
+                    metadataHeaders: Optional[List[str]] = Query(None)):
+        message = store.messages.get(messageId)
+        if not message:
+            raise HTTPException(status_code=404, detail="Requested entity was not found.")
+        return render_message(message, format, metadataHeaders)
+
+    @router.get("/messages/{messageId}/attachments/{attachmentId}")
+    def get_attachment(userId: str, messageId: str, attachmentId: str):
+        message = store.messages.get(messageId)
+        parts = message["payload"].get("parts", []) if message else []
+        part = next((p for p in parts if p["body"].get("attachmentId") == attachmentId), None)
+        if not part:
+            raise HTTPException(status_code=404, detail="Requested entity was not found.")
+        size = part["body"]["size"]
+        # Deterministic filler content of the advertised size
+        block = hashlib.sha256(attachmentId.encode()).digest()
+        data = (block * (size // len(block) + 1))[:size]
+        return {"attachmentId": attachmentId, "size": size, "data": _b64(data)}
+
+    @router.post("/messages/send")
+    def send_message(userId: str, body: Dict = Body(...)):
+        raw = base64.urlsafe_b64decode(body["raw"] + "=" * (-len(body["raw"]) % 4))
+        message = store.send_raw(raw, body.get("threadId"))
+        return {"id": message["id"], "threadId": message["threadId"], "labelIds": message["labelIds"]}
+
+    def apply_labels(message: Dict, body: Dict) -> List[str]:
+        """Applies addLabelIds/removeLabelIds to a message (caller holds the lock)."""
+        before = list(message["labelIds"])
+        labels = [l for l in before if l not in body.get("removeLabelIds", [])]
+        labels += [l for l in body.get("addLabelIds", []) if l not in labels]
+        added = [l for l in labels if l not in before]
+        removed = [l for l in before if l not in labels]
+        message["labelIds"] = labels
+        for kind, changed in (("labelsAdded", added), ("labelsRemoved", removed)):
+            if changed:
+                store.history_id += 1
+                message["historyId"] = str(store.history_id)
+                store._record(kind, message, changed)
+        return labels
+
+    @router.post("/messages/batchModify", status_code=204)
+    def batch_modify(userId: str, body: Dict = Body(...)):
+        ids = body.get("ids") or []
+        if len(ids) > 1000:
+            raise HTTPException(status_code=400, detail="Too many ids: at most 1000 per request.")
+        with store.lock:
+            for message_id in ids:
+                # Like Gmail, unknown IDs are skipped rather than failing the whole batch.
+                if message_id in store.messages:
+                    apply_labels(store.messages[message_id], body)
+        return Response(status_code=204)
+
+    @router.post("/messages/{messageId}/modify")
+    def modify_message(userId: str, messageId: str, body: Dict = Body(...)):
+        with store.lock:
+            message = store.messages.get(messageId)
+            if not message:
+                raise HTTPException(status_code=404, detail="Requested entity was not found.")
+            labels = apply_labels(message, body)
+        return {"id": message["id"], "threadId": message["threadId"], "labelIds": labels}
+
+    @router.post("/drafts")
+    def create_draft(userId: str, body: Dict = Body(...)):
+        return store.create_draft(body.get("message", {}).get("threadId"))
+
+    return router
@@ -0,0 +1,107 @@
+import base64
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+import requests
+
+# Stand-in push senders: Calendar events.watch webhooks and Gmail Pub/Sub push.
+#
+# The fake stores call these on every change; deliveries run on a background thread
+# so API requests never wait on the receiver. Bursts are coalesced per channel (a
+# batch of 200 inserts sends one or two notifications, not 200), as with real push.
+
+logger = logging.getLogger(__name__)
+
+
+class PushSender:
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._pending: "OrderedDict[str, Callable[[], None]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._message_numbers: Dict[str, int] = {}
+        self._busy = False
+        self.stats = {"sent": 0, "failed": 0, "coalesced": 0}
+
+    def _enqueue(self, key: str, deliver: Callable[[], None]):
+        with self._lock:
+            if key in self._pending:
+                self.stats["coalesced"] += 1
+            self._pending[key] = deliver
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="fake-push", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        break
+                    _, deliver = self._pending.popitem(last=False)
+                    self._busy = True
+                try:
+                    deliver()
+                    self.stats["sent"] += 1
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    logger.warning(f"Push delivery failed: {e}")
+                finally:
+                    self._busy = False
+
+    def _post(self, url: str, **kwargs):
+        response = requests.post(url, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+
+    def calendar(self, channel: Dict, state: str = "exists"):
+        """Calendar notification for a channel created by events.watch."""
+        def deliver():
+            number = self._message_numbers.get(channel["id"], 0) + 1
+            self._message_numbers[channel["id"]] = number
+            self._post(channel["address"], headers={
+                "X-Goog-Channel-ID": channel["id"],
+                "X-Goog-Channel-Token": channel.get("token") or "",
+                "X-Goog-Channel-Expiration": datetime.fromtimestamp(
+                    int(channel["expiration"]) / 1000, timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT"),
+                "X-Goog-Resource-ID": channel["resourceId"],
+                "X-Goog-Resource-URI": channel["resourceUri"],
+                "X-Goog-Resource-State": state,
+                "X-Goog-Message-Number": str(number),
+            })
+
+        self._enqueue(f"calendar:{channel['id']}:{state}", deliver)
+
+    def gmail(self, endpoint: str, email_address: str, history_id: int, subscription: str):
+        """Pub/Sub push message for a Gmail users.watch topic (the latest historyId wins)."""
+        def deliver():
+            data = json.dumps({"emailAddress": email_address, "historyId": history_id})
+            self._post(endpoint, json={
+                "message": {
+                    "data": base64.b64encode(data.encode()).decode(),
+                    "messageId": str(uuid.uuid4().int % 10**16),
+                    "publishTime": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                },
+                "subscription": subscription,
+            })
+
+        self._enqueue(f"gmail:{endpoint}:{email_address}", deliver)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Waits until queued notifications are delivered (for scripts and benchmarks)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._pending and not self._busy:
+                    return True
+            time.sleep(0.01)
+        return False
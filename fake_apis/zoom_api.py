@@ -0,0 +1,91 @@
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Body, HTTPException, Request
+
+# In-memory stand-in for the Zoom endpoints used by mcp_servers/zoom_mcp.py:
+# Server-to-Server OAuth and /v2/users/{userId}/meetings.
+
+
+class ZoomStore:
+    def __init__(self, meetings: int = 0, seed: int = 1, host_email: str = "me@example.com"):
+        self.host_id = uuid.uuid4().hex[:22]
+        self.host_email = host_email
+        self.meetings: List[Dict] = []
+        self.tokens: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self._rng = random.Random(seed)
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        for i in range(meetings):
+            self.create({
+                "topic": f"Strategy Session #{i}",
+                "start_time": (start + timedelta(hours=self._rng.randint(1, 24 * 30))).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "duration": self._rng.choice([30, 45, 60]),
+            })
+
+    def create(self, body: Dict) -> Dict:
+        meeting_id = self._rng.randint(10**9, 10**11)
+        meeting = {
+            "uuid": uuid.uuid4().hex[:22] + "==",
+            "id": meeting_id,
+            "host_id": self.host_id,
+            "host_email": self.host_email,
+            "topic": body.get("topic", "Zoom Meeting"),
+            "type": body.get("type", 2),
+            "status": "waiting",
+            "start_time": body.get("start_time"),
+            "duration": body.get("duration", 30),
+            "timezone": body.get("timezone", "UTC"),
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "start_url": f"https://zoom.us/s/{meeting_id}?zak=fake",
+            "join_url": f"https://zoom.us/j/{meeting_id}?pwd=fake",
+            "password": uuid.uuid4().hex[:6],
+            "settings": body.get("settings", {}),
+        }
+        with self.lock:
+            self.meetings.append(meeting)
+        return meeting
+
+
+def build_router(store: ZoomStore) -> APIRouter:
+    router = APIRouter()
+
+    @router.post("/oauth/token")
+    async def oauth_token(request: Request, grant_type: Optional[str] = None):
+        form = (await request.body()).decode()
+        if "account_credentials" not in form and grant_type != "account_credentials":
+            raise HTTPException(status_code=400, detail="Unsupported grant type")
+        token = "fake-zoom-" + uuid.uuid4().hex
+        store.tokens[token] = datetime.now().timestamp() + 3600
+        return {"access_token": token, "token_type": "bearer", "expires_in": 3599,
+                "scope": "meeting:read:admin meeting:write:admin"}
+
+    def _check_auth(request: Request):
+        auth = request.headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or auth[7:] not in store.tokens:
+            raise HTTPException(status_code=401, detail="Invalid access token.")
+
+    @router.get("/v2/users/{userId}/meetings")
+    def list_meetings(request: Request, userId: str, page_size: int = 30, type: str = "scheduled",
+                      next_page_token: Optional[str] = None):
+        _check_auth(request)
+        start = int(next_page_token or 0)
+        page = store.meetings[start:start + min(page_size, 300)]
+        more = start + len(page) < len(store.meetings)
+        return {
+            "page_size": page_size,
+            "total_records": len(store.meetings),
+            "next_page_token": str(start + len(page)) if more else "",
+            "meetings": [{k: m[k] for k in ("uuid", "id", "host_id", "topic", "type", "start_time",
+                                            "duration", "timezone", "created_at", "join_url")} for m in page],
+        }
+
+    @router.post("/v2/users/{userId}/meetings", status_code=201)
+    def create_meeting(request: Request, userId: str, body: Dict = Body(...)):
+        _check_auth(request)
+        return store.create(body)
+
+    return router
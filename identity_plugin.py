@@ -0,0 +1,31 @@
+from typing import Any, Dict, Optional
+
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.mcp_tool.mcp_tool import MCPTool
+from google.adk.tools.tool_context import ToolContext
+
+from mcp_servers.credential_store import DEFAULT_TENANT, DEFAULT_USER, TENANT_ARG, USER_ARG
+
+# Threads the requesting user's identity from the chat session into the MCP servers.
+#
+# chat_endpoint stores tenant_id/user_id in the session state; AgentTool copies the
+# state into nested agents' sessions, so every MCP tool call (at any depth) gets the
+# identity added as hidden _tenant_id/_user_id arguments. The model never sees these
+# (they are not in the tool schemas) and cannot override them: they are always
+# rewritten from state here.
+
+STATE_TENANT = "tenant_id"
+STATE_USER = "user_id"
+
+
+class IdentityPlugin(BasePlugin):
+    def __init__(self):
+        super().__init__(name="identity")
+
+    async def before_tool_callback(self, *, tool: BaseTool, tool_args: Dict[str, Any],
+                                   tool_context: ToolContext) -> Optional[Dict]:
+        if isinstance(tool, MCPTool):
+            tool_args[TENANT_ARG] = tool_context.state.get(STATE_TENANT) or DEFAULT_TENANT
+            tool_args[USER_ARG] = tool_context.state.get(STATE_USER) or DEFAULT_USER
+        return None
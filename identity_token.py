@@ -0,0 +1,85 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Optional, Tuple
+
+# Signed identity tokens for the chat and OAuth endpoints.
+#
+# The server doesn't sign users in itself; the frontend does. The frontend gives each
+# signed-in user a token from mint(), signed with the shared IDENTITY_TOKEN_SECRET. It sends
+# the token as "Authorization: Bearer <token>", or as ?token= on /ws/chat. The tenant and
+# user a request acts for come only from a valid token, never from the request body.
+# A request without a token acts as the default identity, which uses the .env account.
+# With REQUIRE_IDENTITY_TOKEN=1, such requests are refused instead.
+#
+# Token: base64url(JSON {"tenant_id", "user_id", "exp"}) + "." + base64url(HMAC-SHA256 of the first part)
+#
+# Env:
+#   IDENTITY_TOKEN_SECRET   - HMAC key shared with the frontend; unset = only the default identity
+#   REQUIRE_IDENTITY_TOKEN  - 1 to refuse requests without a token (default 0)
+
+Identity = Tuple[str, str]
+
+
+class InvalidIdentityToken(Exception):
+    pass
+
+
+def token_secret() -> Optional[bytes]:
+    secret = os.getenv("IDENTITY_TOKEN_SECRET")
+    return secret.encode() if secret else None
+
+
+def token_required() -> bool:
+    return os.getenv("REQUIRE_IDENTITY_TOKEN", "0") == "1"
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str, secret: bytes) -> str:
+    return _b64(hmac.new(secret, payload.encode(), hashlib.sha256).digest())
+
+
+def mint(tenant_id: str, user_id: str, ttl: float = 3600, secret: Optional[bytes] = None) -> str:
+    """A token for (tenant_id, user_id) valid for ttl seconds."""
+    secret = secret or token_secret()
+    if not secret:
+        raise InvalidIdentityToken("IDENTITY_TOKEN_SECRET is not set")
+    payload = _b64(json.dumps({"tenant_id": tenant_id, "user_id": user_id, "exp": int(time.time() + ttl)}).encode())
+    return f"{payload}.{_sign(payload, secret)}"
+
+
+def verify(token: str, secret: Optional[bytes] = None) -> Identity:
+    """(tenant_id, user_id) from a valid token; raises InvalidIdentityToken otherwise."""
+    secret = secret or token_secret()
+    if not secret:
+        raise InvalidIdentityToken("Identity tokens are not enabled on this server")
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(_sign(payload, secret), signature):
+        raise InvalidIdentityToken("Bad identity token signature")
+    try:
+        claims = json.loads(_unb64(payload))
+        tenant_id, user_id, expires = str(claims["tenant_id"]), str(claims["user_id"]), float(claims["exp"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidIdentityToken("Malformed identity token")
+    if expires < time.time():
+        raise InvalidIdentityToken("Identity token expired")
+    if not tenant_id or not user_id:
+        raise InvalidIdentityToken("Identity token without tenant or user")
+    return tenant_id, user_id
+
+
+if __name__ == "__main__":
+    # python identity_token.py <tenant_id> <user_id> [ttl_seconds] -- mint a token for testing
+    import sys
+
+    print(mint(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 3600))
@@ -0,0 +1,131 @@
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Per-turn intent routing in front of the ADK runner.
+#
+# Most turns are greetings or questions about CANGRO that don't need the orchestrator's
+# booking instructions or its tools. classify() sorts a message into small talk, FAQ or
+# scheduling with a few local rules: dates, times, weekdays, email addresses and booking
+# words mean scheduling. It takes microseconds and no model call. Small talk and FAQ turns
+# go to the light agent (agent.faq_agent: FAQ_MODEL, the CANGRO context and no tools).
+# Scheduling turns go to the full orchestrator. Once a conversation has had a scheduling
+# turn, all its later turns go to the orchestrator, so replies like "yes" or a name reach
+# the booking flow. Both paths share the conversation's ADK session, so each sees the
+# other's replies.
+#
+# A random INTENT_ROUTER_CONTROL_RATE of light turns goes to the orchestrator anyway.
+# Comparing those with the light turns gives the latency and prompt tokens saved, which
+# stats() reports.
+#
+# Env:
+#   INTENT_ROUTER              - 0 sends every turn to the orchestrator (default 1)
+#   INTENT_ROUTER_CONTROL_RATE - fraction of light turns sent to the orchestrator to measure the saving (default 0.05)
+
+INTENT_SMALL_TALK = "small_talk"
+INTENT_FAQ = "faq"
+INTENT_SCHEDULING = "scheduling"
+
+ROUTE_LIGHT = "light"
+ROUTE_ORCHESTRATOR = "orchestrator"
+
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.\w+")
+SCHEDULING_RE = re.compile(
+    r"\b(book\w*|re-?schedul\w*|schedul\w*|meet|meetings?|appointments?|availab\w*|slots?|calendar|"
+    r"cancel\w*|zoom|invite|free time|today|tonight|tomorrow|next week|this week|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+    r"(jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.? \d{1,2})\b"
+    r"|\b\d{1,2}(:\d{2})? ?(am|pm)\b|\b\d{1,2}:\d{2}\b|\d{4}-\d{2}-\d{2}",
+    re.IGNORECASE)
+SMALL_TALK_WORDS = {
+    "hi", "hello", "hey", "hiya", "yo", "good", "morning", "afternoon", "evening", "there",
+    "thanks", "thank", "you", "thx", "cheers", "so", "much", "ok", "okay", "cool", "great", "nice",
+    "bye", "goodbye", "see", "later", "how", "are", "is", "it", "going",
+}
+MAX_SMALL_TALK_WORDS = 6
+MAX_REMEMBERED_CONVERSATIONS = 10000
+
+
+def classify(message: str) -> str:
+    if EMAIL_RE.search(message) or SCHEDULING_RE.search(message):
+        return INTENT_SCHEDULING
+    words = re.findall(r"[a-z']+", message.lower())
+    if words and len(words) <= MAX_SMALL_TALK_WORDS and all(w in SMALL_TALK_WORDS for w in words):
+        return INTENT_SMALL_TALK
+    return INTENT_FAQ
+
+
+class IntentRouter:
+    def __init__(self, enabled: Optional[bool] = None, control_rate: Optional[float] = None):
+        self.enabled = enabled if enabled is not None else os.getenv("INTENT_ROUTER", "1") != "0"
+        self.control_rate = control_rate if control_rate is not None else float(
+            os.getenv("INTENT_ROUTER_CONTROL_RATE") or "0.05")
+        # Conversations that have reached the booking flow
+        self._scheduling: "OrderedDict[str, None]" = OrderedDict()
+        self.counters = {"turns": 0, "follow_ups": 0, "control": 0}
+        self.turns_by_intent = {INTENT_SMALL_TALK: 0, INTENT_FAQ: 0, INTENT_SCHEDULING: 0}
+        self._classify_seconds = 0.0
+        # "light", "control" (light intent, full path) and "orchestrator": turns, seconds, prompt tokens
+        self._paths = {name: [0, 0.0, 0] for name in ("light", "control", "orchestrator")}
+
+    def route(self, conversation_key: str, message: str) -> Tuple[str, str]:
+        """(intent, route) for one turn; route is ROUTE_LIGHT or ROUTE_ORCHESTRATOR."""
+        started = time.perf_counter()
+        intent = classify(message)
+        self._classify_seconds += time.perf_counter() - started
+        self.counters["turns"] += 1
+        self.turns_by_intent[intent] += 1
+        if intent != INTENT_SCHEDULING and conversation_key in self._scheduling:
+            self.counters["follow_ups"] += 1
+            intent = INTENT_SCHEDULING
+        if intent == INTENT_SCHEDULING:
+            self._scheduling[conversation_key] = None
+            self._scheduling.move_to_end(conversation_key)
+            while len(self._scheduling) > MAX_REMEMBERED_CONVERSATIONS:
+                self._scheduling.popitem(last=False)
+            return intent, ROUTE_ORCHESTRATOR
+        if not self.enabled:
+            return intent, ROUTE_ORCHESTRATOR
+        if random.random() < self.control_rate:
+            self.counters["control"] += 1
+            return intent, ROUTE_ORCHESTRATOR
+        return intent, ROUTE_LIGHT
+
+    def record(self, intent: str, route: str, seconds: float, prompt_tokens: int):
+        """Adds a finished turn to the per-path latency and prompt token totals."""
+        if route == ROUTE_LIGHT:
+            path = "light"
+        elif intent != INTENT_SCHEDULING and self.enabled:
+            path = "control"
+        else:
+            path = "orchestrator"
+        totals = self._paths[path]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] += prompt_tokens
+
+    def _averages(self, path: str) -> Dict:
+        turns, seconds, tokens = self._paths[path]
+        return {"turns": turns,
+                "avg_seconds": round(seconds / turns, 3) if turns else None,
+                "avg_prompt_tokens": round(tokens / turns) if turns else None}
+
+    def stats(self) -> Dict:
+        paths = {name: self._averages(name) for name in self._paths}
+        light, control = paths["light"], paths["control"]
+        saved = {"seconds_per_turn": None, "prompt_tokens_per_turn": None}
+        if light["turns"] and control["turns"]:
+            saved["seconds_per_turn"] = round(control["avg_seconds"] - light["avg_seconds"], 3)
+            saved["prompt_tokens_per_turn"] = control["avg_prompt_tokens"] - light["avg_prompt_tokens"]
+        turns = self.counters["turns"]
+        return {
+            "enabled": self.enabled,
+            **self.counters,
+            "turns_by_intent": dict(self.turns_by_intent),
+            "avg_classify_us": round(self._classify_seconds / turns * 1e6, 1) if turns else None,
+            "paths": paths,
+            "saved": saved,
+        }
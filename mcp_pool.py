@@ -0,0 +1,342 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import anyio
+from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
+from mcp import ClientSession
+from mcp.client.stdio import stdio_client
+
+# Prewarmed pools of MCP server subprocesses, shared by every toolset that starts
+# the same server.
+#
+# ADK's MCPToolset starts its server on the first tool call (a cold start inside a
+# user's turn) and keeps one process per toolset; if that process hangs, every later
+# call waits on it. A pool keeps MCP_POOL_SIZE initialized instances per server
+# (toolsets with the same command, args and env share one pool), sends each call to
+# the healthy instance with the fewest calls in flight, and runs a supervisor that
+# pings idle instances and lists their tools. An instance that fails a check, crashes,
+# or runs a call past the call deadline is killed and replaced. A timed-out call fails
+# rather than being retried elsewhere, since the tool may already have had effects.
+#
+# Env:
+#   MCP_POOL_SIZE                    - warm instances per server; 0 disables pooling (default 2)
+#   MCP_POOL_CALL_TIMEOUT_SECONDS    - deadline for one tool call (default 60)
+#   MCP_POOL_HEALTH_INTERVAL_SECONDS - how often idle instances are checked (default 15)
+#   MCP_POOL_PING_TIMEOUT_SECONDS    - deadline for a health check (default 5)
+#   MCP_POOL_SPAWN_TIMEOUT_SECONDS   - deadline for starting and initializing an instance (default 30)
+
+logger = logging.getLogger(__name__)
+
+MAX_SPAWN_BACKOFF = 30.0
+
+
+def pool_size() -> int:
+    return int(os.getenv("MCP_POOL_SIZE") or "2")
+
+
+class MCPInstance:
+    """One server subprocess with an initialized session, owned by a single task.
+
+    The stdio client and session are entered and exited in run(): anyio requires the
+    same task to do both, so stop() only signals that task.
+    """
+
+    def __init__(self, instance_id: int, params: StdioServerParameters):
+        self.id = instance_id
+        self.params = params
+        self.session: Optional[ClientSession] = None
+        self.ready = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.spawn_seconds: Optional[float] = None
+        self.started_at = time.monotonic()
+        self.error: Optional[str] = None
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, on_change: Callable[[], None]):
+        async def run():
+            try:
+                async with stdio_client(self.params) as (read, write):
+                    async with ClientSession(read, write) as session:
+                        await session.initialize()
+                        self.session = session
+                        self.spawn_seconds = time.monotonic() - self.started_at
+                        self.ready.set()
+                        on_change()
+                        await self._stop.wait()
+            except Exception as e:
+                self.error = self.error or repr(e)
+                logger.warning(f"MCP instance {self.id} exited: {self.error}")
+            finally:
+                self.session = None
+                self.finished.set()
+                on_change()
+
+        self._task = asyncio.create_task(run())
+
+    @property
+    def healthy(self) -> bool:
+        if not self.ready.is_set() or self._stop.is_set() or self.finished.is_set() or self.session is None:
+            return False
+        return not (self.session._read_stream._closed or self.session._write_stream._closed)
+
+    def stop(self, reason: str):
+        if not self._stop.is_set():
+            self.error = self.error or reason
+            self._stop.set()
+
+    @property
+    def state(self) -> str:
+        if self.finished.is_set():
+            return "exited"
+        if self._stop.is_set():
+            return "stopping"
+        return "ready" if self.ready.is_set() else "starting"
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "spawn_ms": round(self.spawn_seconds * 1000, 1) if self.spawn_seconds is not None else None,
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+        }
+
+
+class PooledSession:
+    """Stands in for the ClientSession that MCPTool and MCPToolset call into."""
+
+    def __init__(self, pool: "MCPPool", instance: MCPInstance):
+        self._pool = pool
+        self._instance = instance
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None, **kwargs):
+        return await self._pool.call(self._instance, lambda s: s.call_tool(name, arguments=arguments, **kwargs))
+
+    async def list_tools(self, *args, **kwargs):
+        return await self._pool.call(self._instance, lambda s: s.list_tools(*args, **kwargs))
+
+
+class MCPPool:
+    """Warm instances of one MCP server; duck-types ADK's MCPSessionManager."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, params: StdioServerParameters, size: Optional[int] = None):
+        self.params = params
+        self.name = " ".join(os.path.basename(arg) for arg in params.args) or params.command
+        self.size = size if size is not None else max(1, pool_size())
+        self.call_timeout = float(os.getenv("MCP_POOL_CALL_TIMEOUT_SECONDS") or "60")
+        self.health_interval = float(os.getenv("MCP_POOL_HEALTH_INTERVAL_SECONDS") or "15")
+        self.ping_timeout = float(os.getenv("MCP_POOL_PING_TIMEOUT_SECONDS") or "5")
+        self.spawn_timeout = float(os.getenv("MCP_POOL_SPAWN_TIMEOUT_SECONDS") or "30")
+        self._instances: List[MCPInstance] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self._changed: Optional[asyncio.Condition] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._spawn_failures = 0
+        self._spawn_seconds: List[float] = []
+        self.counters = {"spawned": 0, "restarts": 0, "call_timeouts": 0, "crashes": 0,
+                         "health_failures": 0, "spawn_failures": 0}
+
+    # --- Lifecycle ---
+    def start(self):
+        """Starts the supervisor, which spawns the instances (call from the serving loop)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None:
+                logger.warning(f"MCP pool {self.name}: event loop changed, starting fresh instances")
+            self._loop = loop
+            self._instances = []
+            self._changed = asyncio.Condition()
+            self._wake = asyncio.Event()
+            self._supervisor = None
+        if self._supervisor is None or self._supervisor.done():
+            self._supervisor = asyncio.create_task(self._supervise())
+
+    async def close(self):
+        if self._loop is not asyncio.get_running_loop():
+            return
+        if self._supervisor:
+            self._supervisor.cancel()
+            self._supervisor = None
+        for instance in self._instances:
+            instance.stop("pool closed")
+        await asyncio.gather(*(i.finished.wait() for i in self._instances))
+        self._instances = []
+
+    def _notify(self):
+        async def notify():
+            async with self._changed:
+                self._changed.notify_all()
+        asyncio.create_task(notify())
+        self._wake.set()
+
+    def _spawn(self):
+        instance = MCPInstance(next(self._ids), self.params)
+        self._instances.append(instance)
+        self.counters["spawned"] += 1
+        instance.start(self._notify)
+
+    def _retire(self, instance: MCPInstance, reason: str):
+        """Kills an instance; the supervisor replaces it."""
+        if instance.state in ("starting", "ready"):
+            logger.warning(f"MCP pool {self.name}: replacing instance {instance.id}: {reason}")
+            self.counters["restarts"] += 1
+        instance.stop(reason)
+        self._wake.set()
+
+    # --- Supervisor ---
+    async def _supervise(self):
+        next_check = time.monotonic() + self.health_interval
+        while True:
+            for instance in [i for i in self._instances if i.finished.is_set()]:
+                self._instances.remove(instance)
+                if instance.spawn_seconds is None:
+                    self._spawn_failures += 1
+                    self.counters["spawn_failures"] += 1
+                else:
+                    self._spawn_failures = 0
+                    self._spawn_seconds = (self._spawn_seconds + [instance.spawn_seconds])[-50:]
+            for instance in self._instances:
+                if instance.state == "starting" and time.monotonic() - instance.started_at > self.spawn_timeout:
+                    self._retire(instance, "did not start in time")
+                elif instance.ready.is_set() and not instance.healthy and instance.state == "ready":
+                    self.counters["crashes"] += 1
+                    self._retire(instance, "connection closed")
+
+            live = [i for i in self._instances if i.state in ("starting", "ready")]
+            if len(live) < self.size:
+                if self._spawn_failures:
+                    # A server that cannot start is retried with backoff, not in a tight loop
+                    await asyncio.sleep(min(MAX_SPAWN_BACKOFF, 0.5 * 2 ** (self._spawn_failures - 1)))
+                for _ in range(self.size - len(live)):
+                    self._spawn()
+
+            if time.monotonic() >= next_check:
+                idle = [i for i in self._instances if i.healthy and i.in_flight == 0]
+                await asyncio.gather(*(self._check(i) for i in idle))
+                next_check = time.monotonic() + self.health_interval
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.1, next_check - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, instance: MCPInstance):
+        try:
+            await asyncio.wait_for(instance.session.send_ping(), self.ping_timeout)
+            await asyncio.wait_for(instance.session.list_tools(), self.ping_timeout)
+        except Exception as e:
+            if instance.healthy:
+                self.counters["health_failures"] += 1
+                self._retire(instance, f"health check failed: {e!r}")
+
+    # --- Routing ---
+    def _pick(self) -> Optional[MCPInstance]:
+        healthy = [i for i in self._instances if i.healthy]
+        return min(healthy, key=lambda i: (i.in_flight, i.calls)) if healthy else None
+
+    async def create_session(self, headers: Optional[Dict[str, str]] = None) -> PooledSession:
+        """Returns a session bound to the least-loaded healthy instance, waiting for one to start."""
+        self.start()
+        instance = self._pick()
+        if instance is None:
+            async with self._changed:
+                try:
+                    await asyncio.wait_for(self._changed.wait_for(self._pick), self.spawn_timeout)
+                except asyncio.TimeoutError:
+                    raise ConnectionError(f"No healthy MCP instance for {self.name} after {self.spawn_timeout:.0f}s")
+            instance = self._pick()
+        return PooledSession(self, instance)
+
+    async def call(self, instance: MCPInstance, request: Callable[[ClientSession], Awaitable[Any]]) -> Any:
+        session = instance.session
+        if session is None or not instance.healthy:
+            # Lost between create_session and the call; ADK retries once on a new session
+            raise anyio.ClosedResourceError()
+        instance.in_flight += 1
+        instance.calls += 1
+        try:
+            return await asyncio.wait_for(request(session), self.call_timeout)
+        except asyncio.TimeoutError:
+            instance.failures += 1
+            self.counters["call_timeouts"] += 1
+            self._retire(instance, f"call exceeded {self.call_timeout:.0f}s")
+            raise
+        except (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream):
+            instance.failures += 1
+            self.counters["crashes"] += 1
+            self._retire(instance, "connection closed")
+            raise anyio.ClosedResourceError()
+        finally:
+            instance.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        spawns = self._spawn_seconds + [i.spawn_seconds for i in self._instances if i.spawn_seconds is not None]
+        return {
+            "size": self.size,
+            "healthy": sum(1 for i in self._instances if i.healthy),
+            "in_flight": sum(i.in_flight for i in self._instances),
+            "avg_spawn_ms": round(sum(spawns) / len(spawns) * 1000, 1) if spawns else None,
+            **self.counters,
+            "instances": [i.describe() for i in self._instances],
+        }
+
+
+# --- Shared pools ---
+_pools: Dict[Tuple, MCPPool] = {}
+
+
+def _pool_key(params: StdioServerParameters) -> Tuple:
+    return (params.command, tuple(params.args), tuple(sorted((params.env or {}).items())), params.cwd)
+
+
+def shared_pool(params: StdioServerParameters) -> MCPPool:
+    key = _pool_key(params)
+    if key not in _pools:
+        _pools[key] = MCPPool(params)
+    return _pools[key]
+
+
+def start_pools():
+    """Prewarms every pool created so far (call from the serving loop)."""
+    for pool in _pools.values():
+        pool.start()
+
+
+async def close_pools():
+    await asyncio.gather(*(pool.close() for pool in _pools.values()))
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {pool.name: pool.stats() for pool in _pools.values() if pool._loop is not None}
+
+
+class PooledMCPToolset(MCPToolset):
+    """MCPToolset whose tool calls go to the shared pool for its server.
+
+    Tools are still MCPTool instances (so IdentityPlugin applies). With MCP_POOL_SIZE=0
+    this is a plain MCPToolset.
+    """
+
+    def __init__(self, *, connection_params: StdioServerParameters, **kwargs):
+        super().__init__(connection_params=connection_params, **kwargs)
+        if pool_size() > 0:
+            self._mcp_session_manager = shared_pool(connection_params)
+
+    async def close(self):
+        # Pools outlive any one runner; close_pools() stops them at shutdown
+        if not isinstance(self._mcp_session_manager, MCPPool):
+            await super().close()
@@ -2,8 +2,11 @@ import asyncio
 import os
 import json
 import logging
+from collections import OrderedDict
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta, timezone, time
+import time as time_module
+import uuid
 import pytz # Ensure pytz is available or handle timezones carefully
 from dotenv import load_dotenv
 
@@ -13,6 +16,7 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
 
 # MCP Server Imports
 from mcp.server.lowlevel import Server, NotificationOptions
@@ -20,6 +24,12 @@ from mcp.server.models import InitializationOptions
 import mcp.server.stdio
 from mcp import types as mcp_types
 
+from credential_store import AccountNotConnected, ClientCache, Identity, pop_identity, require_credentials
+from token_broker import TokenSpec, default_broker, google_token_uri
+from result_serializer import default_serializer, serialize
+from tool_cache import ToolCache
+from push_channels import CALENDAR, default_listener, new_token, push_cache_ttl
+
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -27,21 +37,35 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 #https://developers.google.com/workspace/calendar/api/v3/reference
 SCOPES = ['https://www.googleapis.com/auth/calendar']
+BATCH_LIMIT = 50 # Calendar accepts up to 50 calls per batch request
+BATCH_RETRY_STATUS = {429, 500, 502, 503} # items retried in a follow-up batch
+BATCH_RETRIES = 2
+# Partial response for list_events: only what the tool returns, plus paging and the ETag
+LIST_FIELDS = 'etag,nextPageToken,items(id,summary,start,status)'
+LIST_CACHE_SIZE = 64 # events.list pages kept for If-None-Match revalidation
 
 # --- Calendar Service ---
 class CalendarService:
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, creds: Optional[Dict] = None):
         self.creds = None
+        # Per-user credentials from the credential store; env credentials when None
+        self.stored_creds = creds or {}
         self.service = None
+        self._list_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self.list_stats = {'fetched': 0, 'not_modified': 0}
+        self.push = None # push_channels.ChannelWatch when PUSH_WEBHOOK_BASE_URL is set
+        self._on_push = None
+        # Optional API root (e.g. the local fake_apis server); defaults to googleapis.com
+        self.base_url = (base_url or os.getenv('CALENDAR_API_BASE_URL') or '').rstrip('/') or None
         self._authenticate()
 
     def _authenticate(self):
-        """Authenticates with Calendar API using credentials from env."""
+        """Authenticates with Calendar API using stored per-user credentials or env."""
         creds = None
         
-        client_id = os.getenv('CALENDAR_CLIENT_ID')
-        client_secret = os.getenv('CALENDAR_CLIENT_SECRET')
-        refresh_token = os.getenv('CALENDAR_REFRESH_TOKEN')
+        client_id = self.stored_creds.get('client_id') or os.getenv('CALENDAR_CLIENT_ID')
+        client_secret = self.stored_creds.get('client_secret') or os.getenv('CALENDAR_CLIENT_SECRET')
+        refresh_token = self.stored_creds.get('refresh_token') or os.getenv('CALENDAR_REFRESH_TOKEN')
 
         # Fallback to GMAIL credentials if CALENDAR ones are missing
         if not (client_id and client_secret and refresh_token):
@@ -52,46 +76,112 @@ class CalendarService:
 
         if client_id and client_secret and refresh_token:
             logger.info("Using credentials from environment variables.")
-            creds = Credentials(
-                None,
-                refresh_token=refresh_token,
-                token_uri="https://oauth2.googleapis.com/token",
-                client_id=client_id,
-                client_secret=client_secret,
-                scopes=SCOPES
-            )
+            # Access tokens come from the shared broker cache rather than a refresh per process
+            self.spec = TokenSpec(refresh_token, client_id, client_secret, google_token_uri(self.base_url))
+            creds = default_broker().credentials(self.spec, scopes=SCOPES)
         else:
             logger.error("Missing credentials (CALENDAR_ or GMAIL_ prefixes) in .env")
             raise RuntimeError("Could not authenticate. Please provide credentials in .env.")
 
         self.creds = creds
-        self.service = build('calendar', 'v3', credentials=self.creds)
+        self.service = self._build_service()
         logger.info("Calendar API Service initialized.")
 
-    def list_events(self, max_results: int = 10) -> List[Dict]:
-        """Lists upcoming events."""
+    def _build_service(self):
+        # api_endpoint replaces rootUrl + servicePath, so the calendar/v3/ prefix has to be included
+        client_options = {'api_endpoint': f"{self.base_url}/calendar/v3/"} if self.base_url else None
+        return build('calendar', 'v3', credentials=self.creds, client_options=client_options)
+
+    @property
+    def account(self) -> str:
+        """Cache and push-channel key: the calendar account, which several identities may share."""
+        return self.spec.key
+
+    # --- Push channel (see push_channels.py) ---
+    def watch_events(self) -> Dict:
+        """Opens an events.watch channel to server.py's webhook (runs on the push listener thread)."""
+        address = f"{os.getenv('PUSH_WEBHOOK_BASE_URL').rstrip('/')}/api/push/calendar"
+        channel_id, token = str(uuid.uuid4()), new_token()
+        ttl = os.getenv('PUSH_CHANNEL_TTL_SECONDS') or '86400'
+        response = self._build_service().events().watch(
+            calendarId='primary',
+            body={'id': channel_id, 'type': 'web_hook', 'address': address, 'token': token, 'params': {'ttl': ttl}}
+        ).execute()
+        return {'channel_id': channel_id, 'resource_id': response['resourceId'], 'token': token,
+                'expiration': int(response['expiration']) / 1000}
+
+    def stop_channel(self, channel: Dict):
+        self._build_service().channels().stop(
+            body={'id': channel['channel_id'], 'resourceId': channel['resource_id']}).execute()
+
+    def enable_push(self, on_change):
+        """Keeps a channel open for this account; on_change runs for every change notification."""
+        self._on_push = lambda data: on_change()
+        self.push = default_listener().watch(CALENDAR, self.account, self.watch_events, self.stop_channel,
+                                             self._on_push)
+
+    def close(self):
+        if self.push:
+            default_listener().unwatch(self.push, self._on_push)
+
+    def _list_page(self, params: Dict) -> Dict:
+        """One events.list page, revalidated with If-None-Match when we have it cached."""
+        key = tuple(sorted(params.items()))
+        cached = self._list_cache.get(key)
+        request = self.service.events().list(calendarId='primary', singleEvents=True, orderBy='startTime',
+                                             fields=LIST_FIELDS, **params)
+        if cached:
+            request.headers['If-None-Match'] = cached['etag']
         try:
-            now = datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
-            events_result = self.service.events().list(
-                calendarId='primary', timeMin=now,
-                maxResults=max_results, singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            events = events_result.get('items', [])
-            
-            event_list = []
-            for event in events:
-                start = event['start'].get('dateTime', event['start'].get('date'))
-                event_list.append({
-                    'id': event['id'],
-                    'summary': event.get('summary', 'No Title'),
-                    'start': start,
-                    'status': event.get('status')
-                })
-            return event_list
+            page = request.execute()
+        except HttpError as e:
+            if cached and e.resp.status == 304:
+                self._list_cache.move_to_end(key)
+                self.list_stats['not_modified'] += 1
+                return cached
+            raise
+        self.list_stats['fetched'] += 1
+        if page.get('etag'):
+            self._list_cache[key] = page
+            self._list_cache.move_to_end(key)
+            while len(self._list_cache) > LIST_CACHE_SIZE:
+                self._list_cache.popitem(last=False)
+        return page
+
+    def list_events(self, max_results: int = 10, time_min: Optional[str] = None, time_max: Optional[str] = None,
+                    page_token: Optional[str] = None) -> Dict:
+        """Lists events in a time range (default: from now), fetching pages only as needed."""
+        try:
+            if not time_min:
+                # Whole minutes, so repeated calls hit the ETag cache
+                now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+                time_min = now.isoformat().replace('+00:00', 'Z')
+            events = []
+            while len(events) < max_results:
+                params = {'timeMin': time_min, 'maxResults': min(max_results - len(events), 250)}
+                if time_max:
+                    params['timeMax'] = time_max
+                if page_token:
+                    params['pageToken'] = page_token
+                page = self._list_page(params)
+                for event in page.get('items', []):
+                    start = event.get('start', {})
+                    events.append({
+                        'id': event['id'],
+                        'summary': event.get('summary', 'No Title'),
+                        'start': start.get('dateTime', start.get('date')),
+                        'status': event.get('status')
+                    })
+                page_token = page.get('nextPageToken')
+                if not page_token:
+                    break
+            result = {'events': events}
+            if page_token:
+                result['next_page_token'] = page_token
+            return result
         except Exception as error:
             logger.error(f"An error occurred in list_events: {error}")
-            return []
+            return {'error': str(error)}
 
     def create_event(self, summary: str, start_time: str, end_time: str, description: str = "") -> Dict:
         """Creates a new event. Times must be in ISO format."""
@@ -120,6 +210,97 @@ class CalendarService:
         except Exception as error:
              return {'error': str(error)}
 
+    def _new_batch(self, callback) -> BatchHttpRequest:
+        # The discovery batch path ignores api_endpoint, so point it at the override explicitly
+        if self.base_url:
+            return BatchHttpRequest(callback=callback, batch_uri=f"{self.base_url}/batch/calendar/v3")
+        return self.service.new_batch_http_request(callback=callback)
+
+    def _run_batched(self, requests: List) -> List[Dict]:
+        """Executes API requests in batches of BATCH_LIMIT and returns one outcome per request.
+
+        Items failing with a retryable status go into a follow-up batch (up to
+        BATCH_RETRIES times); other failures are reported per item. Blocks, backoff
+        included, so call_tool runs the callers in a worker thread.
+        """
+        outcomes: List[Optional[Dict]] = [None] * len(requests)
+        pending = list(range(len(requests)))
+        for attempt in range(BATCH_RETRIES + 1):
+            retry = []
+
+            def callback(request_id, response, exception):
+                index = int(request_id)
+                if exception is None:
+                    outcomes[index] = {'response': response}
+                    return
+                status = exception.resp.status if isinstance(exception, HttpError) else None
+                if status in BATCH_RETRY_STATUS and attempt < BATCH_RETRIES:
+                    retry.append(index)
+                else:
+                    error = f"HTTP {status}: {exception.reason}" if status else str(exception)
+                    outcomes[index] = {'error': error, 'status_code': status}
+
+            for start in range(0, len(pending), BATCH_LIMIT):
+                batch = self._new_batch(callback)
+                chunk = pending[start:start + BATCH_LIMIT]
+                for index in chunk:
+                    batch.add(requests[index], request_id=str(index))
+                try:
+                    batch.execute()
+                except Exception as e:
+                    # The whole batch request failed: retry the chunk or report every item
+                    if attempt < BATCH_RETRIES:
+                        retry += [i for i in chunk if outcomes[i] is None and i not in retry]
+                    else:
+                        for index in chunk:
+                            outcomes[index] = outcomes[index] or {'error': str(e), 'status_code': None}
+            if not retry:
+                break
+            pending = sorted(retry)
+            time_module.sleep(0.5 * 2 ** attempt)
+        return outcomes
+
+    def create_events(self, events: List[Dict]) -> Dict:
+        """Creates many events with batch requests; reports a result per event."""
+        results: List[Optional[Dict]] = [None] * len(events)
+        valid = []
+        for index, event in enumerate(events):
+            if event.get('start_time') and event.get('end_time'):
+                valid.append(index)
+            else:
+                results[index] = {'index': index, 'error': 'start_time and end_time are required.'}
+        # Runs in a worker thread (see call_tool) on its own client: googleapiclient services are not thread-safe
+        service = self._build_service()
+        requests = [service.events().insert(calendarId='primary', body={
+            'summary': events[index].get('summary', ''),
+            'description': events[index].get('description', ''),
+            'start': {'dateTime': events[index]['start_time']},
+            'end': {'dateTime': events[index]['end_time']},
+        }) for index in valid]
+        for index, outcome in zip(valid, self._run_batched(requests)):
+            if 'error' in outcome:
+                results[index] = {'index': index, 'error': outcome['error']}
+            else:
+                results[index] = {'index': index, 'id': outcome['response']['id'], 'status': 'created'}
+        created = sum(1 for r in results if 'id' in r)
+        return {'created': created, 'failed': len(results) - created, 'results': results}
+
+    def delete_events(self, event_ids: List[str]) -> Dict:
+        """Deletes many events with batch requests; reports a result per event."""
+        service = self._build_service()  # worker thread, like create_events
+        requests = [service.events().delete(calendarId='primary', eventId=event_id) for event_id in event_ids]
+        results = []
+        for event_id, outcome in zip(event_ids, self._run_batched(requests)):
+            if 'error' not in outcome:
+                results.append({'id': event_id, 'status': 'deleted'})
+            elif outcome['status_code'] in (404, 410):
+                results.append({'id': event_id, 'status': 'not found'})
+            else:
+                results.append({'id': event_id, 'error': outcome['error']})
+        counts = {status: sum(1 for r in results if r.get('status') == status) for status in ('deleted', 'not found')}
+        return {'deleted': counts['deleted'], 'not_found': counts['not found'],
+                'failed': sum(1 for r in results if 'error' in r), 'results': results}
+
     def find_free_slots(self, duration_minutes: int = 30, start_date: str = None, max_slots: int = 5) -> List[Dict]:
         """
         Finds the nearest free time slots (Mon-Fri, 8am-5pm) using Google Calendar FreeBusy API.
@@ -208,18 +389,57 @@ class CalendarService:
 
 # --- MCP Server Setup ---
 app = Server("calendar-mcp-server")
-calendar_service = None # Initialize later
+calendar_service = None # Initialize later (env credentials)
+calendar_clients = ClientCache() # Per-user services built from the credential store
+# Repeated reads within a negotiation are served from here (keyed by calendar account); writes
+# and push notifications clear them
+EVENT_READS = ["list_events", "find_free_slots"]
+tool_cache = ToolCache(
+    name="calendar",
+    ttls={"list_events": 30, "find_free_slots": 30},
+    invalidates={tool: EVENT_READS for tool in ("create_event", "delete_event", "create_events", "delete_events")}
+)
+
+def new_calendar_service(creds: Optional[Dict] = None) -> CalendarService:
+    service = CalendarService(creds=creds)
+    if os.getenv('PUSH_WEBHOOK_BASE_URL'):
+        # Change notifications drop the account's cached reads right away
+        service.enable_push(lambda: tool_cache.invalidate(service.account, EVENT_READS))
+    return service
+
+def get_calendar_service(identity: Identity) -> CalendarService:
+    """Returns the service for the user the call was made for."""
+    global calendar_service
+    creds = require_credentials(identity, "google", "Google")
+    if creds:
+        return calendar_clients.get((identity, creds["version"]), lambda: new_calendar_service(creds))
+    if not calendar_service:
+        calendar_service = new_calendar_service()
+    return calendar_service
+
+def cache_ttl(service: CalendarService, now_relative: bool = False) -> Optional[float]:
+    """Longer cache lifetime while a push channel will tell us about changes.
+
+    Reads that start from "now" keep the polling TTL: no notification says time has passed,
+    so a long-lived result would go on offering slots (or events) that are already over.
+    """
+    if now_relative:
+        return None
+    return push_cache_ttl() if getattr(service, "push", None) and service.push.active else None
 
 @app.list_tools()
 async def list_tools() -> list[mcp_types.Tool]:
     return [
         mcp_types.Tool(
             name="list_events",
-            description="List upcoming calendar events.",
+            description="List calendar events in a time range (default: upcoming). Pass next_page_token back as page_token for more.",
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "max_results": {"type": "integer", "description": "Max number of events to list (default 10)."}
+                    "max_results": {"type": "integer", "description": "Max number of events to list (default 10)."},
+                    "time_min": {"type": "string", "description": "Range start, ISO 8601 (default now)."},
+                    "time_max": {"type": "string", "description": "Range end, ISO 8601 (optional)."},
+                    "page_token": {"type": "string", "description": "next_page_token from a previous call."}
                 }
             }
         ),
@@ -248,6 +468,41 @@ async def list_tools() -> list[mcp_types.Tool]:
                 "required": ["event_id"]
             }
         ),
+        mcp_types.Tool(
+            name="create_events",
+            description="Create several calendar events in one call (batched). Reports a result per event.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "events": {
+                        "type": "array",
+                        "description": "Events to create.",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "summary": {"type": "string", "description": "Event title."},
+                                "start_time": {"type": "string", "description": "Start time (ISO 8601)."},
+                                "end_time": {"type": "string", "description": "End time (ISO 8601)."},
+                                "description": {"type": "string", "description": "Optional description."}
+                            },
+                            "required": ["summary", "start_time", "end_time"]
+                        }
+                    }
+                },
+                "required": ["events"]
+            }
+        ),
+        mcp_types.Tool(
+            name="delete_events",
+            description="Delete several calendar events in one call (batched). Reports a result per event.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "event_ids": {"type": "array", "items": {"type": "string"}, "description": "IDs of the events to delete."}
+                },
+                "required": ["event_ids"]
+            }
+        ),
         mcp_types.Tool(
             name="find_free_slots",
             description="Find the nearest 5 free time slots during working hours (Mon-Fri, 8am-5pm).",
@@ -259,43 +514,80 @@ async def list_tools() -> list[mcp_types.Tool]:
                     "max_slots": {"type": "integer", "description": "Max slots to return (default 5)."}
                 }
             }
+        ),
+        mcp_types.Tool(
+            name="get_diagnostics",
+            description="Cache hit rates and client statistics for this calendar server.",
+            inputSchema={"type": "object", "properties": {}}
         )
     ]
 
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[mcp_types.Content]:
-    global calendar_service
-    if not calendar_service:
-        try:
-            calendar_service = CalendarService()
-        except Exception as e:
-             return [mcp_types.TextContent(type="text", text=f"Error initializing Calendar Service: {str(e)}")]
+    identity = pop_identity(arguments)
+    try:
+        service = get_calendar_service(identity)
+    except AccountNotConnected as e:
+        return [mcp_types.TextContent(type="text", text=str(e))]
+    except Exception as e:
+         return [mcp_types.TextContent(type="text", text=f"Error initializing Calendar Service: {str(e)}")]
 
     if name == "list_events":
-        max_results = arguments.get("max_results", 10)
-        events = calendar_service.list_events(max_results)
-        return [mcp_types.TextContent(type="text", text=json.dumps(events, indent=2))]
+        args = {
+            "max_results": arguments.get("max_results", 10),
+            "time_min": arguments.get("time_min"),
+            "time_max": arguments.get("time_max"),
+            "page_token": arguments.get("page_token")
+        }
+        events = tool_cache.get(service.account, name, args, lambda: service.list_events(**args),
+                                ttl=cache_ttl(service, now_relative=not args["time_min"]))
+        return [mcp_types.TextContent(type="text", text=serialize(name, events))]
 
     elif name == "create_event":
-        result = calendar_service.create_event(
+        result = service.create_event(
             arguments["summary"],
             arguments["start_time"],
             arguments["end_time"],
             arguments.get("description", "")
         )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        tool_cache.after_write(service.account, name)
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
         
     elif name == "delete_event":
-        result = calendar_service.delete_event(arguments["event_id"])
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        result = service.delete_event(arguments["event_id"])
+        tool_cache.after_write(service.account, name)
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
+
+    elif name == "create_events":
+        # Batches and their retry backoff block, so they run off the event loop
+        result = await asyncio.to_thread(service.create_events, arguments["events"])
+        tool_cache.after_write(service.account, name)
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
+
+    elif name == "delete_events":
+        result = await asyncio.to_thread(service.delete_events, arguments["event_ids"])
+        tool_cache.after_write(service.account, name)
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     elif name == "find_free_slots":
-        result = calendar_service.find_free_slots(
-            arguments.get("duration_minutes", 30),
-            arguments.get("start_date"),
-            arguments.get("max_slots", 5)
-        )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        args = {
+            "duration_minutes": arguments.get("duration_minutes", 30),
+            "start_date": arguments.get("start_date"),
+            "max_slots": arguments.get("max_slots", 5)
+        }
+        result = tool_cache.get(service.account, name, args, lambda: service.find_free_slots(**args),
+                                ttl=cache_ttl(service, now_relative=not args["start_date"]))
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
+
+    elif name == "get_diagnostics":
+        result = {
+            "tool_cache": tool_cache.stats(),
+            "result_sizes": default_serializer.stats(),
+            "clients": calendar_clients.stats(),
+            "list_events_requests": getattr(service, "list_stats", None),
+            "push_channels": default_listener().stats() if os.getenv('PUSH_WEBHOOK_BASE_URL') else None
+        }
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     return [mcp_types.TextContent(type="text", text="Tool not found")]
 
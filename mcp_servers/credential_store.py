@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+# Encrypted per-user credential store shared by server.py (writes tokens after the
+# OAuth callback) and the MCP servers (read them to act for the requesting user).
+#
+# Credentials are keyed by (tenant_id, user_id, provider) and encrypted with Fernet.
+# The key comes from CREDENTIAL_STORE_KEY or is generated once into a 0600 key file
+# next to the database (CREDENTIAL_STORE_PATH, default <repo>/credentials.db).
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TENANT = "default"
+DEFAULT_USER = "user"
+
+# Tool arguments injected by identity_plugin.IdentityPlugin; never part of a tool's schema.
+USER_ARG = "_user_id"
+TENANT_ARG = "_tenant_id"
+
+Identity = Tuple[str, str]
+
+
+def store_path() -> str:
+    return os.getenv("CREDENTIAL_STORE_PATH") or os.path.join(BASE_DIR, "credentials.db")
+
+
+def key_path(db_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), ".credential_store.key")
+
+
+def load_key(db_path: str, create: bool) -> Optional[bytes]:
+    """Returns the Fernet key from CREDENTIAL_STORE_KEY or the key file, creating it if asked."""
+    env_key = os.getenv("CREDENTIAL_STORE_KEY")
+    if env_key:
+        return env_key.encode()
+    path = key_path(db_path)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read().strip()
+    if not create:
+        return None
+    key = Fernet.generate_key()
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another process created it first; use theirs.
+        with open(path, "rb") as f:
+            return f.read().strip()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    logger.info(f"Generated credential store key at {path}")
+    return key
+
+
+def private_dir(directory: str) -> str:
+    """Creates directory (or tightens an existing one) so only this OS user can enter it."""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    os.chmod(directory, 0o700)
+    return directory
+
+
+def private_file(path: str) -> str:
+    """Creates path empty if missing and makes it 0600 (SQLite journals copy the file's mode)."""
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    os.chmod(path, 0o600)
+    return path
+
+
+class CredentialStore:
+    def __init__(self, path: Optional[str] = None, key: Optional[bytes] = None):
+        self.path = path or store_path()
+        self.fernet = Fernet(key or load_key(self.path, create=True))
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS credentials ("
+                " tenant_id TEXT NOT NULL, user_id TEXT NOT NULL, provider TEXT NOT NULL,"
+                " data BLOB NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (tenant_id, user_id, provider))"
+            )
+
+    @classmethod
+    def open_existing(cls) -> Optional["CredentialStore"]:
+        """Opens the store for reading; None until server.py has written something to it."""
+        path = store_path()
+        key = load_key(path, create=False)
+        if not key or not os.path.exists(path):
+            return None
+        return cls(path, key)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def put(self, tenant_id: str, user_id: str, provider: str, data: Dict[str, Any]):
+        token = self.fernet.encrypt(json.dumps(data).encode())
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO credentials VALUES (?, ?, ?, ?, ?)",
+                (tenant_id, user_id, provider, token, time.time()),
+            )
+
+    def get(self, tenant_id: str, user_id: str, provider: str) -> Optional[Dict[str, Any]]:
+        """Returns the stored credentials plus a 'version' (last update time), or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data, updated_at FROM credentials WHERE tenant_id = ? AND user_id = ? AND provider = ?",
+                (tenant_id, user_id, provider),
+            ).fetchone()
+        if not row:
+            return None
+        try:
+            data = json.loads(self.fernet.decrypt(row[0]))
+        except InvalidToken:
+            logger.error(f"Could not decrypt {provider} credentials for {tenant_id}/{user_id} (wrong key?)")
+            return None
+        data["version"] = row[1]
+        return data
+
+    def list_credentials(self, provider: str) -> List[Dict[str, Any]]:
+        """All readable credentials for a provider (used to keep their access tokens warm)."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT data FROM credentials WHERE provider = ?", (provider,)).fetchall()
+        result = []
+        for (data,) in rows:
+            try:
+                result.append(json.loads(self.fernet.decrypt(data)))
+            except InvalidToken:
+                continue
+        return result
+
+    def delete(self, tenant_id: str, user_id: str, provider: str):
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM credentials WHERE tenant_id = ? AND user_id = ? AND provider = ?",
+                (tenant_id, user_id, provider),
+            )
+
+
+class ClientCache:
+    """Thread-safe LRU of built API service objects keyed by identity and credential version."""
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self.maxsize = maxsize or int(os.getenv("MCP_CLIENT_CACHE_SIZE") or "32")
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+        # Build outside the lock: discovery/auth can take a while.
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                _, evicted = self._items.popitem(last=False)
+                self.evictions += 1
+                # Services may own background work (e.g. the Gmail mirror sync thread)
+                if hasattr(evicted, "close"):
+                    evicted.close()
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# --- MCP server helpers ---
+_store: Optional[CredentialStore] = None
+
+
+def pop_identity(arguments: Dict[str, Any]) -> Identity:
+    """Removes the injected identity arguments and returns (tenant_id, user_id)."""
+    tenant_id = arguments.pop(TENANT_ARG, None) or DEFAULT_TENANT
+    user_id = arguments.pop(USER_ARG, None) or DEFAULT_USER
+    return tenant_id, user_id
+
+
+class AccountNotConnected(Exception):
+    pass
+
+
+def stored_credentials(identity: Identity, provider: str) -> Optional[Dict[str, Any]]:
+    """Credentials saved for this identity, or None if there are none."""
+    global _store
+    if _store is None:
+        _store = CredentialStore.open_existing()
+        if _store is None:
+            return None
+    return _store.get(identity[0], identity[1], provider)
+
+
+def require_credentials(identity: Identity, provider: str, account_name: str) -> Optional[Dict[str, Any]]:
+    """Credentials for this identity; None means the env-configured account.
+
+    Only the default identity may use the env-configured account (the operator's). Any
+    other user without stored credentials gets AccountNotConnected, never the operator's
+    mailbox or calendar.
+    """
+    creds = stored_credentials(identity, provider)
+    if creds is None and identity != (DEFAULT_TENANT, DEFAULT_USER):
+        raise AccountNotConnected(f"No {account_name} account is connected for this user. "
+                                  f"Ask them to connect their {account_name} account first.")
+    return creds
@@ -2,8 +2,10 @@ import asyncio
 import os
 import json
 import base64
+import time
 import logging
-from typing import List, Dict, Optional
+import threading
+from typing import Callable, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from email.mime.text import MIMEText
 
@@ -13,6 +15,7 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
 
 # MCP Server Imports
 from mcp.server.lowlevel import Server, NotificationOptions
@@ -20,6 +23,17 @@ from mcp.server.models import InitializationOptions
 import mcp.server.stdio
 from mcp import types as mcp_types
 
+from credential_store import (DEFAULT_TENANT, DEFAULT_USER, AccountNotConnected, ClientCache, Identity,
+                              pop_identity, require_credentials)
+from token_broker import TokenSpec, default_broker, google_token_uri
+from result_serializer import default_serializer, serialize
+from gmail_mirror import GmailMirror, mirror_enabled
+from gmail_outbox import GmailOutbox, pending_owners
+from push_channels import GMAIL, default_listener, push_cache_ttl
+from gmail_mime import (AttachmentSpool, attachment_parts, extract_body, header_text, max_body_chars,
+                        message_record, resolve_attachment, send_attachment_directory, spool_directory,
+                        upload_settings, write_message)
+
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -27,42 +41,114 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+BATCH_MODIFY_LIMIT = 1000 # max IDs per users.messages.batchModify request
+
+# Upload progress callback: (bytes sent, total bytes)
+Progress = Callable[[int, int], None]
+
+
+def outbox_enabled() -> bool:
+    return os.getenv('GMAIL_OUTBOX_ENABLED', '1') not in ('0', 'false', 'no')
+
+
+# Outbox workers by mailbox; they outlive the GmailService that opened them (see gmail_outbox.py)
+outboxes: Dict[str, GmailOutbox] = {}
+outboxes_lock = threading.Lock()
 
 # --- Gmail Service ---
 class GmailService:
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, creds: Optional[Dict] = None,
+                 identity: Identity = (DEFAULT_TENANT, DEFAULT_USER)):
         self.creds = None
+        # Per-user credentials from the credential store; env credentials when None
+        self.stored_creds = creds or {}
         self.service = None
+        # Optional API root (e.g. the local fake_apis server); defaults to googleapis.com
+        self.base_url = (base_url or os.getenv('GMAIL_API_BASE_URL') or '').rstrip('/') or None
+        self.mirror = None
+        self.outbox = None
+        self.identity = identity
+        self.spool = None
+        self._on_push = None
         self._authenticate()
+        if mirror_enabled():
+            # Local metadata mirror kept current in the background; serves common reads
+            self.mirror = GmailMirror(self._build_service, mailbox_key=self.mailbox_key)
+            self.mirror.start()
+        if outbox_enabled():
+            # Durable send queue; its worker also resumes messages left over from earlier runs
+            with outboxes_lock:
+                self.outbox = outboxes.get(self.mailbox_key)
+                if self.outbox is None:
+                    self.outbox = outboxes[self.mailbox_key] = GmailOutbox(
+                        self._build_service, self._send, mailbox_key=self.mailbox_key,
+                        on_sent=self._mailbox_changed, owner=identity)
+                    self.outbox.start()
+                else:
+                    self.outbox.rebind(self._build_service, self._send, self._mailbox_changed)
+        if self.mirror and os.getenv('GMAIL_PUSH_TOPIC'):
+            # Pub/Sub notifications (relayed by server.py) wake the mirror sync instead of the next poll
+            self.mirror.push_staleness = push_cache_ttl()
+            self._on_push = lambda data: self.mirror.notify(int(data.get('history_id') or 0))
+            self.mirror.push = default_listener().watch(GMAIL, self.spec.key, self.watch_mailbox, None,
+                                                        self._on_push)
 
     def _authenticate(self):
-        """Authenticates with Gmail API using credentials from env."""
+        """Authenticates with Gmail API using stored per-user credentials or env."""
         creds = None
         
-        client_id = os.getenv('GMAIL_CLIENT_ID')
-        client_secret = os.getenv('GMAIL_CLIENT_SECRET')
-        refresh_token = os.getenv('GMAIL_REFRESH_TOKEN')
+        client_id = self.stored_creds.get('client_id') or os.getenv('GMAIL_CLIENT_ID')
+        client_secret = self.stored_creds.get('client_secret') or os.getenv('GMAIL_CLIENT_SECRET')
+        refresh_token = self.stored_creds.get('refresh_token') or os.getenv('GMAIL_REFRESH_TOKEN')
 
         if client_id and client_secret and refresh_token:
             logger.info("Using credentials from environment variables.")
-            creds = Credentials(
-                None,
-                refresh_token=refresh_token,
-                token_uri="https://oauth2.googleapis.com/token",
-                client_id=client_id,
-                client_secret=client_secret,
-                scopes=SCOPES
-            )
+            # Access tokens come from the shared broker cache rather than a refresh per process
+            self.spec = TokenSpec(refresh_token, client_id, client_secret, google_token_uri(self.base_url))
+            creds = default_broker().credentials(self.spec, scopes=SCOPES)
         else:
             logger.error("Missing GMAIL_CLIENT_ID, GMAIL_CLIENT_SECRET, or GMAIL_REFRESH_TOKEN in .env")
             raise RuntimeError("Missing credentials in environment variables.")
 
         self.creds = creds
-        self.service = build('gmail', 'v1', credentials=self.creds)
+        self.service = self._build_service()
+        # The mirror and outbox files are keyed by the mailbox address, which survives re-authorization
+        # (a new refresh token), so pending sends and the synced mail carry over.
+        address = self.service.users().getProfile(userId='me').execute()['emailAddress']
+        self.mailbox_key = f"{self.base_url or 'gmail'}:{address.lower()}"
         logger.info("Gmail API Service initialized.")
 
+    def _build_service(self):
+        client_options = {'api_endpoint': f"{self.base_url}/"} if self.base_url else None
+        return build('gmail', 'v1', credentials=self.creds, client_options=client_options)
+
+    def _mailbox_changed(self):
+        """Called after writes so the next mirrored read syncs first (read-your-writes)."""
+        if self.mirror:
+            self.mirror.invalidate()
+
+    def watch_mailbox(self) -> Dict:
+        """Calls users.watch for GMAIL_PUSH_TOPIC (on the push listener thread); renewing calls it again."""
+        service = self._build_service()
+        address = service.users().getProfile(userId='me').execute()['emailAddress']
+        response = service.users().watch(userId='me', body={'topicName': os.getenv('GMAIL_PUSH_TOPIC')}).execute()
+        # Watches last 7 days, but Google recommends renewing daily
+        expiration = min(int(response['expiration']) / 1000, time.time() + 86400)
+        return {'channel_id': f"gmail:{address}", 'address': address, 'expiration': expiration}
+
+    def close(self):
+        # The outbox worker keeps running (see outboxes), so queued mail is still delivered
+        if self.mirror and self.mirror.push:
+            default_listener().unwatch(self.mirror.push, self._on_push)
+        if self.mirror:
+            self.mirror.close()
+
     def list_threads(self, query: str = '', limit: int = 5) -> List[Dict]:
         """Lists threads matching the query."""
+        if self.mirror:
+            local = self.mirror.search(query, limit) if query else self.mirror.list_threads(limit)
+            if local is not None:
+                return local
         try:
             results = self.service.users().threads().list(userId='me', q=query, maxResults=limit).execute()
             threads = results.get('threads', [])
@@ -93,14 +179,20 @@ class GmailService:
 
     def read_thread(self, thread_id: str) -> Dict:
         """Reads a full thread."""
+        if self.mirror:
+            local = self.mirror.read_thread(thread_id)
+            if local is not None:
+                return local
         try:
-            thread = self.service.users().threads().get(userId='me', id=thread_id).execute()
+            thread = self.service.users().threads().get(userId='me', id=thread_id, format='full').execute()
             messages = []
             for msg in thread.get('messages', []):
-                headers = msg['payload']['headers']
-                sender = next((h['value'] for h in headers if h['name'] == 'From'), '(Unknown)')
-                body = msg.get('snippet', '') # Simplified for this example
-                messages.append(f"From: {sender}\nBody: {body}\n---")
+                payload = msg['payload']
+                sender = next((h['value'] for h in payload['headers'] if h['name'] == 'From'), '(Unknown)')
+                # Only the capped text parts are decoded; attachments are listed, not fetched
+                body, truncated = extract_body(payload)
+                messages.append(message_record(msg['id'], sender, body or msg.get('snippet', ''), truncated,
+                                               attachment_parts(payload)))
             
             return {
                 'id': thread['id'],
@@ -110,77 +202,164 @@ class GmailService:
             logger.error(f"An error occurred in read_thread: {error}")
             return {'error': str(error)}
 
-    def create_draft(self, to: str, subject: str, body: str) -> Dict:
-        """Creates a draft email."""
+    def get_attachment(self, message_id: str, part_id: str) -> Dict:
+        """Downloads one attachment to the local spool and returns its metadata and path."""
         try:
-            message = MIMEText(body)
-            message['to'] = to
-            message['subject'] = subject
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-            
-            draft = self.service.users().drafts().create(
-                userId='me',
-                body={'message': {'raw': raw_message}}
-            ).execute()
+            if self.spool is None:
+                self.spool = AttachmentSpool(spool_directory(self.identity))
+            return self.spool.fetch(self.service, self.creds, message_id, part_id)
+        except Exception as error:
+            logger.error(f"An error occurred in get_attachment: {error}")
+            return {'error': str(error)}
+
+    def create_draft(self, to: str, subject: str, body: str, attachments: List[str] = None,
+                     progress: Optional[Progress] = None) -> Dict:
+        """Creates a draft email, optionally with attachments from local paths."""
+        try:
+            service = self._build_service() if attachments else self.service
+            kwargs, upload_path = self._compose(service, {'to': to, 'subject': subject, 'body': body,
+                                                          'attachments': attachments or []})
+            try:
+                media = kwargs.pop('media_body', None)
+                draft_body = {'message': kwargs['body']} if not media else {}
+                draft = self._execute(service.users().drafts().create(
+                    userId='me', body=draft_body, media_body=media), progress)
+            finally:
+                self._discard(kwargs, upload_path, media)
             
+            self._mailbox_changed()
             return {'id': draft['id'], 'status': 'Draft created'}
         except Exception as error:
              return {'error': str(error)}
 
-    def send_email(self, to: str, subject: str, body: str) -> Dict:
-        """Sends an email immediately."""
-        try:
-            message = MIMEText(body)
-            message['to'] = to
-            message['subject'] = subject
+    @staticmethod
+    def _envelope(service, request: Dict) -> Tuple[Dict[str, str], Optional[str]]:
+        """Headers and threadId for a send_email or reply_to_thread request."""
+        thread_id = request.get('thread_id')
+        if not thread_id:
+            return {'To': request['to'], 'Subject': request['subject']}, None
+
+        # Get last message to find headers
+        thread = service.users().threads().get(userId='me', id=thread_id).execute()
+        messages = thread['messages']
+        last_msg = messages[-1]
+        headers = last_msg['payload']['headers']
+
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+        sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
+
+        if not subject.lower().startswith('re:'):
+            subject = f"Re: {subject}"
+
+        return {'To': sender, 'Subject': subject, 'In-Reply-To': last_msg['id'],
+                'References': last_msg.get('threadId')}, thread_id
+
+    def _compose(self, service, request: Dict) -> Tuple[Dict, Optional[str]]:
+        """API arguments for sending a request, plus the temp file backing its upload (if any).
+
+        Plain messages go inline as 'raw'. Messages with attachments are written to a
+        temp file and sent as a media upload, resumable above the configured threshold.
+        """
+        headers, thread_id = self._envelope(service, request)
+        metadata = {'threadId': thread_id} if thread_id else {}
+        if not request.get('attachments'):
+            message = MIMEText(request['body'])
+            for name, value in headers.items():
+                message[name] = header_text(value)
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+            return {'body': {**metadata, 'raw': raw_message}}, None
+
+        path, size = write_message(headers, request['body'], request['attachments'],
+                                   send_attachment_directory(self.identity))
+        _, threshold, chunk_size = upload_settings()
+        media = MediaFileUpload(path, mimetype='message/rfc822', resumable=size > threshold, chunksize=chunk_size)
+        return {'body': metadata, 'media_body': media}, path
+
+    def _execute(self, request, progress: Optional[Progress] = None) -> Dict:
+        """Executes an API request, uploading resumable media chunk by chunk with progress."""
+        if self.base_url and request.uri.startswith('https:') and self.base_url.startswith('http:'):
+            # googleapiclient keeps https for upload URLs when api_endpoint is overridden
+            request.uri = 'http:' + request.uri[len('https:'):]
+        if not request.resumable:
+            return request.execute()
+        response = None
+        while response is None:
+            status, response = request.next_chunk(num_retries=3)
+            if status and progress:
+                progress(status.resumable_progress, status.total_size)
+        if progress:
+            progress(request.resumable.size(), request.resumable.size())
+        return response
+
+    @staticmethod
+    def _discard(kwargs: Dict, upload_path: Optional[str], media=None):
+        media = media or kwargs.get('media_body')
+        if media is not None:
+            media.stream().close()
+        if upload_path:
+            os.remove(upload_path)
+
+    def _send(self, service, request: Dict, progress: Optional[Progress] = None) -> Dict:
+        """Sends a send_email or reply_to_thread request (also used by the outbox worker)."""
+        kwargs, upload_path = self._compose(service, request)
+        try:
+            return self._execute(service.users().messages().send(userId='me', **kwargs), progress)
+        finally:
+            self._discard(kwargs, upload_path)
+
+    def _queue(self, request: Dict) -> Dict:
+        if not self.outbox:
+            return {'error': 'The outbox is disabled (GMAIL_OUTBOX_ENABLED=0); send without queue.'}
+        return self.outbox.enqueue(request)
+
+    def send_email(self, to: str, subject: str, body: str, queue: bool = False, attachments: List[str] = None,
+                   progress: Optional[Progress] = None) -> Dict:
+        """Sends an email immediately, or queues it in the outbox and returns a handle."""
+        try:
+            attachment_dir = send_attachment_directory(self.identity)
+            attachments = [resolve_attachment(path, attachment_dir) for path in attachments or []]
+        except ValueError as error:
+            return {'error': str(error)}
+        request = {'to': to, 'subject': subject, 'body': body, 'attachments': attachments}
+        if queue:
+            return self._queue(request)
+        try:
+            # Uploads get their own API client so call_tool can run them off the event loop
+            service = self._build_service() if attachments else self.service
+            sent_message = self._send(service, request, progress)
             
-            sent_message = self.service.users().messages().send(
-                userId='me',
-                body={'raw': raw_message}
-            ).execute()
-            
+            self._mailbox_changed()
             return {'id': sent_message['id'], 'status': 'Email sent'}
         except Exception as error:
              return {'error': str(error)}
 
-    def reply_to_thread(self, thread_id: str, body: str) -> Dict:
-        """Replies to an email thread."""
+    def reply_to_thread(self, thread_id: str, body: str, queue: bool = False) -> Dict:
+        """Replies to an email thread, or queues the reply in the outbox."""
+        request = {'thread_id': thread_id, 'body': body}
+        if queue:
+            return self._queue(request)
         try:
-            # Get last message to find headers
-            thread = self.service.users().threads().get(userId='me', id=thread_id).execute()
-            messages = thread['messages']
-            last_msg = messages[-1]
-            headers = last_msg['payload']['headers']
-            
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
-            
-            if not subject.lower().startswith('re:'):
-                subject = f"Re: {subject}"
-
-            message = MIMEText(body)
-            message['to'] = sender
-            message['subject'] = subject
-            message['In-Reply-To'] = last_msg['id']
-            message['References'] = last_msg.get('threadId')
-
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-            
-            sent_message = self.service.users().messages().send(
-                userId='me',
-                body={'raw': raw_message, 'threadId': thread_id}
-            ).execute()
+            sent_message = self._send(self.service, request)
             
+            self._mailbox_changed()
             return {'id': sent_message['id'], 'threadId': sent_message['threadId'], 'status': 'Reply sent'}
         except Exception as e:
             return {'error': str(e)}
 
+    def get_send_status(self, outbox_id: Optional[str] = None, limit: int = 10):
+        """Delivery status of one queued message, or of the most recent ones."""
+        if not self.outbox:
+            return {'error': 'The outbox is disabled (GMAIL_OUTBOX_ENABLED=0).'}
+        if not outbox_id:
+            return self.outbox.recent(limit)
+        return self.outbox.status(outbox_id) or {'error': f"Unknown outbox_id {outbox_id}"}
+
     def add_label(self, message_id: str, label_id: str) -> Dict:
         """Adds a label to a message."""
         try:
             body = {'addLabelIds': [label_id]}
             message = self.service.users().messages().modify(userId='me', id=message_id, body=body).execute()
+            self._mailbox_changed()
             return {'id': message['id'], 'labels': message['labelIds'], 'status': 'Label added'}
         except Exception as e:
             return {'error': str(e)}
@@ -190,6 +369,7 @@ class GmailService:
         try:
             body = {'removeLabelIds': [label_id]}
             message = self.service.users().messages().modify(userId='me', id=message_id, body=body).execute()
+            self._mailbox_changed()
             return {'id': message['id'], 'labels': message['labelIds'], 'status': 'Label removed'}
         except Exception as e:
             return {'error': str(e)}
@@ -202,9 +382,92 @@ class GmailService:
         """Marks a message as unread."""
         return self.add_label(message_id, 'UNREAD')
 
+    def _thread_message_ids(self, thread_ids: List[str]) -> List[str]:
+        """Expands thread IDs to their message IDs (from the mirror when it has them all)."""
+        if self.mirror:
+            local = self.mirror.message_ids(thread_ids)
+            if local is not None:
+                return local
+        message_ids = []
+        for thread_id in thread_ids:
+            thread = self.service.users().threads().get(userId='me', id=thread_id, format='minimal').execute()
+            message_ids += [m['id'] for m in thread.get('messages', [])]
+        return message_ids
+
+    def bulk_modify_labels(self, message_ids: List[str] = None, thread_ids: List[str] = None,
+                           add_label_ids: List[str] = None, remove_label_ids: List[str] = None) -> Dict:
+        """Adds/removes labels on many messages with batchModify, BATCH_MODIFY_LIMIT IDs per request."""
+        if not (add_label_ids or remove_label_ids):
+            return {'error': 'Provide add_label_ids and/or remove_label_ids.'}
+        try:
+            ids = list(message_ids or [])
+            if thread_ids:
+                ids += self._thread_message_ids(thread_ids)
+        except Exception as e:
+            return {'error': f"Could not expand thread IDs: {e}"}
+        ids = list(dict.fromkeys(ids)) # de-duplicate, keep order
+        if not ids:
+            return {'error': 'No message IDs to modify.'}
+
+        body = {'addLabelIds': add_label_ids or [], 'removeLabelIds': remove_label_ids or []}
+        chunks = []
+        for start in range(0, len(ids), BATCH_MODIFY_LIMIT):
+            chunk = ids[start:start + BATCH_MODIFY_LIMIT]
+            try:
+                self.service.users().messages().batchModify(userId='me', body={**body, 'ids': chunk}).execute()
+                chunks.append({'chunk': len(chunks) + 1, 'count': len(chunk), 'status': 'ok'})
+            except Exception as e:
+                chunks.append({'chunk': len(chunks) + 1, 'count': len(chunk), 'first_id': chunk[0], 'error': str(e)})
+        self._mailbox_changed()
+        modified = sum(c['count'] for c in chunks if c.get('status') == 'ok')
+        return {'modified': modified, 'requested': len(ids), 'chunks': chunks}
+
 # --- MCP Server Setup ---
 app = Server("gmail-mcp-server")
-gmail_service = None # Initialize later
+gmail_service = None # Initialize later (env credentials)
+gmail_clients = ClientCache() # Per-user services built from the credential store
+
+default_service_lock = threading.Lock()
+
+def get_gmail_service(arguments: dict) -> GmailService:
+    """Returns the service for the user the call was made for."""
+    return service_for(pop_identity(arguments))
+
+def service_for(identity: Identity) -> GmailService:
+    global gmail_service
+    creds = require_credentials(identity, "google", "Google")
+    if creds:
+        return gmail_clients.get((identity, creds["version"]), lambda: GmailService(creds=creds, identity=identity))
+    with default_service_lock:
+        if not gmail_service:
+            gmail_service = GmailService()
+    return gmail_service
+
+def resume_outboxes():
+    """Starts delivery for every outbox with pending mail, e.g. left by an earlier run."""
+    if not outbox_enabled():
+        return
+    for identity in pending_owners():
+        try:
+            service_for(identity)
+            logger.info(f"Resumed the outbox of {identity[0]}/{identity[1]}")
+        except Exception as e:
+            logger.warning(f"Could not resume the outbox of {identity[0]}/{identity[1]}: {e}")
+
+def progress_reporter() -> Optional[Progress]:
+    """Forwards upload progress as MCP progress notifications, if the client sent a progress token."""
+    ctx = app.request_context
+    token = ctx.meta.progressToken if ctx.meta else None
+    if token is None:
+        return None
+    loop = asyncio.get_running_loop()
+
+    def report(sent: int, total: int):
+        asyncio.run_coroutine_threadsafe(
+            ctx.session.send_progress_notification(token, sent, total, message=f"Uploaded {sent} of {total} bytes"),
+            loop
+        )
+    return report
 
 @app.list_tools()
 async def list_tools() -> list[mcp_types.Tool]:
@@ -231,6 +494,18 @@ async def list_tools() -> list[mcp_types.Tool]:
                 "required": ["thread_id"]
             }
         ),
+        mcp_types.Tool(
+            name="get_attachment",
+            description="Download an attachment listed by read_thread. Returns its file path and metadata, not the content.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "message_id": {"type": "string", "description": "Message ID shown by read_thread."},
+                    "part_id": {"type": "string", "description": "Attachment part_id shown by read_thread."}
+                },
+                "required": ["message_id", "part_id"]
+            }
+        ),
         mcp_types.Tool(
             name="create_draft",
             description="Create a draft email.",
@@ -239,20 +514,23 @@ async def list_tools() -> list[mcp_types.Tool]:
                 "properties": {
                     "to": {"type": "string", "description": "Recipient email address."},
                     "subject": {"type": "string", "description": "Email subject."},
-                    "body": {"type": "string", "description": "Email body content."}
+                    "body": {"type": "string", "description": "Email body content."},
+                    "attachments": {"type": "array", "items": {"type": "string"}, "description": "Files to attach, inside the user's attachment directory (where get_attachment saves files)."}
                 },
                 "required": ["to", "subject", "body"]
             }
         ),
         mcp_types.Tool(
             name="send_email",
-            description="Send an email immediately.",
+            description="Send an email immediately, or queue it for background delivery.",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "to": {"type": "string", "description": "Recipient email address."},
                     "subject": {"type": "string", "description": "Email subject."},
-                    "body": {"type": "string", "description": "Email body content."}
+                    "body": {"type": "string", "description": "Email body content."},
+                    "queue": {"type": "boolean", "description": "Queue and return an outbox_id at once (default false)."},
+                    "attachments": {"type": "array", "items": {"type": "string"}, "description": "Files to attach, inside the user's attachment directory (where get_attachment saves files)."}
                 },
                 "required": ["to", "subject", "body"]
             }
@@ -264,11 +542,23 @@ async def list_tools() -> list[mcp_types.Tool]:
                 "type": "object",
                 "properties": {
                     "thread_id": {"type": "string", "description": "The ID of the thread to reply to."},
-                    "body": {"type": "string", "description": "The content of the reply."}
+                    "body": {"type": "string", "description": "The content of the reply."},
+                    "queue": {"type": "boolean", "description": "Queue and return an outbox_id at once (default false)."}
                 },
                 "required": ["thread_id", "body"]
             }
         ),
+        mcp_types.Tool(
+            name="get_send_status",
+            description="Delivery status of a queued email (by outbox_id), or of the most recent queued emails.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "outbox_id": {"type": "string", "description": "Handle returned by a queued send."},
+                    "limit": {"type": "integer", "description": "How many recent entries without outbox_id (default 10)."}
+                }
+            }
+        ),
         mcp_types.Tool(
             name="add_label",
             description="Add a label to a message (e.g., STARRED, TRASH, IMPORTANT). To Archive, remove INBOX label.",
@@ -314,81 +604,176 @@ async def list_tools() -> list[mcp_types.Tool]:
                 },
                 "required": ["message_id"]
             }
+        ),
+        mcp_types.Tool(
+            name="bulk_modify_labels",
+            description=(
+                "Add/remove labels on many messages in one call (use instead of repeating add_label, remove_label "
+                "or mark_as_read). Mark read: remove UNREAD. Archive: remove INBOX. Thread IDs apply to every "
+                "message in the thread."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "message_ids": {"type": "array", "items": {"type": "string"}, "description": "Message IDs."},
+                    "thread_ids": {"type": "array", "items": {"type": "string"}, "description": "Thread IDs."},
+                    "add_label_ids": {"type": "array", "items": {"type": "string"}, "description": "Labels to add."},
+                    "remove_label_ids": {"type": "array", "items": {"type": "string"}, "description": "Labels to remove."}
+                }
+            }
+        ),
+        mcp_types.Tool(
+            name="get_diagnostics",
+            description="Result size, mirror, outbox and client statistics for this Gmail server.",
+            inputSchema={"type": "object", "properties": {}}
         )
     ]
 
+# Tools the mirror can answer; call_tool brings a stale mirror up to date before them
+MIRRORED_TOOLS = ("list_emails", "read_thread", "bulk_modify_labels")
+
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[mcp_types.Content]:
-    global gmail_service
-    if not gmail_service:
-        try:
-            gmail_service = GmailService()
-        except Exception as e:
-             return [mcp_types.TextContent(type="text", text=f"Error initializing Gmail Service: {str(e)}")]
+    try:
+        service = get_gmail_service(arguments)
+    except AccountNotConnected as e:
+        return [mcp_types.TextContent(type="text", text=str(e))]
+    except Exception as e:
+         return [mcp_types.TextContent(type="text", text=f"Error initializing Gmail Service: {str(e)}")]
+
+    mirror = getattr(service, "mirror", None)
+    if mirror and name in MIRRORED_TOOLS:
+        # A stale mirror syncs (users.history.list) in a worker thread, not on the event loop
+        await asyncio.to_thread(mirror.refresh)
 
     if name == "list_emails":
         query = arguments.get("query", "")
         limit = arguments.get("limit", 5)
-        threads = gmail_service.list_threads(query, limit)
-        return [mcp_types.TextContent(type="text", text=json.dumps(threads, indent=2))]
+        threads = service.list_threads(query, limit)
+        return [mcp_types.TextContent(type="text", text=serialize(name, threads))]
 
     elif name == "read_thread":
         thread_id = arguments["thread_id"]
-        thread_data = gmail_service.read_thread(thread_id)
-        return [mcp_types.TextContent(type="text", text=json.dumps(thread_data, indent=2))]
+        thread_data = service.read_thread(thread_id)
+        # Bodies are already capped at GMAIL_READ_MAX_BODY_CHARS; the generic field cap would cut them shorter
+        return [mcp_types.TextContent(type="text", text=serialize(name, thread_data, max_field_chars=max_body_chars()))]
 
-    elif name == "create_draft":
-        result = gmail_service.create_draft(
-            arguments["to"],
-            arguments["subject"],
-            arguments["body"]
+    elif name == "get_attachment":
+        result = service.get_attachment(
+            arguments["message_id"],
+            str(arguments["part_id"])
         )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
+
+    elif name == "create_draft":
+        attachments = arguments.get("attachments") or []
+        if attachments:
+            # Uploads run in a worker thread so progress notifications can go out meanwhile
+            result = await asyncio.to_thread(
+                service.create_draft,
+                arguments["to"],
+                arguments["subject"],
+                arguments["body"],
+                attachments,
+                progress_reporter()
+            )
+        else:
+            result = service.create_draft(
+                arguments["to"],
+                arguments["subject"],
+                arguments["body"]
+            )
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     elif name == "send_email":
-        result = gmail_service.send_email(
-            arguments["to"],
-            arguments["subject"],
-            arguments["body"]
-        )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        attachments = arguments.get("attachments") or []
+        queue = bool(arguments.get("queue", False))
+        if attachments and not queue:
+            result = await asyncio.to_thread(
+                service.send_email,
+                arguments["to"],
+                arguments["subject"],
+                arguments["body"],
+                False,
+                attachments,
+                progress_reporter()
+            )
+        else:
+            result = service.send_email(
+                arguments["to"],
+                arguments["subject"],
+                arguments["body"],
+                queue,
+                attachments
+            )
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     elif name == "reply_to_thread":
-        result = gmail_service.reply_to_thread(
+        result = service.reply_to_thread(
             arguments["thread_id"],
-            arguments["body"]
+            arguments["body"],
+            bool(arguments.get("queue", False))
         )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
+
+    elif name == "get_send_status":
+        result = service.get_send_status(
+            arguments.get("outbox_id"),
+            arguments.get("limit", 10)
+        )
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     elif name == "add_label":
-        result = gmail_service.add_label(
+        result = service.add_label(
             arguments["message_id"],
             arguments["label_id"]
         )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     elif name == "remove_label":
-        result = gmail_service.remove_label(
+        result = service.remove_label(
             arguments["message_id"],
             arguments["label_id"]
         )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     elif name == "mark_as_read":
-        result = gmail_service.mark_as_read(
+        result = service.mark_as_read(
             arguments["message_id"]
         )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     elif name == "mark_as_unread":
-        result = gmail_service.mark_as_unread(
+        result = service.mark_as_unread(
             arguments["message_id"]
         )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
+
+    elif name == "bulk_modify_labels":
+        result = service.bulk_modify_labels(
+            arguments.get("message_ids"),
+            arguments.get("thread_ids"),
+            arguments.get("add_label_ids"),
+            arguments.get("remove_label_ids")
+        )
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
+
+    elif name == "get_diagnostics":
+        outbox = getattr(service, "outbox", None)
+        result = {
+            "result_sizes": default_serializer.stats(),
+            "clients": gmail_clients.stats(),
+            "mirror": mirror.stats if mirror else None,
+            "outbox": dict(outbox.stats, pending=outbox.pending()) if outbox else None,
+            "outboxes_running": len(outboxes),
+        }
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     return [mcp_types.TextContent(type="text", text="Tool not found")]
 
 async def run():
+    # Off the event loop: building a service authenticates and calls Gmail
+    threading.Thread(target=resume_outboxes, name="gmail-outbox-resume", daemon=True).start()
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
         await app.run(
             read_stream,
@@ -0,0 +1,322 @@
+import base64
+import hashlib
+import html
+import itertools
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import time
+import uuid
+from email.header import Header
+from email.utils import encode_rfc2231
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from google.auth.transport.requests import AuthorizedSession
+
+from credential_store import Identity, private_dir
+
+# MIME handling for Gmail format=full messages with bounded memory.
+#
+# extract_body walks the part tree and decodes only as much of the text/plain parts
+# (or, failing those, text/html stripped to text) as the character cap needs; the
+# rest of the base64 payload is never decoded. Attachments are only described
+# (filename, type, size, part_id); AttachmentSpool fetches one on request with
+# messages.attachments.get, streaming the response and decoding it to a spool file
+# chunk by chunk, so the agent sees metadata and a local path, never the bytes.
+#
+# Env:
+#   GMAIL_READ_MAX_BODY_CHARS     - body text returned per message by read_thread (default 4000)
+#   GMAIL_ATTACHMENT_DIR          - spool root; each identity gets a private (0700) subdirectory (default <tmp>/gmail-attachments)
+#   GMAIL_ATTACHMENT_TTL_SECONDS  - spooled files older than this are removed (default 3600)
+#
+# For sending, write_message builds a multipart/mixed message in a temp file,
+# base64-encoding attachments from disk block by block, for upload with
+# MediaFileUpload (see GmailService._compose). Only regular files inside the send
+# attachment directory can be attached (resolve_attachment): paths with "..", symlinks
+# and anything outside it are refused. By default that is the user's own spool
+# directory, so one user can't send out another user's downloads. CR and LF are
+# removed from header values, so a recipient or subject can't add headers such as Bcc.
+#
+#   GMAIL_SEND_ATTACHMENT_DIR        - directory attachments are sent from, for every user (default: the user's spool directory)
+#   GMAIL_MAX_MESSAGE_BYTES          - largest message accepted for upload (default 35 MB, Gmail's limit)
+#   GMAIL_RESUMABLE_THRESHOLD_BYTES  - messages above this use a resumable upload (default 5 MiB)
+#   GMAIL_UPLOAD_CHUNK_BYTES         - resumable upload chunk size, a multiple of 256 KiB (default 5 MiB)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_BYTES = 256 * 1024  # attachment response bytes read (and decoded) at a time
+DATA_FIELD_RE = re.compile(rb'"data"\s*:\s*"')
+# Stripping tags shrinks HTML a lot; decode this many bytes of markup per character wanted.
+HTML_OVERHEAD = 4
+
+
+ENCODE_BLOCK = 57 * 1024  # raw bytes per read when encoding; 57 bytes -> one 76-char base64 line
+UPLOAD_CHUNK_UNIT = 256 * 1024  # resumable upload chunks must be multiples of this
+
+
+def spool_directory(identity: Identity) -> str:
+    """The identity's private spool directory (created 0700, as is the spool root)."""
+    root = private_dir(os.getenv("GMAIL_ATTACHMENT_DIR") or os.path.join(tempfile.gettempdir(), "gmail-attachments"))
+    digest = hashlib.sha256("\0".join(identity).encode()).hexdigest()[:16]
+    return private_dir(os.path.join(root, digest))
+
+
+def send_attachment_directory(identity: Identity) -> str:
+    return os.getenv("GMAIL_SEND_ATTACHMENT_DIR") or spool_directory(identity)
+
+
+def max_body_chars() -> int:
+    return int(os.getenv("GMAIL_READ_MAX_BODY_CHARS") or "4000")
+
+
+def upload_settings() -> Tuple[int, int, int]:
+    """(max message bytes, resumable threshold, chunk size) for media uploads."""
+    max_bytes = int(os.getenv("GMAIL_MAX_MESSAGE_BYTES") or str(35 * 1000 * 1000))
+    threshold = int(os.getenv("GMAIL_RESUMABLE_THRESHOLD_BYTES") or str(5 * 1024 * 1024))
+    chunk = int(os.getenv("GMAIL_UPLOAD_CHUNK_BYTES") or str(5 * 1024 * 1024))
+    return max_bytes, threshold, max(UPLOAD_CHUNK_UNIT, chunk // UPLOAD_CHUNK_UNIT * UPLOAD_CHUNK_UNIT)
+
+
+def walk_parts(payload: Dict) -> Iterator[Dict]:
+    """Every part of a message payload, depth-first in document order."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        yield part
+        stack.extend(reversed(part.get("parts", [])))
+
+
+def is_attachment(part: Dict) -> bool:
+    return bool(part.get("filename")) or "attachmentId" in part.get("body", {})
+
+
+def decode_prefix(data: str, max_bytes: int) -> Tuple[bytes, bool]:
+    """Decodes at most max_bytes of base64url data; returns (bytes, truncated)."""
+    needed = -(-max_bytes // 3) * 4
+    chunk = data[:needed]
+    raw = base64.urlsafe_b64decode(chunk + "=" * (-len(chunk) % 4))
+    return raw[:max_bytes], len(data) > needed or len(raw) > max_bytes
+
+
+def html_to_text(markup: str) -> str:
+    text = re.sub(r"<(script|style)[^>]*>.*?</\1>|<[^>]+>", " ", markup, flags=re.S | re.I)
+    return re.sub(r"\s+", " ", html.unescape(text)).strip()
+
+
+def extract_body(payload: Dict, max_chars: Optional[int] = None) -> Tuple[str, bool]:
+    """Plain-text body of a message, capped at max_chars; returns (text, truncated)."""
+    max_chars = max_chars or max_body_chars()
+    text_parts = [p for p in walk_parts(payload)
+                  if not is_attachment(p) and p.get("body", {}).get("data")]
+    plain = [p for p in text_parts if p.get("mimeType") == "text/plain"]
+    markup = [p for p in text_parts if p.get("mimeType") == "text/html"]
+
+    pieces: List[str] = []
+    remaining, truncated = max_chars, False
+    for part in plain or markup:
+        if remaining <= 0:
+            truncated = True
+            break
+        # UTF-8 is at most 4 bytes per character
+        budget = remaining * 4 if plain else remaining * 4 * HTML_OVERHEAD
+        raw, cut = decode_prefix(part["body"]["data"], budget)
+        text = raw.decode("utf-8", "ignore" if cut else "replace")
+        if not plain:
+            text = html_to_text(text)
+        if len(text) > remaining:
+            text, cut = text[:remaining], True
+        pieces.append(text)
+        remaining -= len(text)
+        truncated = truncated or cut
+    return "\n".join(pieces), truncated
+
+
+def attachment_parts(payload: Dict) -> List[Dict]:
+    """Metadata of a message's attachments; part_id identifies one for get_attachment."""
+    return [{
+        'part_id': part.get('partId', ''),
+        'filename': part.get('filename') or '(unnamed)',
+        'mime_type': part.get('mimeType', 'application/octet-stream'),
+        'size': part.get('body', {}).get('size', 0),
+    } for part in walk_parts(payload) if is_attachment(part)]
+
+
+def message_record(message_id: str, sender: str, body: str, truncated: bool, attachments: List[Dict]) -> Dict:
+    """One message as read_thread presents it to the agent.
+
+    The attachment list is a separate field, so shortening a long body never drops a part_id.
+    """
+    record = {'id': message_id, 'from': sender, 'body': body + (" …[truncated]" if truncated else "")}
+    if attachments:
+        record['attachments'] = attachments
+    return record
+
+
+def stream_data_field(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yields the "data" string of a streamed attachments.get JSON response, piece by piece.
+
+    Base64url contains no characters JSON escapes, so the value ends at the next quote.
+    """
+    chunks = iter(chunks)
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        match = DATA_FIELD_RE.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        buffer = buffer[-32:]  # enough to find the key split across two chunks
+    else:
+        return
+    for chunk in itertools.chain([buffer], chunks):
+        end = chunk.find(b'"')
+        if end >= 0:
+            yield chunk[:end]
+            return
+        yield chunk
+
+
+class AttachmentSpool:
+    """Downloads attachments to a private temp directory, decoding in chunks."""
+
+    def __init__(self, directory: str):
+        self.directory = private_dir(directory)
+        self.ttl = float(os.getenv("GMAIL_ATTACHMENT_TTL_SECONDS") or "3600")
+
+    def fetch(self, service, creds, message_id: str, part_id: str) -> Dict:
+        """Spools one attachment and returns its metadata and local path."""
+        self.cleanup()
+        # Attachment IDs are not stable across fetches, so look the part up fresh.
+        message = service.users().messages().get(userId='me', id=message_id, format='full').execute()
+        part = next((p for p in walk_parts(message.get('payload', {}))
+                     if p.get('partId') == part_id and is_attachment(p)), None)
+        if part is None:
+            return {'error': f"Message {message_id} has no attachment with part_id {part_id}"}
+        body = part.get('body', {})
+        if body.get('data') is not None:
+            encoded = iter([body['data'].encode('ascii')])
+        else:
+            # Stream the response and decode the "data" field as it arrives, instead of
+            # holding the JSON, the base64 text and the decoded bytes in memory at once.
+            request = service.users().messages().attachments().get(
+                userId='me', messageId=message_id, id=body['attachmentId'])
+            response = AuthorizedSession(creds).get(request.uri, stream=True)
+            response.raise_for_status()
+            encoded = stream_data_field(response.iter_content(CHUNK_BYTES))
+
+        filename = os.path.basename(part.get('filename') or 'attachment')
+        path = os.path.join(self.directory, f"{message_id}-{part_id}-{filename}")
+        digest, size, carry = hashlib.sha256(), 0, b""
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            for chunk in encoded:
+                chunk = carry + chunk
+                usable = len(chunk) - len(chunk) % 4
+                carry = chunk[usable:]
+                raw = base64.urlsafe_b64decode(chunk[:usable])
+                digest.update(raw)
+                size += len(raw)
+                f.write(raw)
+            if carry:
+                raw = base64.urlsafe_b64decode(carry + b"=" * (-len(carry) % 4))
+                digest.update(raw)
+                size += len(raw)
+                f.write(raw)
+        logger.info(f"Spooled attachment {filename} ({size} bytes) to {path}")
+        return {'message_id': message_id, 'part_id': part_id, 'filename': filename,
+                'mime_type': part.get('mimeType'), 'size': size, 'sha256': digest.hexdigest(), 'path': path}
+
+    def cleanup(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+
+# --- Sending ---
+def header_text(value: str) -> str:
+    """A header value with CR/LF removed, so it can't start another header."""
+    return " ".join(value.splitlines()).strip()
+
+
+def _header_value(value: str) -> str:
+    value = header_text(value)
+    return value if value.isascii() else Header(value, "utf-8").encode()
+
+
+def resolve_attachment(path: str, directory: str) -> str:
+    """Real path of an attachment, which must be a regular file inside the send attachment directory.
+
+    Relative paths are taken relative to that directory. Raises ValueError for paths with
+    "..", symlinks, paths outside the directory and missing files.
+    """
+    candidate = os.path.join(directory, path)
+    if ".." in candidate.replace(os.sep, "/").split("/"):
+        raise ValueError(f"Attachment path may not contain '..': {path}")
+    absolute, root = os.path.abspath(candidate), os.path.realpath(directory)
+    for base in (os.path.abspath(directory), root):
+        if os.path.commonpath([base, absolute]) == base:
+            expected = os.path.join(root, os.path.relpath(absolute, base))
+            break
+    else:
+        raise ValueError(f"Attachment is outside the attachment directory {directory}: {path}")
+    real = os.path.realpath(absolute)
+    if real != os.path.normpath(expected):
+        raise ValueError(f"Attachment may not be a symlink: {path}")
+    if not os.path.isfile(real):
+        raise ValueError(f"Attachment not found: {path}")
+    return real
+
+
+def _filename_param(filename: str) -> str:
+    return f'filename="{filename}"' if filename.isascii() else f"filename*={encode_rfc2231(filename, 'utf-8')}"
+
+
+def write_message(headers: Dict[str, str], body: str, attachments: List[str],
+                  attachment_dir: str) -> Tuple[str, int]:
+    """Writes a multipart/mixed message with the given attachments to a temp file.
+
+    Returns (path, size). Attachments are read and encoded ENCODE_BLOCK bytes at a
+    time. Raises ValueError if an attachment is refused by resolve_attachment or the
+    message would be too large.
+    """
+    max_bytes = upload_settings()[0]
+    attachments = [resolve_attachment(path, attachment_dir) for path in attachments]
+    # base64 grows content by 4/3, plus line breaks
+    estimate = len(body.encode()) + sum(os.path.getsize(p) * 4 // 3 * 78 // 76 for p in attachments)
+    if estimate > max_bytes:
+        raise ValueError(f"Message would be about {estimate} bytes; the limit is {max_bytes}")
+
+    boundary = f"=_{uuid.uuid4().hex}"
+    fd, out_path = tempfile.mkstemp(prefix="gmail-upload-", suffix=".eml")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            def write(text: str):
+                out.write(text.encode("ascii"))
+
+            for name, value in headers.items():
+                write(f"{name}: {_header_value(value)}\n")
+            write(f'MIME-Version: 1.0\nContent-Type: multipart/mixed; boundary="{boundary}"\n\n')
+            write(f'--{boundary}\nContent-Type: text/plain; charset="utf-8"\nContent-Transfer-Encoding: base64\n\n')
+            out.write(base64.encodebytes(body.encode("utf-8")))
+            for path in attachments:
+                filename = os.path.basename(path)
+                mime_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                write(f"--{boundary}\nContent-Type: {mime_type}\n"
+                      f"Content-Disposition: attachment; {_filename_param(filename)}\n"
+                      f"Content-Transfer-Encoding: base64\n\n")
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(ENCODE_BLOCK), b""):
+                        out.write(base64.encodebytes(block))
+            write(f"--{boundary}--\n")
+            size = out.tell()
+    except BaseException:
+        os.remove(out_path)
+        raise
+    return out_path, size
@@ -0,0 +1,424 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from credential_store import private_dir, private_file
+from gmail_mime import attachment_parts, extract_body, max_body_chars, message_record
+from gmail_search import translate
+
+# Local SQLite mirror of Gmail thread/message metadata for gmail_mcp.py.
+#
+# A background thread seeds the mirror with the most recent threads (full sync),
+# then keeps it current with users.history.list from the last historyId
+# (incremental sync). When Gmail no longer has that history (404), the mirror is
+# rebuilt with a full sync. list_threads/read_thread are answered from the mirror
+# while it is fresh; GmailService falls back to the live API otherwise.
+#
+# Subjects, senders, recipients, snippets and decoded bodies are indexed with
+# FTS5, so searches using the common Gmail operators (see gmail_search.py) run
+# locally with bm25 ranking. Mail is private: the directory is created 0700 and the
+# databases 0600.
+#
+# Env:
+#   GMAIL_MIRROR_ENABLED                - "0" disables the mirror (default on)
+#   GMAIL_MIRROR_DIR                    - where mirror databases live (default <repo>/.gmail_mirror)
+#   GMAIL_MIRROR_MAX_THREADS            - threads kept by a full sync (default 500)
+#   GMAIL_MIRROR_SYNC_INTERVAL_SECONDS  - background incremental sync period (default 15)
+#   GMAIL_MIRROR_MAX_STALENESS_SECONDS  - reads older than this sync first, off the event loop (default 30)
+#   GMAIL_MIRROR_INDEX_BODIES           - "0" indexes metadata only (default: decoded bodies too)
+#   GMAIL_MIRROR_MAX_BODY_CHARS         - body text kept per message (default 20000)
+#
+# With Gmail push configured (GMAIL_PUSH_TOPIC, see push_channels.py) each
+# notification wakes the sync thread, and both the poll period and the staleness
+# limit stretch to PUSH_CACHE_TTL_SECONDS while the watch is live.
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METADATA_HEADERS = ["From", "To", "Subject", "Date"]
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+# Like Gmail's threads.list, local reads skip mail that is only in Trash or Spam. Full syncs
+# never fetch it, but incremental syncs pick up messages moved there. Queries naming
+# in:trash or in:spam use syntax the mirror doesn't translate, so they go to Gmail.
+VISIBLE_MESSAGE = ("(',' || m.labels || ',') NOT LIKE '%,TRASH,%'"
+                   " AND (',' || m.labels || ',') NOT LIKE '%,SPAM,%'")
+# Bump when the tables change; older mirrors are dropped and rebuilt by a full sync.
+SCHEMA_VERSION = "3"
+
+
+def mirror_enabled() -> bool:
+    return os.getenv("GMAIL_MIRROR_ENABLED", "1") not in ("0", "false", "no")
+
+
+def _header(headers: List[Dict], name: str, default: str = "") -> str:
+    return next((h["value"] for h in headers if h["name"].lower() == name.lower()), default)
+
+
+class GmailMirror:
+    def __init__(self, build_service: Callable, path: Optional[str] = None, mailbox_key: str = "default"):
+        # The sync thread gets its own API client: googleapiclient services are not thread-safe.
+        self._build_service = build_service
+        self._service = None
+        directory = os.getenv("GMAIL_MIRROR_DIR") or os.path.join(BASE_DIR, ".gmail_mirror")
+        if path is None:
+            private_dir(directory)
+            digest = hashlib.sha256(mailbox_key.encode()).hexdigest()[:16]
+            path = os.path.join(directory, f"gmail-{digest}.db")
+        self.path = private_file(path)
+        self.max_threads = int(os.getenv("GMAIL_MIRROR_MAX_THREADS") or "500")
+        self.interval = float(os.getenv("GMAIL_MIRROR_SYNC_INTERVAL_SECONDS") or "15")
+        self.max_staleness = float(os.getenv("GMAIL_MIRROR_MAX_STALENESS_SECONDS") or "30")
+        self.index_bodies = os.getenv("GMAIL_MIRROR_INDEX_BODIES", "1") not in ("0", "false", "no")
+        self.max_body_chars = int(os.getenv("GMAIL_MIRROR_MAX_BODY_CHARS") or "20000")
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Set by GmailService when Pub/Sub push is configured (push_channels.ChannelWatch)
+        self.push = None
+        self.push_staleness = self.max_staleness
+        self._create_schema()
+        self.last_sync = 0.0  # monotonic time of the last successful sync in this process
+        self.stats = {"full_syncs": 0, "incremental_syncs": 0, "history_expired": 0, "sync_errors": 0,
+                      "local_reads": 0, "local_searches": 0, "remote_searches": 0, "fallbacks": 0,
+                      "push_notifications": 0}
+
+    def _create_schema(self):
+        with self._db_lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = 'schema_version'").fetchone()
+            if row is None or row[0] != SCHEMA_VERSION:
+                self._db.executescript("""
+                    DROP TABLE IF EXISTS threads;
+                    DROP TABLE IF EXISTS messages;
+                    DROP TABLE IF EXISTS messages_fts;
+                    DELETE FROM sync_state;
+                """)
+                self._set_state("schema_version", SCHEMA_VERSION)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS threads (
+                    id TEXT PRIMARY KEY, history_id INTEGER, last_date INTEGER,
+                    subject TEXT, sender TEXT, snippet TEXT, message_count INTEGER);
+                CREATE INDEX IF NOT EXISTS threads_by_date ON threads (last_date DESC);
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY, thread_id TEXT NOT NULL, internal_date INTEGER,
+                    sender TEXT, recipients TEXT, subject TEXT, snippet TEXT, labels TEXT,
+                    body TEXT, body_truncated INTEGER, attachments TEXT);
+                CREATE INDEX IF NOT EXISTS messages_by_thread ON messages (thread_id, internal_date);
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    subject, sender, recipients, snippet, body,
+                    message_id UNINDEXED, thread_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2');
+            """)
+
+    # --- State ---
+    def _get_state(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str):
+        self._db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, value))
+
+    @property
+    def history_id(self) -> Optional[int]:
+        value = self._get_state("history_id")
+        return int(value) if value else None
+
+    def _push_active(self) -> bool:
+        return bool(self.push and self.push.active)
+
+    def is_fresh(self) -> bool:
+        # With a live push channel every change triggers a sync, so a quiet mirror stays fresh longer
+        staleness = self.push_staleness if self._push_active() else self.max_staleness
+        return self.history_id is not None and time.monotonic() - self.last_sync <= staleness
+
+    def invalidate(self):
+        """Marks the mirror stale, e.g. after this server changed the mailbox, so the next read syncs first."""
+        self.last_sync = 0.0
+
+    def notify(self, history_id: int):
+        """Push notification that the mailbox reached history_id: sync now unless we already have it."""
+        self.stats["push_notifications"] += 1
+        current = self.history_id
+        if current is None or history_id > current:
+            self.invalidate()
+            self._wake.set()
+
+    # --- Sync ---
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = self._build_service()
+        return self._service
+
+    def sync(self):
+        """Brings the mirror up to date: incremental when possible, full otherwise."""
+        with self._sync_lock:
+            try:
+                if self.history_id is None:
+                    self._full_sync()
+                else:
+                    try:
+                        self._incremental_sync()
+                    except HttpError as e:
+                        if e.resp.status != 404:
+                            raise
+                        # startHistoryId is older than Gmail keeps history for
+                        logger.info("Gmail history expired; running a full resync of the mirror.")
+                        self.stats["history_expired"] += 1
+                        self._full_sync()
+                self.last_sync = time.monotonic()
+            except Exception as e:
+                self.stats["sync_errors"] += 1
+                logger.warning(f"Gmail mirror sync failed: {e}")
+                raise
+
+    def _full_sync(self):
+        started = time.monotonic()
+        # Take the historyId first: changes made while listing are replayed by the next incremental sync.
+        history_id = int(self.service.users().getProfile(userId='me').execute()['historyId'])
+        thread_ids: List[str] = []
+        page_token = None
+        while len(thread_ids) < self.max_threads:
+            page = self.service.users().threads().list(
+                userId='me', maxResults=min(100, self.max_threads - len(thread_ids)), pageToken=page_token
+            ).execute()
+            thread_ids += [t['id'] for t in page.get('threads', [])]
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+
+        threads = [self._fetch_thread(thread_id) for thread_id in thread_ids]
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM messages")
+            self._db.execute("DELETE FROM messages_fts")
+            self._db.execute("DELETE FROM threads")
+            for thread in threads:
+                if thread:
+                    self._store_thread(thread)
+            self._set_state("history_id", str(history_id))
+            # Whole mailbox mirrored: local search results are authoritative
+            self._set_state("complete", "1" if not page_token else "0")
+            # Sync horizon: threads.list returns the most recently active threads, so every thread
+            # left out had its last activity at or before the oldest mirrored thread's. Messages
+            # after that are all mirrored (mirrored threads may still hold older messages).
+            horizon = self._db.execute("SELECT MIN(last_date) FROM threads").fetchone()[0]
+            self._set_state("horizon", str(horizon or 0))
+        self.stats["full_syncs"] += 1
+        logger.info(f"Gmail mirror full sync: {len(thread_ids)} threads in {time.monotonic() - started:.1f}s")
+
+    def _incremental_sync(self):
+        start = self.history_id
+        changed_threads = set()
+        deleted_messages = set()
+        latest = start
+        page_token = None
+        while True:
+            page = self.service.users().history().list(
+                userId='me', startHistoryId=start, historyTypes=HISTORY_TYPES, pageToken=page_token
+            ).execute()
+            latest = int(page.get('historyId', latest))
+            for record in page.get('history', []):
+                for change in record.get('messagesDeleted', []):
+                    deleted_messages.add(change['message']['id'])
+                for message in record.get('messages', []):
+                    changed_threads.add(message['threadId'])
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+
+        threads = {thread_id: self._fetch_thread(thread_id) for thread_id in changed_threads}
+        with self._db_lock, self._db:
+            if deleted_messages:
+                self._db.executemany("DELETE FROM messages WHERE id = ?", [(m,) for m in deleted_messages])
+                self._db.executemany("DELETE FROM messages_fts WHERE message_id = ?", [(m,) for m in deleted_messages])
+            for thread_id, thread in threads.items():
+                self._db.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+                self._db.execute("DELETE FROM messages_fts WHERE thread_id = ?", (thread_id,))
+                self._db.execute("DELETE FROM threads WHERE id = ?", (thread_id,))
+                if thread:
+                    self._store_thread(thread)
+            self._set_state("history_id", str(latest))
+        self.stats["incremental_syncs"] += 1
+        if changed_threads:
+            logger.info(f"Gmail mirror incremental sync: {len(changed_threads)} threads changed")
+
+    def _fetch_thread(self, thread_id: str) -> Optional[Dict]:
+        try:
+            if self.index_bodies:
+                return self.service.users().threads().get(userId='me', id=thread_id, format='full').execute()
+            return self.service.users().threads().get(
+                userId='me', id=thread_id, format='metadata', metadataHeaders=METADATA_HEADERS
+            ).execute()
+        except HttpError as e:
+            if e.resp.status == 404:  # deleted since it was listed
+                return None
+            raise
+
+    def _store_thread(self, thread: Dict):
+        messages = thread.get('messages', [])
+        if not messages:
+            return
+        for msg in messages:
+            payload = msg.get('payload', {})
+            headers = payload.get('headers', [])
+            sender, recipients = _header(headers, 'From', '(Unknown)'), _header(headers, 'To')
+            subject, snippet = _header(headers, 'Subject', '(No Subject)'), msg.get('snippet', '')
+            body, truncated = extract_body(payload, self.max_body_chars) if self.index_bodies else ("", False)
+            self._db.execute(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (msg['id'], thread['id'], int(msg.get('internalDate', 0)), sender, recipients, subject, snippet,
+                 ",".join(msg.get('labelIds', [])), body, int(truncated), json.dumps(attachment_parts(payload))),
+            )
+            self._db.execute(
+                "INSERT INTO messages_fts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (subject, sender, recipients, snippet, body, msg['id'], thread['id']),
+            )
+        last = messages[-1]
+        headers = last.get('payload', {}).get('headers', [])
+        self._db.execute(
+            "INSERT OR REPLACE INTO threads VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (thread['id'], int(thread.get('historyId', 0)), int(last.get('internalDate', 0)),
+             _header(headers, 'Subject', '(No Subject)'), _header(headers, 'From', '(Unknown)'),
+             last.get('snippet', ''), len(messages)),
+        )
+
+    # --- Background thread ---
+    def start(self):
+        if self._thread:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sync()
+                except Exception:
+                    pass  # logged in sync(); reads fall back to the live API meanwhile
+                self._wake.wait(self.push_staleness if self._push_active() else self.interval)
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=loop, name="gmail-mirror", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+
+    # --- Reads ---
+    def refresh(self) -> bool:
+        """Syncs a stale mirror before a read; returns whether reads can be answered locally.
+
+        Blocks on users.history.list, so gmail_mcp.py runs it in a worker thread. The reads
+        below never sync themselves: a mirror that is still stale falls back to the live API.
+        """
+        if self.is_fresh():
+            return True
+        if self.history_id is None:
+            return False  # initial full sync still running; don't block a request on it
+        try:
+            self.sync()
+        except Exception:
+            return False
+        return True
+
+    def list_threads(self, limit: int) -> Optional[List[Dict]]:
+        """Most recent threads in list_threads' shape, or None if the mirror can't answer."""
+        if limit > self.max_threads or not self.is_fresh():
+            self.stats["fallbacks"] += 1
+            return None
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT t.id, t.subject, t.sender, t.snippet, t.message_count FROM threads t"
+                f" WHERE EXISTS (SELECT 1 FROM messages m WHERE m.thread_id = t.id AND {VISIBLE_MESSAGE})"
+                " ORDER BY t.last_date DESC, t.history_id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        self.stats["local_reads"] += 1
+        return [{'id': r[0], 'subject': r[1], 'sender': r[2], 'snippet': r[3], 'message_count': r[4]}
+                for r in rows]
+
+    def read_thread(self, thread_id: str) -> Optional[Dict]:
+        """A thread in read_thread's shape, or None if it isn't mirrored (or the mirror is stale)."""
+        # Without indexed bodies the mirror only has snippets; read_thread needs the live API.
+        if not self.index_bodies or not self.is_fresh():
+            self.stats["fallbacks"] += 1
+            return None
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, sender, body, body_truncated, attachments FROM messages"
+                " WHERE thread_id = ? ORDER BY internal_date",
+                (thread_id,),
+            ).fetchall()
+        if not rows:
+            self.stats["fallbacks"] += 1
+            return None
+        self.stats["local_reads"] += 1
+        cap = max_body_chars()
+        messages = [message_record(message_id, sender, body[:cap], bool(truncated) or len(body) > cap,
+                                   json.loads(attachments))
+                    for message_id, sender, body, truncated, attachments in rows]
+        return {'id': thread_id, 'messages': messages}
+
+    def message_ids(self, thread_ids: List[str]) -> Optional[List[str]]:
+        """Message IDs of the given threads, or None unless every thread is mirrored and fresh."""
+        if not self.is_fresh():
+            return None
+        ids: List[str] = []
+        with self._db_lock:
+            for thread_id in thread_ids:
+                rows = self._db.execute(
+                    "SELECT id FROM messages WHERE thread_id = ? ORDER BY internal_date", (thread_id,)
+                ).fetchall()
+                if not rows:
+                    return None
+                ids += [r[0] for r in rows]
+        return ids
+
+    def search(self, query: str, limit: int) -> Optional[List[Dict]]:
+        """Threads matching a Gmail query, best match first, or None to search Gmail instead."""
+        parsed = translate(query)
+        if parsed is None or limit > self.max_threads or not self.is_fresh():
+            self.stats["remote_searches"] += 1
+            return None
+
+        # FTS5 rank (bm25 by default) is computed per message, then the best message scores its thread.
+        conditions = list(parsed.where) + [VISIBLE_MESSAGE]
+        params: List = []
+        if parsed.match:
+            source = ("(SELECT message_id, rank AS score FROM messages_fts"
+                      " WHERE messages_fts MATCH ?) f JOIN messages m ON m.id = f.message_id")
+            params.append(parsed.match_expression)
+            score = "MIN(f.score)"
+        else:
+            source, score = "messages m", "0"
+        params += parsed.params
+        where = " WHERE " + " AND ".join(conditions)
+        sql = f"SELECT m.thread_id, {score} AS score FROM {source}{where} GROUP BY m.thread_id"
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT t.id, t.subject, t.sender, t.snippet, t.message_count FROM threads t"
+                f" JOIN ({sql}) hits ON hits.thread_id = t.id"
+                " ORDER BY hits.score, t.last_date DESC, t.history_id DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+
+        # The mirror only holds recently active threads; a short result list is only final if
+        # other mail can't match (whole mailbox mirrored, or the query starts after the sync horizon).
+        complete = self._get_state("complete") == "1"
+        horizon = int(self._get_state("horizon") or 0)
+        if len(rows) < limit and not complete and not (parsed.after_ms and horizon and parsed.after_ms > horizon):
+            self.stats["remote_searches"] += 1
+            return None
+        self.stats["local_searches"] += 1
+        return [{'id': r[0], 'subject': r[1], 'sender': r[2], 'snippet': r[3], 'message_count': r[4]}
+                for r in rows]
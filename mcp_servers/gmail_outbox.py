@@ -0,0 +1,275 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from credential_store import Identity, private_dir, private_file
+
+# Durable outbox for gmail_mcp.py: queued sends return a handle immediately and a
+# background worker delivers them with retry/backoff and a send-rate limit.
+#
+# Requests are stored as the send_email/reply_to_thread arguments and sent by the
+# worker through GmailService's send callback, so a queued reply doesn't wait on the
+# thread lookup either (attachment paths must still exist at delivery time). Rows
+# are claimed atomically, so several MCP server processes can share one outbox
+# file; a claim left behind by a crashed process is retried after
+# GMAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS. Delivery is at-least-once: a crash between
+# Gmail accepting a message and the row being marked sent will send it again.
+# Each mailbox (keyed by its address) has its own outbox file. The files hold full
+# messages, so the directory is 0700 and the databases 0600.
+#
+# A worker outlives the GmailService that opened it (gmail_mcp.py keeps one per mailbox
+# and rebinds it to the newest service), so evicting a user's service doesn't stop
+# delivery. Each file records the identity that owns it; at startup gmail_mcp.py
+# builds the service for every owner with pending mail (pending_owners) so delivery
+# resumes without waiting for that user's next Gmail call.
+#
+# Env:
+#   GMAIL_OUTBOX_DIR                   - where outbox databases live (default <repo>/.gmail_outbox)
+#   GMAIL_OUTBOX_SENDS_PER_MINUTE      - per-process send rate limit (default 60)
+#   GMAIL_OUTBOX_MAX_ATTEMPTS          - attempts before a message is marked failed (default 6)
+#   GMAIL_OUTBOX_BACKOFF_SECONDS       - first retry delay, doubled per attempt up to 15 min (default 5)
+#   GMAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS - when an unfinished "sending" claim is retried (default 300)
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_BACKOFF = 900.0
+# Errors worth retrying; any other HTTP error (bad address, auth) fails the message at once.
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Sends a stored request with the given API client and returns the sent message.
+Send = Callable[[object, Dict], Dict]
+
+
+def outbox_directory() -> str:
+    return os.getenv("GMAIL_OUTBOX_DIR") or os.path.join(BASE_DIR, ".gmail_outbox")
+
+
+def pending_owners(directory: Optional[str] = None) -> List[Identity]:
+    """Identities owning an outbox file with undelivered messages."""
+    owners: List[Identity] = []
+    for path in sorted(glob.glob(os.path.join(directory or outbox_directory(), "outbox-*.db"))):
+        try:
+            db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+            try:
+                pending = db.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')").fetchone()[0]
+                rows = dict(db.execute("SELECT key, value FROM owner").fetchall())
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Skipping outbox {path}: {e}")
+            continue
+        if pending and "tenant_id" in rows:
+            owner = (rows["tenant_id"], rows["user_id"])
+            if owner not in owners:
+                owners.append(owner)
+        elif pending:
+            logger.warning(f"Outbox {path} has {pending} pending message(s) but no recorded owner")
+    return owners
+
+
+class GmailOutbox:
+    def __init__(self, build_service: Callable, send: Send, path: Optional[str] = None,
+                 mailbox_key: str = "default", on_sent: Optional[Callable[[], None]] = None,
+                 owner: Optional[Identity] = None):
+        # The worker gets its own API client: googleapiclient services are not thread-safe.
+        self._build_service = build_service
+        self._service = None
+        self._send = send
+        self._on_sent = on_sent
+        if path is None:
+            directory = outbox_directory()
+            private_dir(directory)
+            digest = hashlib.sha256(mailbox_key.encode()).hexdigest()[:16]
+            path = os.path.join(directory, f"outbox-{digest}.db")
+        self.path = private_file(path)
+        self.min_interval = 60.0 / float(os.getenv("GMAIL_OUTBOX_SENDS_PER_MINUTE") or "60")
+        self.max_attempts = int(os.getenv("GMAIL_OUTBOX_MAX_ATTEMPTS") or "6")
+        self.backoff = float(os.getenv("GMAIL_OUTBOX_BACKOFF_SECONDS") or "5")
+        self.claim_timeout = float(os.getenv("GMAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS") or "300")
+
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._db_lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_send = 0.0
+        with self._db_lock, self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id TEXT PRIMARY KEY, request TEXT NOT NULL, status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL, claimed_at REAL, sent_at REAL,
+                    gmail_id TEXT, thread_id TEXT, last_error TEXT);
+                CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+                CREATE TABLE IF NOT EXISTS owner (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            if owner:
+                self._db.executemany("INSERT OR REPLACE INTO owner VALUES (?, ?)",
+                                     [("tenant_id", owner[0]), ("user_id", owner[1])])
+        self.stats = {"queued": 0, "sent": 0, "retries": 0, "failed": 0}
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = self._build_service()
+        return self._service
+
+    def rebind(self, build_service: Callable, send: Send, on_sent: Optional[Callable[[], None]] = None):
+        """Delivers through a newer GmailService (e.g. rebuilt after eviction or re-authorization)."""
+        self._build_service, self._send, self._on_sent = build_service, send, on_sent
+        self._service = None
+
+    # --- Queue ---
+    def enqueue(self, request: Dict) -> Dict:
+        """Stores a send request and returns its handle; the worker delivers it."""
+        outbox_id = f"out_{uuid.uuid4().hex[:16]}"
+        now = time.time()
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT INTO outbox (id, request, status, created_at, next_attempt_at) VALUES (?, ?, 'queued', ?, ?)",
+                (outbox_id, json.dumps(request), now, now),
+            )
+        self.stats["queued"] += 1
+        self._wake.set()
+        return {'outbox_id': outbox_id, 'status': 'queued'}
+
+    def status(self, outbox_id: str) -> Optional[Dict]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT id, status, attempts, created_at, sent_at, gmail_id, thread_id, last_error, next_attempt_at"
+                " FROM outbox WHERE id = ?", (outbox_id,)
+            ).fetchone()
+        return self._describe(row) if row else None
+
+    def recent(self, limit: int = 10) -> List[Dict]:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, status, attempts, created_at, sent_at, gmail_id, thread_id, last_error, next_attempt_at"
+                " FROM outbox ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._describe(row) for row in rows]
+
+    @staticmethod
+    def _describe(row) -> Dict:
+        outbox_id, status, attempts, created_at, sent_at, gmail_id, thread_id, last_error, next_attempt_at = row
+        result = {'outbox_id': outbox_id, 'status': status, 'attempts': attempts,
+                  'queued_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(created_at))}
+        if status == 'sent':
+            result.update(id=gmail_id, threadId=thread_id,
+                          sent_at=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(sent_at)))
+        elif last_error:
+            result['last_error'] = last_error
+            if status == 'queued':
+                result['retry_in_seconds'] = max(0, round(next_attempt_at - time.time()))
+        return result
+
+    def pending(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')").fetchone()[0]
+
+    # --- Delivery ---
+    def _claim(self) -> Optional[tuple]:
+        """Atomically takes the oldest due message (or an abandoned claim) for this process."""
+        now = time.time()
+        with self._db_lock, self._db:
+            row = self._db.execute(
+                "SELECT id, request, attempts FROM outbox WHERE (status = 'queued' AND next_attempt_at <= ?)"
+                " OR (status = 'sending' AND claimed_at < ?) ORDER BY created_at LIMIT 1",
+                (now, now - self.claim_timeout),
+            ).fetchone()
+            if not row:
+                return None
+            claimed = self._db.execute(
+                "UPDATE outbox SET status = 'sending', claimed_at = ?, attempts = attempts + 1"
+                " WHERE id = ? AND attempts = ?", (now, row[0], row[2]),
+            ).rowcount
+        return (row[0], json.loads(row[1]), row[2] + 1) if claimed else None
+
+    def _deliver(self, outbox_id: str, request: Dict, attempt: int):
+        wait = self._last_send + self.min_interval - time.monotonic()
+        if wait > 0:
+            self._stop.wait(wait)
+        self._last_send = time.monotonic()
+        try:
+            sent = self._send(self.service, request)
+        except Exception as e:
+            # ValueError: the request itself is bad (e.g. a missing attachment file)
+            retryable = not isinstance(e, ValueError) and (
+                not isinstance(e, HttpError) or e.resp.status in RETRYABLE_STATUS)
+            self._failed(outbox_id, attempt, str(e), retryable)
+            return
+        with self._db_lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, gmail_id = ?, thread_id = ?, last_error = NULL"
+                " WHERE id = ?", (time.time(), sent.get('id'), sent.get('threadId'), outbox_id),
+            )
+        self.stats["sent"] += 1
+        logger.info(f"Outbox {outbox_id} sent as {sent.get('id')} (attempt {attempt})")
+        if self._on_sent:
+            self._on_sent()
+
+    def _failed(self, outbox_id: str, attempt: int, error: str, retryable: bool):
+        if retryable and attempt < self.max_attempts:
+            delay = min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+            status, next_attempt_at = 'queued', time.time() + delay
+            self.stats["retries"] += 1
+            logger.warning(f"Outbox {outbox_id} attempt {attempt} failed, retrying in {delay:.0f}s: {error}")
+        else:
+            status, next_attempt_at = 'failed', time.time()
+            self.stats["failed"] += 1
+            logger.error(f"Outbox {outbox_id} failed after {attempt} attempt(s): {error}")
+        with self._db_lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (status, next_attempt_at, error, outbox_id),
+            )
+
+    def drain(self) -> int:
+        """Delivers every message that is due now; returns how many were attempted."""
+        attempted = 0
+        while not self._stop.is_set():
+            claimed = self._claim()
+            if not claimed:
+                break
+            self._deliver(*claimed)
+            attempted += 1
+        return attempted
+
+    def _next_due_in(self) -> float:
+        with self._db_lock:
+            row = self._db.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'queued'").fetchone()
+        if row[0] is None:
+            return self.claim_timeout
+        return min(self.claim_timeout, max(0.0, row[0] - time.time()))
+
+    # --- Background worker ---
+    def start(self):
+        if self._thread:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.drain()
+                except Exception as e:
+                    logger.error(f"Outbox worker pass failed: {e}")
+                self._wake.wait(self._next_due_in())
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=loop, name="gmail-outbox", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,92 @@
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional
+
+# Translates Gmail search syntax into a query over the mirror's FTS5 index.
+#
+# Supported: bare words and "quoted phrases", from:, to:, subject:, is:unread,
+# is:read, is:starred, is:important, after:, before: (YYYY/MM/DD, YYYY-MM-DD or
+# epoch seconds). Anything else (OR, negation, grouping, has:, label:, newer_than:,
+# ...) returns None so the caller sends the search to Gmail instead.
+
+TOKEN_RE = re.compile(r'(\S+?:)?("[^"]*"|\S+)')
+LABEL_OPERATORS = {"unread": "UNREAD", "starred": "STARRED", "important": "IMPORTANT"}
+COLUMN_OPERATORS = {"from:": "sender", "to:": "recipients", "subject:": "subject"}
+
+
+@dataclass
+class SearchQuery:
+    match: List[str] = field(default_factory=list)  # FTS5 MATCH clauses, ANDed
+    where: List[str] = field(default_factory=list)  # SQL conditions on messages (alias m)
+    params: List = field(default_factory=list)
+    after_ms: Optional[int] = None
+
+    @property
+    def match_expression(self) -> str:
+        return " AND ".join(self.match)
+
+
+def _phrase(text: str, prefix: bool = False) -> Optional[str]:
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    phrase = '"' + " ".join(words) + '"'
+    return phrase + "*" if prefix else phrase
+
+
+def _date_ms(value: str) -> Optional[int]:
+    if value.isdigit() and len(value) > 8:
+        return int(value) * 1000
+    for fmt in ("%Y/%m/%d", "%Y-%m-%d"):
+        try:
+            return int(datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp() * 1000)
+        except ValueError:
+            continue
+    return None
+
+
+def translate(query: str) -> Optional[SearchQuery]:
+    """Returns the local form of a Gmail query, or None if it uses unsupported syntax."""
+    if any(c in query for c in "(){}"):
+        return None
+    result = SearchQuery()
+    for operator, value in TOKEN_RE.findall(query.strip()):
+        operator = operator.lower()
+        raw = value.strip('"')
+        if not operator:
+            if value in ("OR", "|") or value.startswith("-"):
+                return None
+            if value == "AND":
+                continue
+            phrase = _phrase(raw)
+            if phrase:
+                result.match.append(phrase)
+        elif operator in COLUMN_OPERATORS:
+            # Partial addresses are common ("from:alice"), so match the last word as a prefix.
+            phrase = _phrase(raw, prefix=operator != "subject:")
+            if not phrase:
+                return None
+            result.match.append(f"{COLUMN_OPERATORS[operator]} : {phrase}")
+        elif operator == "is:":
+            label = raw.lower()
+            if label == "read":
+                result.where.append("(',' || m.labels || ',') NOT LIKE '%,UNREAD,%'")
+            elif label in LABEL_OPERATORS:
+                result.where.append("(',' || m.labels || ',') LIKE ?")
+                result.params.append(f"%,{LABEL_OPERATORS[label]},%")
+            else:
+                return None
+        elif operator in ("after:", "before:"):
+            ms = _date_ms(raw)
+            if ms is None:
+                return None
+            if operator == "after:":
+                result.where.append("m.internal_date >= ?")
+                result.after_ms = max(ms, result.after_ms or 0)
+            else:
+                result.where.append("m.internal_date < ?")
+            result.params.append(ms)
+        else:
+            return None
+    return result
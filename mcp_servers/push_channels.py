@@ -0,0 +1,315 @@
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from credential_store import private_file, store_path
+except ImportError:  # imported from server.py as mcp_servers.push_channels
+    from mcp_servers.credential_store import private_file, store_path
+
+# Push-notification channels for Calendar (events.watch) and Gmail (users.watch via
+# Pub/Sub), shared by server.py and the MCP servers through one SQLite file.
+#
+# The MCP servers register a channel per account and renew it before it expires.
+# Only one process does this at a time: a process claims the account's row, creates
+# the new channel, then stops the old one. server.py receives the webhooks
+# (/api/push/calendar, /api/push/gmail), checks them against the registered
+# channels, and appends a notification row. Each MCP server polls for new rows and
+# acts on them at once: the calendar server drops cached reads and the Gmail mirror
+# syncs. While an account has a live channel, its caches can keep results much
+# longer than the polling TTLs. The file (0600) is only created once push is
+# configured; without it nothing here touches the disk.
+#
+# Env:
+#   PUSH_WEBHOOK_BASE_URL      - public https root of server.py; enables Calendar channels
+#   GMAIL_PUSH_TOPIC           - projects/<project>/topics/<topic> for users.watch; enables Gmail push
+#   PUSH_VERIFICATION_TOKEN    - required ?token= on the Pub/Sub push subscription's endpoint URL
+#   PUSH_CHANNEL_TTL_SECONDS   - requested Calendar channel lifetime (default 86400)
+#   PUSH_RENEW_MARGIN_SECONDS  - renew channels this long before they expire (default 3600)
+#   PUSH_POLL_SECONDS          - how often MCP servers check for notifications (default 1)
+#   PUSH_CACHE_TTL_SECONDS     - cache lifetime for accounts with a live channel (default 900)
+
+logger = logging.getLogger(__name__)
+
+CALENDAR = "calendar"
+GMAIL = "gmail"
+NOTIFICATION_RETENTION = 3600.0  # seconds a notification row is kept for slow pollers
+CLAIM_LEASE = 120.0  # seconds another process waits before retrying an unfinished renewal
+
+# Creates a channel for an account: returns channel_id, expiration (epoch seconds)
+# and optionally resource_id, address and token.
+StartChannel = Callable[[], Dict]
+StopChannel = Callable[[Dict], None]
+Notify = Callable[[Dict], None]
+
+
+def registry_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(store_path())), ".push_channels.db")
+
+
+def push_enabled() -> bool:
+    return bool(os.getenv("PUSH_WEBHOOK_BASE_URL") or os.getenv("GMAIL_PUSH_TOPIC"))
+
+
+def push_cache_ttl() -> float:
+    return float(os.getenv("PUSH_CACHE_TTL_SECONDS") or "900")
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(24)
+
+
+class PushRegistry:
+    def __init__(self, path: Optional[str] = None):
+        self.path = private_file(path or registry_path())
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS channels (
+                    resource TEXT NOT NULL, account TEXT NOT NULL, channel_id TEXT, resource_id TEXT,
+                    address TEXT, token TEXT, expiration REAL NOT NULL DEFAULT 0,
+                    lease_until REAL NOT NULL DEFAULT 0, PRIMARY KEY (resource, account));
+                CREATE INDEX IF NOT EXISTS channels_by_id ON channels (channel_id);
+                CREATE TABLE IF NOT EXISTS notifications (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, resource TEXT NOT NULL, account TEXT NOT NULL,
+                    data TEXT NOT NULL, created_at REAL NOT NULL);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    @staticmethod
+    def _row(row) -> Optional[Dict]:
+        if not row:
+            return None
+        keys = ("resource", "account", "channel_id", "resource_id", "address", "token", "expiration")
+        return dict(zip(keys, row))
+
+    # --- Channels ---
+    def channel(self, channel_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            return self._row(conn.execute(
+                "SELECT resource, account, channel_id, resource_id, address, token, expiration FROM channels"
+                " WHERE channel_id = ? AND expiration > ?", (channel_id, time.time())).fetchone())
+
+    def channel_for(self, resource: str, account: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            return self._row(conn.execute(
+                "SELECT resource, account, channel_id, resource_id, address, token, expiration FROM channels"
+                " WHERE resource = ? AND account = ?", (resource, account)).fetchone())
+
+    def channel_by_address(self, resource: str, address: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            return self._row(conn.execute(
+                "SELECT resource, account, channel_id, resource_id, address, token, expiration FROM channels"
+                " WHERE resource = ? AND address = ? AND expiration > ? ORDER BY expiration DESC LIMIT 1",
+                (resource, address, time.time())).fetchone())
+
+    def claim(self, resource: str, account: str, margin: float) -> Optional[Dict]:
+        """Takes the renewal of an account's channel if it is due; returns the old channel ({} if none)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT resource, account, channel_id, resource_id, address, token, expiration, lease_until"
+                    " FROM channels WHERE resource = ? AND account = ?", (resource, account)).fetchone()
+                if row and (row[6] - margin > now or row[7] > now):
+                    conn.execute("COMMIT")
+                    return None  # still fresh, or another process is renewing it
+                conn.execute(
+                    "INSERT INTO channels (resource, account, lease_until) VALUES (?, ?, ?)"
+                    " ON CONFLICT (resource, account) DO UPDATE SET lease_until = excluded.lease_until",
+                    (resource, account, now + CLAIM_LEASE))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self._row(row[:7]) if row and row[2] else {}
+
+    def put_channel(self, resource: str, account: str, channel: Dict):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (resource, account, channel["channel_id"], channel.get("resource_id"), channel.get("address"),
+                 channel.get("token"), channel["expiration"]))
+
+    def release(self, resource: str, account: str):
+        """Gives up a claim after a failed renewal, keeping whatever channel is still registered."""
+        with self._connect() as conn:
+            conn.execute("UPDATE channels SET lease_until = 0 WHERE resource = ? AND account = ?", (resource, account))
+
+    # --- Notifications ---
+    def publish(self, resource: str, account: str, data: Dict) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM notifications WHERE created_at < ?", (now - NOTIFICATION_RETENTION,))
+            return conn.execute(
+                "INSERT INTO notifications (resource, account, data, created_at) VALUES (?, ?, ?, ?)",
+                (resource, account, json.dumps(data), now)).lastrowid
+
+    def latest_id(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM notifications").fetchone()[0]
+
+    def since(self, last_id: int) -> List[Tuple[int, str, str, Dict]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, resource, account, data FROM notifications WHERE id > ? ORDER BY id",
+                (last_id,)).fetchall()
+        return [(row[0], row[1], row[2], json.loads(row[3])) for row in rows]
+
+
+class ChannelWatch:
+    """One account's push channel, renewed by whichever process claims it first."""
+
+    def __init__(self, registry: PushRegistry, resource: str, account: str, start: StartChannel,
+                 stop: Optional[StopChannel] = None):
+        self.registry = registry
+        self.resource = resource
+        self.account = account
+        self._start = start
+        self._stop = stop
+        self.margin = float(os.getenv("PUSH_RENEW_MARGIN_SECONDS") or "3600")
+        self.expiration = 0.0
+        self.failures = 0
+        self._next_try = 0.0
+        self.stats = {"created": 0, "failed": 0, "notifications": 0}
+
+    def maintain(self):
+        now = time.time()
+        if now < self._next_try:
+            return
+        old = self.registry.claim(self.resource, self.account, self.margin)
+        if old is None:
+            current = self.registry.channel_for(self.resource, self.account)
+            self.expiration = current["expiration"] if current else 0.0
+            return
+        try:
+            channel = self._start()
+        except Exception as e:
+            self.registry.release(self.resource, self.account)
+            self.failures += 1
+            self.stats["failed"] += 1
+            self._next_try = now + min(3600.0, 60.0 * 2 ** (self.failures - 1))
+            logger.warning(f"Could not create {self.resource} push channel (attempt {self.failures}): {e}")
+            return
+        self.registry.put_channel(self.resource, self.account, channel)
+        self.expiration = channel["expiration"]
+        self.failures = 0
+        self.stats["created"] += 1
+        logger.info(f"{self.resource} push channel {channel['channel_id']} active until "
+                    f"{time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(channel['expiration']))}")
+        if old and self._stop:
+            try:
+                self._stop(old)
+            except Exception as e:
+                logger.info(f"Could not stop old {self.resource} channel {old['channel_id']}: {e}")
+
+    @property
+    def active(self) -> bool:
+        return self.expiration > time.time()
+
+
+class PushListener:
+    """Per-process thread that keeps channels renewed and hands notifications to subscribers."""
+
+    def __init__(self, registry: Optional[PushRegistry] = None):
+        self.registry = registry or PushRegistry()
+        self.poll = float(os.getenv("PUSH_POLL_SECONDS") or "1")
+        self._watches: List[ChannelWatch] = []
+        self._subscribers: Dict[Tuple[str, str], List[Notify]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_id = self.registry.latest_id()
+        self._last_maintain: Optional[float] = None
+
+    def watch(self, resource: str, account: str, start: StartChannel, stop: Optional[StopChannel],
+              on_notify: Notify) -> ChannelWatch:
+        """Keeps a channel alive for the account and calls on_notify for each of its notifications."""
+        channel = ChannelWatch(self.registry, resource, account, start, stop)
+        with self._lock:
+            self._watches.append(channel)
+            self._subscribers.setdefault((resource, account), []).append(on_notify)
+        self._last_maintain = None  # check the new channel on the next pass
+        self.start()
+        self._wake.set()
+        return channel
+
+    def unwatch(self, channel: ChannelWatch, on_notify: Notify):
+        """Stops renewing from this process; the channel itself lapses at its expiration."""
+        with self._lock:
+            if channel in self._watches:
+                self._watches.remove(channel)
+            callbacks = self._subscribers.get((channel.resource, channel.account), [])
+            if on_notify in callbacks:
+                callbacks.remove(on_notify)
+
+    def dispatch(self) -> int:
+        delivered = 0
+        for notification_id, resource, account, data in self.registry.since(self._last_id):
+            self._last_id = notification_id
+            with self._lock:
+                callbacks = list(self._subscribers.get((resource, account), []))
+                for watch in self._watches:
+                    if watch.resource == resource and watch.account == account:
+                        watch.stats["notifications"] += 1
+            for callback in callbacks:
+                try:
+                    callback(data)
+                    delivered += 1
+                except Exception as e:
+                    logger.warning(f"{resource} push notification handler failed: {e}")
+        return delivered
+
+    def _maintain(self):
+        with self._lock:
+            watches = list(self._watches)
+        for channel in watches:
+            try:
+                channel.maintain()
+            except Exception as e:
+                logger.warning(f"{channel.resource} channel maintenance failed: {e}")
+
+    def start(self):
+        if self._thread:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.dispatch()
+                    if self._last_maintain is None or time.monotonic() - self._last_maintain > 60:
+                        self._last_maintain = time.monotonic()
+                        self._maintain()
+                except Exception as e:
+                    logger.warning(f"Push listener pass failed: {e}")
+                self._wake.wait(self.poll)
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=loop, name="push-listener", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [dict(w.stats, resource=w.resource, active=w.active) for w in self._watches]
+
+
+_listener: Optional[PushListener] = None
+
+
+def default_listener() -> PushListener:
+    global _listener
+    if _listener is None:
+        _listener = PushListener()
+    return _listener
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Compact, token-budgeted serialization of MCP tool results.
+#
+# Tool results go straight into the model context and stay in the conversation
+# history, so every byte is paid again on later turns. Results are projected to the
+# fields the agents use, empty values are dropped, and they are emitted as compact
+# JSON or, for lists of flat records (alone or as a page with a next_page_token),
+# as a tab-separated table (whichever is shorter). Anything over the per-call
+# token budget is cut with explicit markers telling the model that more data exists.
+#
+# Env:
+#   MCP_RESULT_TOKEN_BUDGET    - max estimated tokens per tool result (default 1500)
+#   MCP_RESULT_FORMAT          - auto | json | table (default auto)
+#   MCP_RESULT_MAX_FIELD_CHARS - cap for any single string field (default 300)
+#   MCP_RESULT_FIELDS          - projection overrides, e.g. "list_emails=id,subject,sender;list_events=id,start"
+
+logger = logging.getLogger(__name__)
+
+# Fields each tool's result is projected to. Tools without an entry keep every field;
+# an "error" field is always kept.
+DEFAULT_PROJECTIONS: Dict[str, List[str]] = {
+    "list_emails": ["id", "sender", "subject", "snippet", "message_count"],
+    "list_events": ["id", "summary", "start", "status"],
+    "find_free_slots": ["start_time", "end_time"],
+    "list_meetings": ["id", "topic", "start_time", "duration", "join_url"],
+    "create_event": ["id", "status", "link"],
+    "create_meeting": ["id", "topic", "start_time", "join_url", "password"],
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token, the same estimate benchmarks/replay uses."""
+    return (len(text) + 3) // 4
+
+
+def dumps(value: Any) -> str:
+    """Compact JSON (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(value, default=str).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def parse_projections(spec: str) -> Dict[str, List[str]]:
+    projections = {}
+    for part in filter(None, (p.strip() for p in spec.split(";"))):
+        tool, _, fields = part.partition("=")
+        projections[tool.strip()] = [f.strip() for f in fields.split(",") if f.strip()]
+    return projections
+
+
+class ResultSerializer:
+    def __init__(self, budget: Optional[int] = None, fmt: Optional[str] = None,
+                 max_field_chars: Optional[int] = None, projections: Optional[Dict[str, List[str]]] = None):
+        self.budget = budget or int(os.getenv("MCP_RESULT_TOKEN_BUDGET") or "1500")
+        self.fmt = fmt or os.getenv("MCP_RESULT_FORMAT") or "auto"
+        self.max_field_chars = max_field_chars or int(os.getenv("MCP_RESULT_MAX_FIELD_CHARS") or "300")
+        self.projections = dict(DEFAULT_PROJECTIONS)
+        self.projections.update(projections or parse_projections(os.getenv("MCP_RESULT_FIELDS", "")))
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def serialize(self, tool: str, result: Any, max_field_chars: Optional[int] = None) -> str:
+        """Serializes one tool result within the token budget and records the savings.
+
+        max_field_chars overrides the string field cap for tools whose fields are already capped.
+        """
+        value = self._project(tool, result)
+        max_items: Optional[int] = None
+        max_chars = max_field_chars or self.max_field_chars
+        text = self._format(self._shape(value, max_chars, max_items))
+        # Until the result fits: shorten long strings to a readable length, then shed
+        # list items, then shorten strings further, then hard-cut.
+        while estimate_tokens(text) > self.budget:
+            longest = self._longest_list(value)
+            if max_chars > 80:
+                max_chars = max(80, max_chars // 2)
+            elif longest > 1 and (max_items is None or max_items > 1):
+                max_items = max(1, int((max_items or longest) * 0.75))
+            elif max_chars > 40:
+                max_chars //= 2
+            else:
+                cut = self.budget * 4
+                text = text[:cut] + f"…[+{len(text) - cut} chars truncated]"
+                break
+            text = self._format(self._shape(value, max_chars, max_items))
+
+        self._record(tool, result, text, truncated="…[+" in text)
+        return text
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {tool: dict(s) for tool, s in self._stats.items()}
+
+    # --- Shaping ---
+    def _project(self, tool: str, result: Any) -> Any:
+        fields = self.projections.get(tool)
+        if not fields:
+            return result
+        keep = set(fields) | {"error"}
+        if isinstance(result, dict) and not keep & result.keys() and any(isinstance(v, list) for v in result.values()):
+            # A page of records, e.g. {"events": [...], "next_page_token": ...}: project the records
+            return {k: self._project(tool, v) if isinstance(v, list) else v for k, v in result.items()}
+        if isinstance(result, dict):
+            return {k: v for k, v in result.items() if k in keep}
+        if isinstance(result, list):
+            return [{k: v for k, v in item.items() if k in keep} if isinstance(item, dict) else item
+                    for item in result]
+        return result
+
+    def _shape(self, value: Any, max_chars: int, max_items: Optional[int]) -> Any:
+        if isinstance(value, dict):
+            return {k: self._shape(v, max_chars, max_items) for k, v in value.items()
+                    if v is not None and v != "" and v != [] and v != {}}
+        if isinstance(value, list):
+            items = [self._shape(v, max_chars, max_items) for v in value[:max_items]]
+            if max_items is not None and len(value) > max_items:
+                items.append(f"…[+{len(value) - max_items} more items; narrow the query or lower the limit]")
+            return items
+        if isinstance(value, str) and len(value) > max_chars:
+            return value[:max_chars] + f"…[+{len(value) - max_chars} chars]"
+        return value
+
+    def _longest_list(self, value: Any) -> int:
+        if isinstance(value, list):
+            return max([len(value)] + [self._longest_list(v) for v in value])
+        if isinstance(value, dict):
+            return max([0] + [self._longest_list(v) for v in value.values()])
+        return 0
+
+    # --- Formats ---
+    def _format(self, value: Any) -> str:
+        compact = dumps(value)
+        if self.fmt == "json":
+            return compact
+        table = self._table(value)
+        if table is None:
+            return compact
+        if self.fmt == "table":
+            return table
+        return table if len(table) < len(compact) else compact
+
+    @classmethod
+    def _table(cls, value: Any) -> Optional[str]:
+        """Tab-separated rows with a header, for lists of flat records (or a page of them)."""
+        if isinstance(value, dict):
+            lists = [k for k, v in value.items() if isinstance(v, list)]
+            if len(lists) != 1 or any(isinstance(v, dict) for v in value.values()):
+                return None
+            table = cls._table(value[lists[0]])
+            if table is None:
+                return None
+            return "\n".join([table] + [f"{k}: {v}" for k, v in value.items() if k != lists[0]])
+        if not isinstance(value, list) or not value:
+            return None
+        rows = [v for v in value if isinstance(v, dict)]
+        markers = [v for v in value if isinstance(v, str) and v.startswith("…[+")]
+        if not rows or len(rows) + len(markers) != len(value):
+            return None
+        columns: List[str] = []
+        for row in rows:
+            for key, cell in row.items():
+                if isinstance(cell, (dict, list)):
+                    return None
+                if key not in columns:
+                    columns.append(key)
+
+        def cell_text(cell: Any) -> str:
+            return "" if cell is None else str(cell).replace("\t", " ").replace("\n", " ")
+
+        lines = ["\t".join(columns)]
+        lines += ["\t".join(cell_text(row.get(c)) for c in columns) for row in rows]
+        return "\n".join(lines + markers)
+
+    # --- Stats ---
+    def _record(self, tool: str, result: Any, text: str, truncated: bool):
+        baseline = estimate_tokens(json.dumps(result, indent=2, default=str))
+        tokens = estimate_tokens(text)
+        with self._lock:
+            s = self._stats.setdefault(tool, {"calls": 0, "baseline_tokens": 0, "tokens": 0, "truncated": 0})
+            s["calls"] += 1
+            s["baseline_tokens"] += baseline
+            s["tokens"] += tokens
+            s["truncated"] += int(truncated)
+            saved, total = s["baseline_tokens"] - s["tokens"], s["baseline_tokens"]
+        logger.info(f"{tool} result: {tokens} tokens (indented JSON: {baseline}); "
+                    f"{tool} total saved {saved} of {total} tokens")
+
+
+default_serializer = ResultSerializer()
+
+
+def serialize(tool: str, result: Any, max_field_chars: Optional[int] = None) -> str:
+    return default_serializer.serialize(tool, result, max_field_chars)
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+try:
+    from credential_store import load_key, store_path
+except ImportError:  # imported from server.py as mcp_servers.token_broker
+    from mcp_servers.credential_store import load_key, store_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Shared Google access-token cache for server.py and the MCP servers.
+#
+# Every process that talks to Google (gmail_mcp, calendar_mcp, any number of
+# spawned copies) gets its access token from one file-locked cache keyed by a hash
+# of the credential set, instead of each refreshing on its first API call. The cache
+# is encrypted with the credential store's Fernet key, like the refresh tokens.
+# server.py runs the background refresher, which renews tokens a few minutes before
+# they expire, so a refresh only lands on a request path if the refresher is down.
+#
+# Tokens are refreshed without a scope restriction, so Gmail and Calendar built
+# from the same refresh token share one access token.
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+
+def cache_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(store_path())), ".token_cache")
+
+
+def legacy_cache_path() -> str:
+    """Where earlier versions kept the cache in plaintext JSON."""
+    return os.path.join(os.path.dirname(os.path.abspath(store_path())), ".token_cache.json")
+
+
+def google_token_uri(base_url: Optional[str]) -> str:
+    """Token endpoint for an API base URL override (fake_apis serves /token)."""
+    return f"{base_url.rstrip('/')}/token" if base_url else GOOGLE_TOKEN_URI
+
+
+@dataclass(frozen=True)
+class TokenSpec:
+    """One OAuth client + refresh token pair; the unit a token is cached for."""
+    refresh_token: str
+    client_id: str
+    client_secret: str
+    token_uri: str = GOOGLE_TOKEN_URI
+
+    @property
+    def key(self) -> str:
+        raw = "\0".join((self.token_uri, self.client_id, self.refresh_token))
+        return hashlib.sha256(raw.encode()).hexdigest()[:24]
+
+
+class BrokeredCredentials(Credentials):
+    """Google credentials whose refresh() is served from the shared token cache."""
+
+    def __init__(self, broker: "TokenBroker", spec: TokenSpec, scopes: Optional[List[str]] = None):
+        super().__init__(None, refresh_token=spec.refresh_token, token_uri=spec.token_uri,
+                         client_id=spec.client_id, client_secret=spec.client_secret, scopes=scopes)
+        self._broker = broker
+        self._spec = spec
+
+    def refresh(self, request):
+        # Passing our current token lets the broker tell a 401 retry (token rejected
+        # early) from a plain expiry, and force a real refresh in that case.
+        self.token, self.expiry = self._broker.get_token(self._spec, request, rejected=self.token)
+
+
+class TokenBroker:
+    def __init__(self, path: Optional[str] = None, refresh_margin: Optional[float] = None,
+                 min_validity: float = 300.0):
+        self.path = path or cache_path()
+        self._fernet: Optional[Fernet] = None
+        # Background refresher renews tokens expiring within this many seconds
+        self.refresh_margin = refresh_margin or float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS") or "600")
+        # Request path accepts a cached token with at least this much life left. Must stay above
+        # google-auth's own expiry threshold (~4 min), or handed-out tokens would count as expired.
+        self.min_validity = min_validity
+        self._thread_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.hits = 0
+        self.refreshes = 0
+        self.background_refreshes = 0
+        self.errors = 0
+
+    # --- Cache file ---
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _cipher(self) -> Fernet:
+        if self._fernet is None:
+            self._fernet = Fernet(load_key(store_path(), create=True))
+        return self._fernet
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, "rb") as f:
+                return json.loads(self._cipher().decrypt(f.read()))
+        except (OSError, ValueError, InvalidToken):
+            return {}  # missing, or written with another key: tokens are simply refreshed again
+
+    def _write(self, cache: Dict[str, Dict]):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._cipher().encrypt(json.dumps(cache).encode()))
+        os.replace(tmp, self.path)
+        if self.path == cache_path() and os.path.exists(legacy_cache_path()):
+            os.remove(legacy_cache_path())  # don't leave plaintext tokens from an older version behind
+
+    # --- Tokens ---
+    def credentials(self, spec: TokenSpec, scopes: Optional[List[str]] = None) -> BrokeredCredentials:
+        return BrokeredCredentials(self, spec, scopes)
+
+    def get_token(self, spec: TokenSpec, request=None, rejected: Optional[str] = None) -> Tuple[str, datetime]:
+        """Returns (access token, naive UTC expiry), refreshing only if no usable token is cached."""
+        entry = self._read().get(spec.key)
+        if self._usable(entry, rejected):
+            self.hits += 1
+            return entry["token"], self._expiry(entry)
+
+        with self._locked():
+            cache = self._read()
+            entry = cache.get(spec.key)
+            # Another process may have refreshed while we waited for the lock.
+            if self._usable(entry, rejected):
+                self.hits += 1
+            else:
+                entry = self._refresh(spec, request)
+                self.refreshes += 1
+            entry["used_at"] = time.time()
+            cache[spec.key] = entry
+            self._write(cache)
+        return entry["token"], self._expiry(entry)
+
+    def seed(self, spec: TokenSpec, token: str, expiry: Optional[datetime]):
+        """Stores a token obtained elsewhere (e.g. the OAuth code exchange)."""
+        if not token or not expiry:
+            return
+        expires_at = expiry.replace(tzinfo=timezone.utc).timestamp()
+        with self._locked():
+            cache = self._read()
+            cache[spec.key] = {"token": token, "expires_at": expires_at, "used_at": time.time()}
+            self._write(cache)
+
+    def _usable(self, entry: Optional[Dict], rejected: Optional[str]) -> bool:
+        return bool(entry) and entry["token"] != rejected and entry["expires_at"] - time.time() > self.min_validity
+
+    @staticmethod
+    def _expiry(entry: Dict) -> datetime:
+        # google-auth compares expiry against a naive UTC datetime
+        return datetime.fromtimestamp(entry["expires_at"], timezone.utc).replace(tzinfo=None)
+
+    @staticmethod
+    def _refresh(spec: TokenSpec, request=None) -> Dict:
+        creds = Credentials(None, refresh_token=spec.refresh_token, token_uri=spec.token_uri,
+                            client_id=spec.client_id, client_secret=spec.client_secret)
+        creds.refresh(request or Request())
+        return {"token": creds.token, "expires_at": creds.expiry.replace(tzinfo=timezone.utc).timestamp()}
+
+    # --- Background refresh ---
+    def refresh_due(self, specs: Iterable[TokenSpec], pinned: Iterable[TokenSpec] = ()) -> int:
+        """Refreshes tokens expiring within refresh_margin.
+
+        Pinned specs are always kept warm; others only while they have been used
+        within TOKEN_ACTIVE_SECONDS, so idle users don't cost a refresh every hour.
+        """
+        active_window = float(os.getenv("TOKEN_ACTIVE_SECONDS") or "3600")
+        pinned = {spec.key: spec for spec in pinned}
+        todo = {**{spec.key: spec for spec in specs}, **pinned}
+        refreshed = 0
+        now = time.time()
+        for key, spec in todo.items():
+            entry = self._read().get(key)
+            if entry and entry["expires_at"] - now > self.refresh_margin:
+                continue
+            if key not in pinned and (not entry or now - entry.get("used_at", 0) > active_window):
+                continue
+            try:
+                with self._locked():
+                    cache = self._read()
+                    current = cache.get(key)
+                    if current and current["expires_at"] - time.time() > self.refresh_margin:
+                        continue
+                    fresh = self._refresh(spec)
+                    fresh["used_at"] = (current or {}).get("used_at", 0)
+                    cache[key] = fresh
+                    self._write(cache)
+                refreshed += 1
+                self.background_refreshes += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Background token refresh failed for {key}: {e}")
+        return refreshed
+
+    def start(self, specs: Callable[[], Iterable[TokenSpec]], pinned: Callable[[], Iterable[TokenSpec]],
+              interval: Optional[float] = None):
+        """Runs refresh_due every interval seconds in a daemon thread (first pass immediately)."""
+        if self._thread:
+            return
+        interval = interval or float(os.getenv("TOKEN_BROKER_INTERVAL_SECONDS") or "60")
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.refresh_due(specs(), pinned())
+                except Exception as e:
+                    logger.error(f"Token broker pass failed: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="token-broker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cached_tokens": len(self._read()),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "background_refreshes": self.background_refreshes,
+            "errors": self.errors,
+        }
+
+
+def google_specs(stored: Iterable[Dict] = ()) -> List[TokenSpec]:
+    """Credential sets the Gmail and Calendar servers will use: the .env account plus stored users."""
+    specs: Dict[str, TokenSpec] = {}
+    for prefix in ("GMAIL", "CALENDAR"):
+        client_id = os.getenv(f"{prefix}_CLIENT_ID") or os.getenv("GMAIL_CLIENT_ID")
+        client_secret = os.getenv(f"{prefix}_CLIENT_SECRET") or os.getenv("GMAIL_CLIENT_SECRET")
+        token_uri = google_token_uri(os.getenv(f"{prefix}_API_BASE_URL"))
+        env_token = os.getenv(f"{prefix}_REFRESH_TOKEN") or os.getenv("GMAIL_REFRESH_TOKEN")
+        candidates = [{"refresh_token": env_token}] if env_token else []
+        for creds in candidates + list(stored):
+            spec_client_id = creds.get("client_id") or client_id
+            spec_client_secret = creds.get("client_secret") or client_secret
+            if creds.get("refresh_token") and spec_client_id and spec_client_secret:
+                spec = TokenSpec(creds["refresh_token"], spec_client_id, spec_client_secret, token_uri)
+                specs[spec.key] = spec
+    return list(specs.values())
+
+
+_default_broker: Optional[TokenBroker] = None
+
+
+def default_broker() -> TokenBroker:
+    global _default_broker
+    if _default_broker is None:
+        _default_broker = TokenBroker()
+    return _default_broker
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from credential_store import private_dir, private_file
+
+# Read-through cache for MCP tool results, shared by the MCP servers.
+#
+# A negotiation often repeats the same read (find_free_slots, list_events,
+# list_meetings) within a few turns. Results are cached per identity under the tool
+# name and its normalized arguments (sorted keys, None/empty values dropped) for the
+# tool's TTL, in one bounded LRU per server process. A write tool clears that
+# identity's entries for the reads it affects, and a read that was already running
+# when the write happened is not stored. Error results are never cached. Servers may
+# scope entries by account instead of identity and pass a longer TTL while push
+# notifications (push_channels.py) invalidate the account on every change.
+#
+# mcp_pool.py runs several instances of each server, each with its own LRU, and a write
+# reaches only one of them. So every scope has a write counter ("generation") in a SQLite
+# file all instances share: a write bumps it, and an entry cached under an older
+# generation is a miss in every instance.
+#
+# Env:
+#   MCP_CACHE_ENABLED          - set to 0 to turn the cache off (default on)
+#   MCP_CACHE_SIZE             - max cached results per server (default 256)
+#   MCP_CACHE_TTLS             - TTL overrides in seconds, e.g. "list_events=15;find_free_slots=0" (0 disables a tool)
+#   MCP_CACHE_GENERATIONS_PATH - shared write counters (default <repo>/.tool_cache/generations.db)
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    ttls = {}
+    for part in filter(None, (p.strip() for p in spec.split(";"))):
+        tool, _, seconds = part.partition("=")
+        ttls[tool.strip()] = float(seconds)
+    return ttls
+
+
+def normalize(arguments: Dict[str, Any]) -> str:
+    """Canonical form of tool arguments, so equivalent calls share an entry."""
+    cleaned = {k: v.strip() if isinstance(v, str) else v for k, v in arguments.items()}
+    cleaned = {k: v for k, v in cleaned.items() if v is not None and v != "" and v != [] and v != {}}
+    return json.dumps(cleaned, sort_keys=True, default=str)
+
+
+def is_error(result: Any) -> bool:
+    if isinstance(result, dict):
+        return "error" in result
+    if isinstance(result, list):
+        return any(isinstance(item, dict) and "error" in item for item in result)
+    return False
+
+
+class SharedGenerations:
+    """Per-scope write counters in a SQLite file shared by every instance of a server."""
+
+    def __init__(self, path: str):
+        private_dir(os.path.dirname(path))
+        self.path = private_file(path)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS generations (scope TEXT PRIMARY KEY, generation INTEGER)")
+        self._lock = threading.Lock()
+
+    def get(self, scope: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT generation FROM generations WHERE scope = ?", (scope,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, scope: str):
+        with self._lock:
+            self._db.execute("INSERT INTO generations VALUES (?, 1)"
+                             " ON CONFLICT (scope) DO UPDATE SET generation = generation + 1", (scope,))
+
+
+class ToolCache:
+    def __init__(self, ttls: Dict[str, float], invalidates: Dict[str, List[str]], name: str = "tools",
+                 maxsize: Optional[int] = None, enabled: Optional[bool] = None,
+                 generations_path: Optional[str] = None):
+        """ttls: read tool -> seconds; invalidates: write tool -> read tools it makes stale.
+
+        name namespaces this server's scopes in the shared generations file.
+        """
+        self.ttls = dict(ttls)
+        self.ttls.update(parse_ttls(os.getenv("MCP_CACHE_TTLS", "")))
+        self.invalidates = invalidates
+        self.name = name
+        self.maxsize = maxsize or int(os.getenv("MCP_CACHE_SIZE") or "256")
+        self.enabled = enabled if enabled is not None else os.getenv("MCP_CACHE_ENABLED", "1") != "0"
+        # (scope, tool, arguments) -> (expires, generation, result)
+        self._items: "OrderedDict[Tuple, Tuple[float, int, Any]]" = OrderedDict()
+        self._generations_path = generations_path
+        self._shared: Optional[SharedGenerations] = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def shared(self) -> SharedGenerations:
+        # Opened on first use, so importing a server with the cache off creates no file
+        if self._shared is None:
+            self._shared = SharedGenerations(self._generations_path or os.getenv("MCP_CACHE_GENERATIONS_PATH")
+                                             or os.path.join(BASE_DIR, ".tool_cache", "generations.db"))
+        return self._shared
+
+    def _generation(self, scope: Hashable) -> int:
+        return self.shared.get(f"{self.name}:{json.dumps(scope, default=str)}")
+
+    def _count(self, tool: str, event: str, n: int = 1):
+        s = self._stats.setdefault(tool, {"hits": 0, "misses": 0, "invalidated": 0, "evictions": 0})
+        s[event] += n
+
+    def get(self, scope: Hashable, tool: str, arguments: Dict[str, Any], compute: Callable[[], Any],
+            ttl: Optional[float] = None) -> Any:
+        """Returns the cached result for this call, or computes and caches it.
+
+        ttl extends the tool's TTL for this call (e.g. while push notifications cover the scope).
+        """
+        base = self.ttls.get(tool, 0)
+        if not self.enabled or base <= 0:
+            return compute()
+        ttl = max(base, ttl or 0)
+        key = (scope, tool, normalize(arguments))
+        generation = self._generation(scope)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry and entry[0] > now and entry[1] == generation:
+                self._items.move_to_end(key)
+                self._count(tool, "hits")
+                return entry[2]
+            if entry and entry[1] != generation:
+                self._count(tool, "invalidated")
+            self._items.pop(key, None)
+            self._count(tool, "misses")
+        result = compute()
+        if is_error(result):
+            return result
+        # A write for this scope (in any instance) while we were computing may have made the result stale
+        if self._generation(scope) != generation:
+            return result
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, generation, result)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                (_, evicted_tool, _), _ = self._items.popitem(last=False)
+                self._count(evicted_tool, "evictions")
+        return result
+
+    def invalidate(self, scope: Hashable, tools: List[str]) -> int:
+        """Drops the scope's cached results for the given tools, in every instance of this server."""
+        if self.enabled:
+            self.shared.bump(f"{self.name}:{json.dumps(scope, default=str)}")
+        with self._lock:
+            stale = [key for key in self._items if key[0] == scope and key[1] in tools]
+            for key in stale:
+                del self._items[key]
+                self._count(key[1], "invalidated")
+        return len(stale)
+
+    def after_write(self, scope: Hashable, tool: str):
+        """Call after a write tool runs (whether or not it succeeded)."""
+        tools = self.invalidates.get(tool)
+        if tools:
+            dropped = self.invalidate(scope, tools)
+            if dropped:
+                logger.info(f"{tool}: invalidated {dropped} cached result(s)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tools = {}
+            for tool, s in self._stats.items():
+                lookups = s["hits"] + s["misses"]
+                tools[tool] = dict(s, hit_rate=round(s["hits"] / lookups, 3) if lookups else 0.0)
+            return {"enabled": self.enabled, "size": len(self._items), "maxsize": self.maxsize,
+                    "ttls": dict(self.ttls), "tools": tools}
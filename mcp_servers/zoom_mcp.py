@@ -14,6 +14,10 @@ from mcp.server.models import InitializationOptions
 import mcp.server.stdio
 from mcp import types as mcp_types
 
+from credential_store import ClientCache, Identity, pop_identity, stored_credentials
+from result_serializer import default_serializer, serialize
+from tool_cache import ToolCache
+
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -27,10 +31,17 @@ class ZoomService:
     BASE_URL = "https://api.zoom.us/v2"
     OAUTH_URL = "https://zoom.us/oauth/token"
 
-    def __init__(self):
-        self.account_id = os.getenv("ZOOM_ACCOUNT_ID")
-        self.client_id = os.getenv("ZOOM_CLIENT_ID")
-        self.client_secret = os.getenv("ZOOM_CLIENT_SECRET")
+    def __init__(self, base_url: Optional[str] = None, creds: Optional[Dict] = None):
+        # Optional API root (e.g. the local fake_apis server) serving /v2 and /oauth/token
+        base_url = (base_url or os.getenv("ZOOM_API_BASE_URL") or "").rstrip("/")
+        if base_url:
+            self.BASE_URL = f"{base_url}/v2"
+            self.OAUTH_URL = f"{base_url}/oauth/token"
+        # Per-tenant Server-to-Server app credentials from the credential store; env when None
+        creds = creds or {}
+        self.account_id = creds.get("account_id") or os.getenv("ZOOM_ACCOUNT_ID")
+        self.client_id = creds.get("client_id") or os.getenv("ZOOM_CLIENT_ID")
+        self.client_secret = creds.get("client_secret") or os.getenv("ZOOM_CLIENT_SECRET")
         self.access_token = None
         self.token_expires_at = 0
 
@@ -126,7 +137,25 @@ class ZoomService:
 
 # --- MCP Server Setup ---
 app = Server("zoom-mcp-server")
-zoom_service = None
+zoom_service = None # Initialize later (env credentials)
+zoom_clients = ClientCache() # Per-user services built from the credential store
+# Repeated reads within a negotiation are served from here; writes clear them
+tool_cache = ToolCache(name="zoom", ttls={"list_meetings": 60}, invalidates={"create_meeting": ["list_meetings"]})
+
+def get_zoom_service(identity: Identity) -> ZoomService:
+    """Returns the service for the user the call was made for.
+
+    The env Server-to-Server app is the operator's shared Zoom account: it hosts the meetings
+    booked for every user, so unlike Gmail and Calendar, users without stored Zoom credentials
+    use it rather than getting AccountNotConnected. A tenant may store its own app credentials.
+    """
+    global zoom_service
+    creds = stored_credentials(identity, "zoom")
+    if creds:
+        return zoom_clients.get((identity, creds["version"]), lambda: ZoomService(creds=creds))
+    if not zoom_service:
+        zoom_service = ZoomService()
+    return zoom_service
 
 @app.list_tools()
 async def list_tools() -> list[mcp_types.Tool]:
@@ -153,29 +182,41 @@ async def list_tools() -> list[mcp_types.Tool]:
                 },
                 "required": ["topic", "start_time", "duration"]
             }
+        ),
+        mcp_types.Tool(
+            name="get_diagnostics",
+            description="Cache hit rates and client statistics for this Zoom server.",
+            inputSchema={"type": "object", "properties": {}}
         )
     ]
 
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[mcp_types.Content]:
-    global zoom_service
-    if not zoom_service:
-        try:
-            zoom_service = ZoomService()
-        except Exception as e:
+    identity = pop_identity(arguments)
+    try:
+        service = get_zoom_service(identity)
+    except Exception as e:
             return [mcp_types.TextContent(type="text", text=f"Error initializing Zoom Service: {str(e)}")]
 
     if name == "list_meetings":
-        result = zoom_service.list_meetings(page_size=arguments.get("page_size", 10))
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        page_size = arguments.get("page_size", 10)
+        result = tool_cache.get(identity, name, {"page_size": page_size},
+                                lambda: service.list_meetings(page_size=page_size))
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     elif name == "create_meeting":
-        result = zoom_service.create_meeting(
+        result = service.create_meeting(
             arguments["topic"],
             arguments["start_time"],
             arguments["duration"]
         )
-        return [mcp_types.TextContent(type="text", text=json.dumps(result, indent=2))]
+        tool_cache.after_write(identity, name)
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
+
+    elif name == "get_diagnostics":
+        result = {"tool_cache": tool_cache.stats(), "result_sizes": default_serializer.stats(),
+                  "clients": zoom_clients.stats()}
+        return [mcp_types.TextContent(type="text", text=serialize(name, result))]
 
     return [mcp_types.TextContent(type="text", text="Tool not found")]
 
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import PrivateAttr
+
+# Hedged model calls: cut the tail latency caused by an occasional slow Gemini response.
+#
+# hedged(model) wraps an agent's model when GEMINI_HEDGING=1 and returns it unchanged
+# otherwise. Each agent keeps a window of its recent response times. When a call has
+# not returned after GEMINI_HEDGE_PERCENTILE of that window (but never sooner than
+# GEMINI_HEDGE_MIN_DELAY_MS), a duplicate request is sent. Whichever answers first is
+# used and the other is cancelled. If one attempt fails, the other is awaited. Hedging
+# starts once GEMINI_HEDGE_MIN_SAMPLES calls have been timed. At most GEMINI_HEDGE_MAX_RATE
+# of the recent calls may be hedged, so a slow model can't double the load on itself.
+# Both attempts go through the wrapped model, so with RateLimitedGemini the duplicate
+# also counts against the shared rate limit.
+#
+# Only non-streaming calls are hedged (the agents don't stream). For a non-streaming
+# call the first token is the whole response, so the delay is measured to the response.
+#
+# A random GEMINI_HEDGE_CONTROL_RATE of calls is never hedged. These calls, plus those
+# made before hedging starts, measure the latency without hedging. hedge_stats() reports
+# the hedge rate and how often the duplicate won. It also compares the p99 latency of the
+# calls that could be hedged with the p99 of the calls that could not.
+#
+# Env:
+#   GEMINI_HEDGING             - 1 to hedge model calls (default 0)
+#   GEMINI_HEDGE_PERCENTILE    - response time percentile used as the hedge delay (default 95)
+#   GEMINI_HEDGE_MIN_DELAY_MS  - shortest hedge delay (default 250)
+#   GEMINI_HEDGE_MIN_SAMPLES   - calls timed before hedging starts (default 20)
+#   GEMINI_HEDGE_MAX_RATE      - largest fraction of recent calls that may be hedged (default 0.1)
+#   GEMINI_HEDGE_CONTROL_RATE  - fraction of calls left unhedged to measure the gain (default 0.05)
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 200
+STATS_WINDOW = 1000
+
+
+def hedging_enabled() -> bool:
+    return (os.getenv("GEMINI_HEDGING") or "0").lower() in ("1", "true", "yes")
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class HedgeStats:
+    def __init__(self):
+        self.counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "hedge_errors": 0, "skipped_rate_cap": 0}
+        self.latencies: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self.unhedged_latencies: Deque[float] = deque(maxlen=STATS_WINDOW)
+
+    def record(self, latency: float, could_hedge: bool):
+        self.counters["calls"] += 1
+        (self.latencies if could_hedge else self.unhedged_latencies).append(latency)
+
+    def stats(self) -> Dict:
+        p99 = _percentile(self.latencies, 99)
+        p99_unhedged = _percentile(self.unhedged_latencies, 99)
+        calls = self.counters["calls"]
+        return {
+            "enabled": hedging_enabled(),
+            **self.counters,
+            "hedge_rate": round(self.counters["hedged"] / calls, 4) if calls else 0.0,
+            "p50_ms": round(_percentile(self.latencies, 50) * 1000, 1) if self.latencies else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            "p99_unhedged_ms": round(p99_unhedged * 1000, 1) if p99_unhedged is not None else None,
+            "p99_saved_ms": round((p99_unhedged - p99) * 1000, 1) if None not in (p99, p99_unhedged) else None,
+            "samples": len(self.latencies),
+            "unhedged_samples": len(self.unhedged_latencies),
+        }
+
+
+_stats = HedgeStats()
+
+
+def hedge_stats() -> Dict:
+    return _stats.stats()
+
+
+class HedgedLlm(BaseLlm):
+    """Wraps a model so that slow non-streaming calls are raced against a duplicate request."""
+
+    inner: BaseLlm
+    percentile: float = 95.0
+    min_delay: float = 0.25
+    min_samples: int = 20
+    max_rate: float = 0.1
+    control_rate: float = 0.05
+
+    _latencies: Deque[float] = PrivateAttr(default_factory=lambda: deque(maxlen=WINDOW))
+    _recent_hedges: Deque[bool] = PrivateAttr(default_factory=lambda: deque(maxlen=WINDOW))
+
+    def __init__(self, inner: BaseLlm, **kwargs):
+        kwargs.setdefault("percentile", float(os.getenv("GEMINI_HEDGE_PERCENTILE") or "95"))
+        kwargs.setdefault("min_delay", float(os.getenv("GEMINI_HEDGE_MIN_DELAY_MS") or "250") / 1000)
+        kwargs.setdefault("min_samples", int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES") or "20"))
+        kwargs.setdefault("max_rate", float(os.getenv("GEMINI_HEDGE_MAX_RATE") or "0.1"))
+        kwargs.setdefault("control_rate", float(os.getenv("GEMINI_HEDGE_CONTROL_RATE") or "0.05"))
+        super().__init__(model=inner.model, inner=inner, **kwargs)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while too few calls have been timed."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, _percentile(self._latencies, self.percentile))
+
+    def _may_hedge(self) -> bool:
+        recent = self._recent_hedges
+        return bool(recent) and (sum(recent) + 1) / len(recent) <= self.max_rate
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if stream:
+            async for response in self.inner.generate_content_async(llm_request, stream):
+                yield response
+            return
+        for response in await self._hedged_call(llm_request):
+            yield response
+
+    def _copy_request(self, llm_request: LlmRequest) -> LlmRequest:
+        """Copy for the duplicate, taken before the primary starts: the model appends to contents
+        and edits config. The tools are shared; they hold live MCP sessions and can't be copied."""
+        config = llm_request.config.model_copy(deep=True) if llm_request.config else None
+        return llm_request.model_copy(update={"contents": list(llm_request.contents), "config": config})
+
+    async def _attempt(self, llm_request: LlmRequest) -> List[LlmResponse]:
+        return [r async for r in self.inner.generate_content_async(llm_request, False)]
+
+    async def _hedged_call(self, llm_request: LlmRequest) -> List[LlmResponse]:
+        started = time.monotonic()
+        duplicate = self._copy_request(llm_request)
+        primary = asyncio.create_task(self._attempt(llm_request))
+        tasks = [primary]
+        delay = self.hedge_delay()
+        if delay is not None and random.random() < self.control_rate:
+            delay = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    if self._may_hedge():
+                        tasks.append(asyncio.create_task(self._attempt(duplicate)))
+                        _stats.counters["hedged"] += 1
+                    else:
+                        _stats.counters["skipped_rate_cap"] += 1
+            self._recent_hedges.append(len(tasks) > 1)
+            winner = await self._first_success(tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        elapsed = time.monotonic() - started
+        if winner is not primary:
+            _stats.counters["hedge_wins"] += 1
+        self._latencies.append(elapsed)
+        _stats.record(elapsed, could_hedge=delay is not None)
+        return winner.result()
+
+    async def _first_success(self, tasks: List[asyncio.Task]) -> asyncio.Task:
+        """The first task to succeed; when all fail, re-raises the primary's error."""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=tasks.index):
+                if task.exception() is None:
+                    return task
+                if len(tasks) > 1:
+                    _stats.counters["hedge_errors"] += 1
+                    logger.warning(f"Hedged {self.model} attempt failed: {task.exception()!r}")
+        return tasks[0]
+
+
+def hedged(model: BaseLlm) -> BaseLlm:
+    """model wrapped in HedgedLlm when GEMINI_HEDGING is on, else model itself."""
+    return HedgedLlm(model) if hedging_enabled() else model
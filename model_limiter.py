@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import AsyncGenerator, Dict, Optional
+
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import errors
+
+from admission import Overloaded
+
+# Process-wide rate limit and retry policy for Gemini calls.
+#
+# Every agent's model is a RateLimitedGemini, and all of them share one limiter: two token
+# buckets, refilled continuously, for requests per minute and tokens per minute. A call
+# first takes one request and its estimated tokens (prompt characters / 4 plus
+# GEMINI_OUTPUT_TOKEN_ESTIMATE). It waits in FIFO order when either bucket is short.
+# When the response reports its usage, the token bucket is corrected by the difference
+# from what was debited (estimates above GEMINI_TPM are capped at it).
+# A 429 or 503 that arrives before any response is retried after a jittered exponential
+# backoff, up to GEMINI_MAX_ATTEMPTS attempts in total. When those run out, the error is
+# raised as admission.Overloaded, so the chat endpoints answer 503 with Retry-After
+# rather than 500.
+#
+# Env:
+#   GEMINI_RPM                    - requests per minute; 0 = unlimited (default 1000)
+#   GEMINI_TPM                    - tokens per minute; 0 = unlimited (default 1000000)
+#   GEMINI_OUTPUT_TOKEN_ESTIMATE  - output tokens assumed per call before usage is known (default 512)
+#   GEMINI_MAX_ATTEMPTS           - attempts per call on 429/503 (default 4)
+#   GEMINI_BACKOFF_SECONDS        - first retry delay, doubled per attempt up to 30s (default 1)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_CODES = {429, 503}
+MAX_BACKOFF = 30.0
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it is now)."""
+        self.refill()
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class ModelRateLimiter:
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        rpm = rpm if rpm is not None else float(os.getenv("GEMINI_RPM") or "1000")
+        tpm = tpm if tpm is not None else float(os.getenv("GEMINI_TPM") or "1000000")
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+        self.counters = {"requests": 0, "throttled": 0, "retries": 0, "exhausted": 0,
+                         "tokens_estimated": 0, "tokens_used": 0}
+        self.retries_by_code: Dict[str, int] = {}
+        self.throttle_wait_seconds = 0.0
+        self.max_throttle_wait_seconds = 0.0
+
+    def _fifo(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        return self._lock
+
+    async def acquire(self, tokens: int) -> int:
+        """Takes one request and the estimated tokens, waiting as needed.
+
+        Returns the tokens actually debited (the estimate, capped at the bucket's capacity),
+        which is what settle() corrects against.
+        """
+        if self.tokens:
+            tokens = min(tokens, self.tokens.capacity)  # an oversized request still goes through eventually
+        started = time.monotonic()
+        async with self._fifo():
+            while True:
+                wait = max(self.requests.wait_for(1) if self.requests else 0.0,
+                           self.tokens.wait_for(tokens) if self.tokens else 0.0)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests:
+                self.requests.level -= 1
+            if self.tokens:
+                self.tokens.level -= tokens
+        waited = time.monotonic() - started
+        self.counters["requests"] += 1
+        self.counters["tokens_estimated"] += tokens
+        if waited > 0.001:
+            self.counters["throttled"] += 1
+            self.throttle_wait_seconds += waited
+            self.max_throttle_wait_seconds = max(self.max_throttle_wait_seconds, waited)
+        return tokens
+
+    def settle(self, debited: int, used: int):
+        """Corrects the token bucket by what acquire() debited once the response reports its actual usage."""
+        self.counters["tokens_used"] += used
+        if self.tokens:
+            self.tokens.refill()
+            self.tokens.level -= used - debited
+
+    def record_retry(self, code: int):
+        self.counters["retries"] += 1
+        self.retries_by_code[str(code)] = self.retries_by_code.get(str(code), 0) + 1
+
+    def stats(self) -> Dict:
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                bucket.refill()
+        return {
+            "rpm": self.requests.capacity if self.requests else None,
+            "tpm": self.tokens.capacity if self.tokens else None,
+            "requests_available": round(self.requests.level, 1) if self.requests else None,
+            "tokens_available": round(self.tokens.level) if self.tokens else None,
+            **self.counters,
+            "retries_by_code": dict(self.retries_by_code),
+            "throttle_wait_seconds": round(self.throttle_wait_seconds, 3),
+            "max_throttle_wait_seconds": round(self.max_throttle_wait_seconds, 3),
+        }
+
+
+_limiter: Optional[ModelRateLimiter] = None
+
+
+def default_limiter() -> ModelRateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = ModelRateLimiter()
+    return _limiter
+
+
+def estimate_tokens(llm_request: LlmRequest) -> int:
+    chars = sum(len(part.text or "") for content in llm_request.contents for part in (content.parts or []))
+    if llm_request.config and isinstance(llm_request.config.system_instruction, str):
+        chars += len(llm_request.config.system_instruction)
+    return chars // 4 + int(os.getenv("GEMINI_OUTPUT_TOKEN_ESTIMATE") or "512")
+
+
+class RateLimitedGemini(Gemini):
+    """Gemini whose calls go through the shared limiter and retry 429/503 with backoff."""
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        limiter = default_limiter()
+        max_attempts = int(os.getenv("GEMINI_MAX_ATTEMPTS") or "4")
+        backoff = float(os.getenv("GEMINI_BACKOFF_SECONDS") or "1")
+        attempt = 0
+        while True:
+            attempt += 1
+            debited = await limiter.acquire(estimate_tokens(llm_request))
+            responded = settled = False
+            try:
+                async for response in super().generate_content_async(llm_request, stream):
+                    responded = True
+                    usage = response.usage_metadata
+                    if not settled and usage and usage.total_token_count:
+                        limiter.settle(debited, usage.total_token_count)
+                        settled = True
+                    yield response
+                return
+            except errors.APIError as e:
+                # Once part of a response has been yielded the call can't be replayed
+                if responded or e.code not in RETRYABLE_CODES:
+                    raise
+                if attempt >= max_attempts:
+                    limiter.counters["exhausted"] += 1
+                    raise Overloaded(f"Model unavailable ({e.code}) after {attempt} attempts",
+                                     retry_after=max(1, round(min(MAX_BACKOFF, backoff * 2 ** attempt)))) from e
+                delay = random.uniform(0.5, 1.0) * min(MAX_BACKOFF, backoff * 2 ** (attempt - 1))
+                limiter.record_retry(e.code)
+                logger.warning(f"{self.model} returned {e.code}; retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
@@ -1,17 +1,27 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Awaitable, Callable, Optional, Tuple
 import os
 import sys
+import asyncio
+import base64
+import hmac
+import json
+import time
 
 # Add the current directory to sys.path to ensure imports work correctly
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from agent import root_agent
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.genai import types
+from conversation_gate import ConversationGate
+from chat_jobs import ChatJobs, JobsFull
+from admission import AdmissionController, Overloaded
+from intent_router import IntentRouter, ROUTE_LIGHT, ROUTE_ORCHESTRATOR
+from identity_token import InvalidIdentityToken, token_required, token_secret, verify as verify_identity_token
+import chat_socket
+from mcp_servers.credential_store import CredentialStore, DEFAULT_TENANT, DEFAULT_USER
+from mcp_servers.token_broker import default_broker, google_specs
+from mcp_servers.push_channels import CALENDAR, GMAIL, PushRegistry, push_enabled
 
 app = FastAPI()
 
@@ -30,48 +40,205 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Encrypted per-user OAuth credentials, read by the MCP servers for each tool call
+credential_store = CredentialStore()
+
+# Shared Google access-token cache; this process keeps it fresh for the MCP servers
+token_broker = default_broker()
+
+@app.on_event("startup")
+async def start_token_broker():
+    token_broker.start(
+        specs=lambda: google_specs(credential_store.list_credentials("google")),
+        pinned=google_specs,
+    )
+
+# --- AGENT RUNTIME ---
+# google.adk and the agent graph (agent.py) take seconds to import. By default they load
+# with this module. With FAST_STARTUP=1 they load on a background thread when the app
+# starts, so uvicorn binds the port first; /api/health reports the load and chat
+# requests wait for it. Either way the MCP server pools are prewarmed once it is done.
+FAST_STARTUP = os.getenv("FAST_STARTUP", "0") == "1"
+
+root_agent = None
+# Light agent for small talk and FAQ turns (see intent_router.py)
+faq_agent = None
 # In-memory session service to store conversation history
-session_service = InMemorySessionService()
+session_service = None
+# Opt-in turn recorder (set CHAT_RECORD_DIR); recordings can be replayed with benchmarks/replay.py
+turn_recorder = None
+identity_plugin = None
+runtime_status: Dict[str, Any] = {"state": "loading", "load_seconds": None, "error": None}
+_runtime_loading: Optional[asyncio.Future] = None
+
+def load_runtime():
+    """Imports ADK and the agent graph and creates the objects chat turns use."""
+    global root_agent, faq_agent, session_service, turn_recorder, identity_plugin
+    started = time.perf_counter()
+    from agent import faq_agent as light_agent, root_agent as agent
+    from google.adk.sessions import InMemorySessionService
+    from identity_plugin import IdentityPlugin
+    from turn_recorder import TurnRecorder
+
+    session_service = InMemorySessionService()
+    turn_recorder = TurnRecorder.from_env()
+    identity_plugin = IdentityPlugin()
+    faq_agent = light_agent
+    root_agent = agent
+    runtime_status.update(state="ready", load_seconds=round(time.perf_counter() - started, 3), error=None)
+
+async def _load_runtime_in_background():
+    if root_agent is None:
+        try:
+            await asyncio.to_thread(load_runtime)
+        except Exception as e:
+            runtime_status.update(state="failed", error=str(e))
+            print(f"Agent load failed: {e}")
+            raise
+    from mcp_pool import start_pools
+    start_pools()
+
+def _start_runtime_loading() -> asyncio.Future:
+    global _runtime_loading
+    if _runtime_loading is None or (_runtime_loading.done() and runtime_status["state"] == "failed"):
+        runtime_status.update(state="loading")
+        _runtime_loading = asyncio.ensure_future(_load_runtime_in_background())
+        # The failure is reported through runtime_status and to waiting requests
+        _runtime_loading.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return _runtime_loading
+
+async def agent_runtime():
+    """Waits until the agent graph is loaded (starting the load if needed)."""
+    if root_agent is None:
+        await asyncio.shield(_start_runtime_loading())
+
+if not FAST_STARTUP:
+    load_runtime()
+
+@app.on_event("startup")
+async def start_agent_runtime():
+    _start_runtime_loading()
+
+@app.on_event("shutdown")
+async def stop_mcp_pools():
+    await chat_jobs.close()
+    if root_agent is not None:
+        from mcp_pool import close_pools
+        await close_pools()
+
+# Serializes turns per conversation and coalesces duplicate submissions
+conversation_gate = ConversationGate(coalesce_window=float(os.getenv("CHAT_COALESCE_WINDOW_SECONDS", "5")))
+
+# Caps concurrent interactive turns; sheds load with 503 + Retry-After (see admission.py)
+admission = AdmissionController()
+
+# Sends small talk and FAQ turns to faq_agent instead of the orchestrator
+intent_router = IntentRouter()
 
 class ChatRequest(BaseModel):
     messages: List[Dict[str, Any]]
     new_message: str
     conversation_id: str = "default-session"
+    # Set from the identity token (see bind_identity); if sent, they must match it
+    user_id: Optional[str] = None
+    tenant_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     text: str
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+# --- IDENTITY ---
+# The tenant/user a request acts for comes from a signed identity token (identity_token.py),
+# never from the request body. Without a token, requests act as the default identity.
+def authenticated_identity(authorization: Optional[str], token: Optional[str] = None) -> Tuple[str, str]:
+    """(tenant_id, user_id) from a Bearer header or token; raises 401 for a bad or missing token."""
+    if authorization:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer":
+            raise HTTPException(status_code=401, detail="Expected 'Authorization: Bearer <identity token>'")
+    if not token:
+        if token_required():
+            raise HTTPException(status_code=401, detail="Identity token required")
+        return DEFAULT_TENANT, DEFAULT_USER
     try:
-        user_id = "user" # comprehensive-agent-user
-        session_id = request.conversation_id
-
+        return verify_identity_token(token.strip())
+    except InvalidIdentityToken as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+def check_claimed_identity(identity: Tuple[str, str], tenant_id: Optional[str], user_id: Optional[str]):
+    """tenant_id/user_id sent by the client may only repeat the authenticated identity."""
+    if (tenant_id or identity[0], user_id or identity[1]) != identity:
+        raise HTTPException(status_code=403, detail="user_id/tenant_id do not match the identity token")
+
+def bind_identity(request: BaseModel, authorization: Optional[str]):
+    """Sets request.tenant_id/user_id to the authenticated identity."""
+    identity = authenticated_identity(authorization)
+    check_claimed_identity(identity, request.tenant_id, request.user_id)
+    request.tenant_id, request.user_id = identity
+
+def session_user_id(tenant_id: str, user_id: str) -> str:
+    """ADK session owner; tenant-qualified so equal user IDs in different tenants don't collide."""
+    return user_id if tenant_id == DEFAULT_TENANT else f"{tenant_id}:{user_id}"
+
+def new_runner(route: str = ROUTE_ORCHESTRATOR):
+    """An ADK runner for the orchestrator or, for ROUTE_LIGHT, faq_agent (call after agent_runtime())."""
+    from google.adk.runners import Runner
+    plugins = [identity_plugin, turn_recorder] if turn_recorder else [identity_plugin]
+    agent = faq_agent if route == ROUTE_LIGHT else root_agent
+    return Runner(agent=agent, app_name="personal_orchestrator", session_service=session_service,
+                  plugins=plugins)
+
+async def ensure_chat_session(tenant_id: str, user_id: str, session_id: str):
+    """Creates the ADK session for a conversation if it doesn't exist yet."""
+    from identity_plugin import STATE_TENANT, STATE_USER
+    # create_session on an existing ID replaces the session (and its history) in
+    # InMemorySessionService, so only create it the first time. Turns for one
+    # conversation are serialized by conversation_gate, so this check can't race.
+    owner = session_user_id(tenant_id, user_id)
+    session = await session_service.get_session(app_name="personal_orchestrator", user_id=owner, session_id=session_id)
+    if session is None:
+        # The identity travels in session state so tools act on this user's accounts (see identity_plugin)
+        await session_service.create_session(app_name="personal_orchestrator", user_id=owner, session_id=session_id,
+                                             state={STATE_TENANT: tenant_id, STATE_USER: user_id})
+
+async def run_chat_turn(tenant_id: str, user_id: str, session_id: str, new_message: str,
+                        runners: Optional[Dict[str, Any]] = None,
+                        on_event: Optional[Callable[[Any], Awaitable[None]]] = None) -> str:
+    """Runs one agent turn on the route intent_router picks and returns the final response text.
+
+    Callers that keep runners across turns (/ws/chat) pass a dict, filled per route, and
+    have already called ensure_chat_session. on_event is awaited with each ADK event as it
+    is produced.
+    """
+    await agent_runtime()
+    from google.genai import types
+
+    owner = session_user_id(tenant_id, user_id)
+    intent, route = intent_router.route(f"{owner}/{session_id}", new_message)
+    if runners is None:
         # 1. Initialize Runner
-        runner = Runner(agent=root_agent, app_name="personal_orchestrator", session_service=session_service)
-
+        runner = new_runner(route)
         # 2. Ensure Session Exists
-        # Check if session exists, if not create it
-        # Note: InMemorySessionService doesn't have a simple 'exists' check exposed in all versions, 
-        # but create_session usually handles idempotency or we can just try to create.
-        # For simplicity in this demo, we'll just try to create and ignore if it already exists 
-        # (or rely on the runner to handle session retrieval if the service supports it).
-        # In a real app, you'd check or have a robust get_or_create method.
-        # Here we'll just attempt to create a session if it's the first time for this ID.
-        try:
-             await session_service.create_session(app_name="personal_orchestrator", user_id=user_id, session_id=session_id)
-        except Exception:
-            # If session already exists or other error, we might logging it. 
-            # For InMemorySessionService, create_session might overwrite or error depending on implementation.
-            # Assuming standard ADK behavior, we might not strictly need to call create every time if it persists in memory.
-            pass
-
-        # 3. Prepare Input
-        content = types.Content(role='user', parts=[types.Part(text=request.new_message)])
-
-        # 4. Run Agent
-        response_text = ""
-        async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
+        await ensure_chat_session(tenant_id, user_id, session_id)
+    else:
+        if route not in runners:
+            runners[route] = new_runner(route)
+        runner = runners[route]
+
+    # 3. Prepare Input
+    content = types.Content(role='user', parts=[types.Part(text=new_message)])
+
+    # 4. Run Agent
+    record = None
+    if turn_recorder:
+        record = turn_recorder.start_turn(session_id, owner, new_message, runner.agent.name, route)
+    response_text = ""
+    started, prompt_tokens = time.perf_counter(), 0
+    try:
+        async for event in runner.run_async(user_id=owner, session_id=session_id, new_message=content):
+            if on_event:
+                await on_event(event)
+            if event.usage_metadata and event.usage_metadata.prompt_token_count:
+                prompt_tokens += event.usage_metadata.prompt_token_count
             if event.is_final_response():
                 if event.content and event.content.parts:
                     response_text = event.content.parts[0].text
@@ -80,18 +247,189 @@ async def chat_endpoint(request: ChatRequest):
             elif event.actions and event.actions.escalate:
                 print(f"Error: {event.error_message}")
                 raise HTTPException(status_code=500, detail=f"Agent Error: {event.error_message}")
+    except Exception as e:
+        if record:
+            await turn_recorder.finish_turn(record, error=str(getattr(e, "detail", e)))
+        raise
+
+    intent_router.record(intent, route, time.perf_counter() - started, prompt_tokens)
+    if record:
+        await turn_recorder.finish_turn(record, response_text=response_text)
+    return response_text
+
+def gated_chat_turn(request: ChatRequest, admit: bool = True) -> Awaitable[str]:
+    """run_chat_turn behind conversation_gate (serialized per conversation, duplicates coalesced).
+
+    With admit, the turn also waits for an admission slot once it is its conversation's turn.
+    """
+    key = f"{session_user_id(request.tenant_id, request.user_id)}/{request.conversation_id}"
+
+    def turn():
+        return run_chat_turn(request.tenant_id, request.user_id, request.conversation_id, request.new_message)
 
+    if admit:
+        return conversation_gate.run(key, request.new_message, lambda: admission.run(key, request.new_message, turn))
+    return conversation_gate.run(key, request.new_message, turn)
+
+def overloaded_response(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest, authorization: Optional[str] = Header(None)):
+    bind_identity(request, authorization)
+    try:
+        response_text = await gated_chat_turn(request)
         return ChatResponse(text=response_text)
 
+    except Overloaded as e:
+        raise overloaded_response(e)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Runtime Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- BACKGROUND CHAT JOBS ---
+# For turns that may outlast the client's or the proxy's request timeout: submit, then poll.
+# Job IDs are random and unguessable; a job runs to the end even if nobody polls it.
+chat_jobs = ChatJobs()
 
-# --- GOOGLE AUTHENTICATION FLOW ---
+@app.post("/api/chat/jobs", status_code=202)
+async def submit_chat_job(request: ChatRequest, authorization: Optional[str] = Header(None)):
+    """Queues a chat turn and returns its job ID; poll GET /api/chat/jobs/{job_id} for the result."""
+    bind_identity(request, authorization)
+    try:
+        # Jobs are bounded by CHAT_JOB_WORKERS rather than admission control
+        return chat_jobs.submit(request.conversation_id, lambda: gated_chat_turn(request, admit=False),
+                                owner=(request.tenant_id, request.user_id))
+    except JobsFull as e:
+        raise HTTPException(status_code=503, detail=f"Too many chat jobs: {e}")
+
+@app.get("/api/chat/jobs/{job_id}")
+async def get_chat_job(job_id: str, authorization: Optional[str] = Header(None)):
+    """Job status: queued (with queue_position), running, succeeded (with text) or failed (with error).
+
+    Only the identity that submitted the job can read it; anyone else gets 404.
+    """
+    job = chat_jobs.describe(job_id, owner=authenticated_identity(authorization))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+# --- WEBSOCKET CHAT ---
+# /ws/chat?conversation_id=...&token=... binds one connection to one conversation of the
+# token's user. Browsers can't set headers on WebSockets, so the identity token may come
+# as a query parameter. See chat_socket.py for the protocol. The session and runners (one
+# per route) are set up once per connection instead of per turn, and events stream as
+# they are produced.
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, conversation_id: str = "default-session",
+                         token: Optional[str] = None, user_id: Optional[str] = None,
+                         tenant_id: Optional[str] = None):
+    try:
+        identity = authenticated_identity(websocket.headers.get("authorization"), token)
+        check_claimed_identity(identity, tenant_id, user_id)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    tenant_id, user_id = identity
+    runners: Optional[Dict[str, Any]] = None
+
+    async def run_turn(text: str, on_event) -> str:
+        nonlocal runners
+        if runners is None:
+            await agent_runtime()
+            await ensure_chat_session(tenant_id, user_id, conversation_id)
+            runners = {}
+        key = f"{session_user_id(tenant_id, user_id)}/{conversation_id}"
+        return await conversation_gate.run(key, text, lambda: admission.run(
+            key, text, lambda: run_chat_turn(tenant_id, user_id, conversation_id, text, runners=runners,
+                                             on_event=on_event)))
+
+    await chat_socket.ChatSocket(websocket, conversation_id, run_turn).serve()
+
+@app.get("/api/health")
+async def health():
+    """Liveness/startup probe; answers as soon as the port is bound, with the agent load state."""
+    if runtime_status["state"] == "failed":
+        raise HTTPException(status_code=503, detail=f"Agent load failed: {runtime_status['error']}")
+    return {"status": "ok" if root_agent is not None else "starting", "agent": runtime_status}
+
+@app.get("/api/metrics")
+async def metrics():
+    """Runtime counters for the chat pipeline."""
+    mcp_pools, model, model_hedging = {}, {}, {}
+    if root_agent is not None:
+        from mcp_pool import pool_stats
+        from model_hedging import hedge_stats
+        from model_limiter import default_limiter
+        mcp_pools, model, model_hedging = pool_stats(), default_limiter().stats(), hedge_stats()
+    return {
+        "conversations": conversation_gate.stats(),
+        "admission": admission.stats(),
+        "intent_router": intent_router.stats(),
+        "chat_jobs": chat_jobs.stats(),
+        "websockets": chat_socket.stats(),
+        "tokens": token_broker.stats(),
+        "model": model,
+        "model_hedging": model_hedging,
+        "mcp_pools": mcp_pools,
+    }
+
+
+# --- PUSH NOTIFICATIONS ---
+# Webhooks for the channels the MCP servers register (see mcp_servers/push_channels.py).
+# Each accepted notification is queued for the MCP servers, which drop cached calendar
+# reads or sync the Gmail mirror right away.
+_push_registry: Optional[PushRegistry] = None
+
+def push_registry() -> Optional[PushRegistry]:
+    """Opens .push_channels.db on the first webhook; None while push is not configured."""
+    global _push_registry
+    if _push_registry is None and push_enabled():
+        _push_registry = PushRegistry()
+    return _push_registry
+
+@app.post("/api/push/calendar")
+async def calendar_push(request: Request):
+    """Calendar events.watch notifications (X-Goog-* headers, no body)."""
+    state = request.headers.get("x-goog-resource-state")
+    # "sync" only confirms a new channel (and can arrive before the channel is registered)
+    if state == "sync":
+        return Response(status_code=204)
+    registry = push_registry()
+    channel = registry.channel(request.headers.get("x-goog-channel-id", "")) if registry else None
+    token = request.headers.get("x-goog-channel-token", "")
+    if not channel or not hmac.compare_digest(channel["token"] or "", token):
+        raise HTTPException(status_code=404, detail="Unknown channel")
+    registry.publish(CALENDAR, channel["account"], {
+        "state": state,
+        "message_number": request.headers.get("x-goog-message-number"),
+    })
+    return Response(status_code=204)
+
+@app.post("/api/push/gmail")
+async def gmail_push(request: Request, token: str = ""):
+    """Pub/Sub push for Gmail users.watch; the subscription's endpoint URL carries ?token=PUSH_VERIFICATION_TOKEN."""
+    expected = os.getenv("PUSH_VERIFICATION_TOKEN")
+    if not expected or not hmac.compare_digest(expected, token):
+        raise HTTPException(status_code=403, detail="Invalid push token")
+    try:
+        envelope = await request.json()
+        data = json.loads(base64.b64decode(envelope["message"]["data"]))
+        address, history_id = data["emailAddress"], int(data["historyId"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Not a Gmail push message")
+    registry = push_registry()
+    channel = registry.channel_by_address(GMAIL, address) if registry else None
+    if channel:
+        registry.publish(GMAIL, channel["account"], {"history_id": history_id})
+    # Acknowledge even unknown mailboxes, or Pub/Sub keeps redelivering
+    return Response(status_code=204)
 
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
+
+# --- GOOGLE AUTHENTICATION FLOW ---
+# google_auth_oauthlib is imported by the two endpoints, not at startup
 
 # Scopes needed
 SCOPES = [
@@ -105,6 +443,7 @@ REDIRECT_URI = "http://localhost:3000"
 @app.get("/api/auth/google/url")
 async def get_google_auth_url():
     """Generates the Google Login URL for the frontend button."""
+    from google_auth_oauthlib.flow import Flow
     try:
         client_id = os.getenv("GMAIL_CLIENT_ID") or os.getenv("CALENDAR_CLIENT_ID")
         client_secret = os.getenv("GMAIL_CLIENT_SECRET") or os.getenv("CALENDAR_CLIENT_SECRET")
@@ -139,10 +478,18 @@ async def get_google_auth_url():
 
 class AuthCodeRequest(BaseModel):
     code: str
+    # Set from the identity token (see bind_identity); if sent, they must match it
+    user_id: Optional[str] = None
+    tenant_id: Optional[str] = None
 
 @app.post("/api/auth/google/callback")
-async def google_auth_callback(request: AuthCodeRequest):
-    """Exchanges the code for tokens and saves them."""
+async def google_auth_callback(request: AuthCodeRequest, authorization: Optional[str] = Header(None)):
+    """Exchanges the code for tokens and saves them for the authenticated user."""
+    from google_auth_oauthlib.flow import Flow
+    if token_secret() and not authorization:
+        # With per-user identities, an anonymous caller must not replace the default account's tokens
+        raise HTTPException(status_code=401, detail="Connecting an account requires an identity token")
+    bind_identity(request, authorization)
     try:
         client_id = os.getenv("GMAIL_CLIENT_ID") or os.getenv("CALENDAR_CLIENT_ID")
         client_secret = os.getenv("GMAIL_CLIENT_SECRET") or os.getenv("CALENDAR_CLIENT_SECRET")
@@ -164,14 +511,24 @@ async def google_auth_callback(request: AuthCodeRequest):
         flow.fetch_token(code=request.code)
         creds = flow.credentials
 
-        # Save to .env (Simple persistence for single-user bot)
-        # Note: In production, save to DB per user. Here we update the global env for the bot.
-        update_env_file("GMAIL_REFRESH_TOKEN", creds.refresh_token)
-        update_env_file("CALENDAR_REFRESH_TOKEN", creds.refresh_token)
-        
-        # Also update running process env
-        os.environ["GMAIL_REFRESH_TOKEN"] = creds.refresh_token
-        os.environ["CALENDAR_REFRESH_TOKEN"] = creds.refresh_token
+        # Save per user; the MCP servers pick it up on the user's next tool call
+        credential_store.put(request.tenant_id, request.user_id, "google", {
+            "refresh_token": creds.refresh_token,
+            "scopes": list(creds.scopes or SCOPES),
+        })
+        # The exchange already returned an access token; hand it to the MCP servers' cache
+        for spec in google_specs([{"refresh_token": creds.refresh_token}]):
+            if spec.refresh_token == creds.refresh_token:
+                token_broker.seed(spec, creds.token, creds.expiry)
+
+        if (request.tenant_id, request.user_id) == (DEFAULT_TENANT, DEFAULT_USER):
+            # The default identity also keeps the .env tokens used by get_google_tokens.py and the CLI agent
+            update_env_file("GMAIL_REFRESH_TOKEN", creds.refresh_token)
+            update_env_file("CALENDAR_REFRESH_TOKEN", creds.refresh_token)
+
+            # Also update running process env
+            os.environ["GMAIL_REFRESH_TOKEN"] = creds.refresh_token
+            os.environ["CALENDAR_REFRESH_TOKEN"] = creds.refresh_token
 
         return {"status": "success", "message": "Tokens saved successfully!"}
 
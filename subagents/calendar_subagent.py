@@ -50,7 +50,11 @@ calendar_agent = LlmAgent(
                     "PYTHONUNBUFFERED": "1",
                     "CALENDAR_CLIENT_ID": os.getenv("CALENDAR_CLIENT_ID", os.getenv("GMAIL_CLIENT_ID", "")),
                     "CALENDAR_CLIENT_SECRET": os.getenv("CALENDAR_CLIENT_SECRET", os.getenv("GMAIL_CLIENT_SECRET", "")),
-                    "CALENDAR_REFRESH_TOKEN": os.getenv("CALENDAR_REFRESH_TOKEN", os.getenv("GMAIL_REFRESH_TOKEN", ""))
+                    "CALENDAR_REFRESH_TOKEN": os.getenv("CALENDAR_REFRESH_TOKEN", os.getenv("GMAIL_REFRESH_TOKEN", "")),
+                    "CALENDAR_API_BASE_URL": os.getenv("CALENDAR_API_BASE_URL", ""),
+                    "CREDENTIAL_STORE_PATH": os.getenv("CREDENTIAL_STORE_PATH", ""),
+                    "CREDENTIAL_STORE_KEY": os.getenv("CREDENTIAL_STORE_KEY", ""),
+                    "MCP_CLIENT_CACHE_SIZE": os.getenv("MCP_CLIENT_CACHE_SIZE", "")
                 }
             )
         )
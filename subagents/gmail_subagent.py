@@ -41,7 +41,11 @@ gmail_agent = LlmAgent(
                     "PYTHONUNBUFFERED": "1",
                     "GMAIL_CLIENT_ID": os.getenv("GMAIL_CLIENT_ID", ""),
                     "GMAIL_CLIENT_SECRET": os.getenv("GMAIL_CLIENT_SECRET", ""),
-                    "GMAIL_REFRESH_TOKEN": os.getenv("GMAIL_REFRESH_TOKEN", "")
+                    "GMAIL_REFRESH_TOKEN": os.getenv("GMAIL_REFRESH_TOKEN", ""),
+                    "GMAIL_API_BASE_URL": os.getenv("GMAIL_API_BASE_URL", ""),
+                    "CREDENTIAL_STORE_PATH": os.getenv("CREDENTIAL_STORE_PATH", ""),
+                    "CREDENTIAL_STORE_KEY": os.getenv("CREDENTIAL_STORE_KEY", ""),
+                    "MCP_CLIENT_CACHE_SIZE": os.getenv("MCP_CLIENT_CACHE_SIZE", "")
                 }
             )
         )
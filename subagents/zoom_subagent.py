@@ -44,7 +44,11 @@ zoom_agent = LlmAgent(
                     "PYTHONUNBUFFERED": "1",
                     "ZOOM_ACCOUNT_ID": os.getenv("ZOOM_ACCOUNT_ID", ""),
                     "ZOOM_CLIENT_ID": os.getenv("ZOOM_CLIENT_ID", ""),
-                    "ZOOM_CLIENT_SECRET": os.getenv("ZOOM_CLIENT_SECRET", "")
+                    "ZOOM_CLIENT_SECRET": os.getenv("ZOOM_CLIENT_SECRET", ""),
+                    "ZOOM_API_BASE_URL": os.getenv("ZOOM_API_BASE_URL", ""),
+                    "CREDENTIAL_STORE_PATH": os.getenv("CREDENTIAL_STORE_PATH", ""),
+                    "CREDENTIAL_STORE_KEY": os.getenv("CREDENTIAL_STORE_KEY", ""),
+                    "MCP_CLIENT_CACHE_SIZE": os.getenv("MCP_CLIENT_CACHE_SIZE", "")
                 }
             )
         )
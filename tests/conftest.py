@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The MCP servers import their sibling modules directly, as they do when run as scripts.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "mcp_servers")]
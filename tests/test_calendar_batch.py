@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+import calendar_mcp
+import credential_store
+import token_broker
+from fake_apis import BackgroundServer, create_app
+
+EVENTS = [{"summary": f"Interview {i}", "start_time": f"2026-11-0{i + 2}T15:00:00Z",
+           "end_time": f"2026-11-0{i + 2}T15:30:00Z"} for i in range(3)]
+
+
+@pytest.fixture
+def fake_calendar(tmp_path, monkeypatch):
+    server = BackgroundServer(create_app(events=2)).start()
+    for name, value in (("CALENDAR_CLIENT_ID", "cid"), ("CALENDAR_CLIENT_SECRET", "secret"),
+                        ("CALENDAR_REFRESH_TOKEN", "rt"), ("CALENDAR_API_BASE_URL", server.base_url),
+                        ("CREDENTIAL_STORE_PATH", str(tmp_path / "credentials.db")),
+                        ("MCP_CACHE_GENERATIONS_PATH", str(tmp_path / "generations.db"))):
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(credential_store, "_store", None)
+    monkeypatch.setattr(token_broker, "_default_broker", None)
+    monkeypatch.setattr(calendar_mcp, "calendar_service", None)
+    monkeypatch.setattr(calendar_mcp.tool_cache, "_shared", None)
+    yield server
+    server.stop()
+
+
+def test_batch_backoff_does_not_block_the_event_loop(fake_calendar, monkeypatch):
+    run_batched = calendar_mcp.CalendarService._run_batched
+
+    def slow_run_batched(self, requests):
+        time.sleep(0.5)  # what a retry backoff does
+        return run_batched(self, requests)
+
+    monkeypatch.setattr(calendar_mcp.CalendarService, "_run_batched", slow_run_batched)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.05)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        try:
+            content = await calendar_mcp.call_tool("create_events", {"events": EVENTS})
+        finally:
+            task.cancel()
+        return content[0].text, ticks
+
+    text, ticks = asyncio.run(scenario())
+    assert text.count("\tcreated") == 3
+    assert ticks >= 5  # other calls kept being served during the batch
@@ -0,0 +1,25 @@
+import asyncio
+
+from chat_jobs import ChatJobs
+
+ALICE = ("acme", "alice")
+MALLORY = ("acme", "mallory")
+
+
+def test_only_the_submitting_identity_can_read_a_job():
+    async def scenario():
+        jobs = ChatJobs(workers=1)
+
+        async def turn():
+            return "Your meeting is booked for Tuesday at 10:00."
+
+        job_id = jobs.submit("conv-1", turn, owner=ALICE)["job_id"]
+        await asyncio.sleep(0.05)
+        try:
+            return jobs.describe(job_id, owner=ALICE), jobs.describe(job_id, owner=MALLORY), jobs.describe(job_id)
+        finally:
+            await jobs.close()
+
+    own, other, anonymous = asyncio.run(scenario())
+    assert own["status"] == "succeeded" and "Tuesday" in own["text"]
+    assert other is None and anonymous is None
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from gmail_mime import resolve_attachment, send_attachment_directory, spool_directory
+
+ALICE = ("acme", "alice")
+BOB = ("acme", "bob")
+
+
+@pytest.fixture(autouse=True)
+def spool_root(tmp_path, monkeypatch):
+    monkeypatch.setenv("GMAIL_ATTACHMENT_DIR", str(tmp_path / "spool"))
+    monkeypatch.delenv("GMAIL_SEND_ATTACHMENT_DIR", raising=False)
+
+
+def test_each_identity_has_a_private_spool():
+    alice, bob = spool_directory(ALICE), spool_directory(BOB)
+    assert alice != bob
+    assert os.stat(alice).st_mode & 0o777 == 0o700
+    assert os.stat(os.path.dirname(alice)).st_mode & 0o777 == 0o700
+
+
+def test_a_user_cannot_send_another_users_download():
+    downloaded = os.path.join(spool_directory(BOB), "m1-2-contract.pdf")
+    with open(downloaded, "wb") as f:
+        f.write(b"%PDF")
+    assert resolve_attachment(downloaded, send_attachment_directory(BOB)) == os.path.realpath(downloaded)
+    with pytest.raises(ValueError, match="outside"):
+        resolve_attachment(downloaded, send_attachment_directory(ALICE))
+
+
+def test_symlinks_and_parent_references_are_refused(tmp_path):
+    directory = send_attachment_directory(ALICE)
+    outside = tmp_path / "secret.txt"
+    outside.write_text("x")
+    os.symlink(outside, os.path.join(directory, "link.txt"))
+    for path in ("link.txt", "../secret.txt", str(outside)):
+        with pytest.raises(ValueError):
+            resolve_attachment(path, directory)
@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+from gmail_mirror import GmailMirror
+
+DAY_MS = 24 * 3600 * 1000
+BASE = int(datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def message(message_id, thread_id, day, subject):
+    return {"id": message_id, "threadId": thread_id, "internalDate": str(BASE + day * DAY_MS),
+            "labelIds": ["INBOX"], "snippet": subject,
+            "payload": {"headers": [{"name": "Subject", "value": subject},
+                                    {"name": "From", "value": "alice@example.com"}]}}
+
+
+class Call:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeGmail:
+    """The part of the Gmail API a full sync uses; threads are listed most recently active first."""
+
+    def __init__(self, threads):
+        self.threads_by_id = {t["id"]: t for t in threads}
+        self.order = sorted(threads, key=lambda t: -int(t["messages"][-1]["internalDate"]))
+
+    def users(self):
+        return self
+
+    def getProfile(self, userId):
+        return Call({"historyId": "100", "emailAddress": "me@example.com"})
+
+    def threads(self):
+        return self
+
+    def list(self, userId, maxResults, pageToken=None):
+        start = int(pageToken or 0)
+        page = {"threads": [{"id": t["id"]} for t in self.order[start:start + maxResults]]}
+        if start + maxResults < len(self.order):
+            page["nextPageToken"] = str(start + maxResults)
+        return Call(page)
+
+    def get(self, userId, id, **kwargs):
+        return Call(self.threads_by_id[id])
+
+    def history(self):
+        return FakeHistory()
+
+
+class FakeHistory:
+    def list(self, userId, startHistoryId, **kwargs):
+        return Call({"historyId": str(startHistoryId)})
+
+
+def test_after_query_before_sync_horizon_goes_to_gmail(tmp_path, monkeypatch):
+    monkeypatch.setenv("GMAIL_MIRROR_MAX_THREADS", "1")
+    # The recently active thread holds a day-1 message; the day-5 thread isn't mirrored.
+    recent = {"id": "t-recent", "historyId": "90",
+              "messages": [message("m1", "t-recent", 1, "budget draft"), message("m2", "t-recent", 10, "budget final")]}
+    older = {"id": "t-older", "historyId": "80", "messages": [message("m3", "t-older", 5, "budget review")]}
+    service = FakeGmail([recent, older])
+    mirror = GmailMirror(lambda: service, path=str(tmp_path / "mirror.db"))
+    mirror.sync()
+
+    # Between the oldest mirrored message (day 1) and the horizon (day 10): t-older may match
+    assert mirror.search("review after:2026/01/04", 1) is None
+    # After the horizon every matching message is mirrored
+    assert mirror.search("review after:2026/01/12", 1) == []
+    mirror.close()
+
+
+def test_reads_never_sync_on_the_calling_thread(tmp_path):
+    thread = {"id": "t1", "historyId": "90", "messages": [message("m1", "t1", 1, "budget draft")]}
+    mirror = GmailMirror(lambda: FakeGmail([thread]), path=str(tmp_path / "mirror.db"))
+    mirror.sync()
+    mirror.invalidate()
+
+    # Stale: the read falls back to Gmail instead of running history.list itself
+    assert mirror.list_threads(1) is None
+    assert mirror.stats["incremental_syncs"] == 0
+    # gmail_mcp.py runs refresh() in a worker thread before mirrored tools
+    assert mirror.refresh()
+    assert mirror.stats["incremental_syncs"] == 1
+    assert [t["id"] for t in mirror.list_threads(1)] == ["t1"]
+    mirror.close()
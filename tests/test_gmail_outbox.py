@@ -0,0 +1,72 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import credential_store
+import gmail_mcp
+import token_broker
+from credential_store import DEFAULT_TENANT, DEFAULT_USER
+from fake_apis import BackgroundServer, create_app
+from gmail_outbox import GmailOutbox
+
+REQUEST = {'to': 'bob@example.com', 'subject': 'Booking confirmed', 'body': 'See you then.', 'attachments': []}
+
+
+@pytest.fixture
+def fake_gmail(tmp_path, monkeypatch):
+    server = BackgroundServer(create_app(threads=2)).start()
+    for name, value in (("GMAIL_CLIENT_ID", "cid"), ("GMAIL_CLIENT_SECRET", "secret"),
+                        ("GMAIL_REFRESH_TOKEN", "rt"), ("GMAIL_API_BASE_URL", server.base_url),
+                        ("GMAIL_MIRROR_ENABLED", "0"), ("GMAIL_OUTBOX_DIR", str(tmp_path / "outbox")),
+                        ("CREDENTIAL_STORE_PATH", str(tmp_path / "credentials.db"))):
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(credential_store, "_store", None)
+    monkeypatch.setattr(token_broker, "_default_broker", None)
+    monkeypatch.setattr(gmail_mcp, "gmail_service", None)
+    monkeypatch.setattr(gmail_mcp, "outboxes", {})
+    yield server
+    for outbox in gmail_mcp.outboxes.values():
+        outbox.close()
+    server.stop()
+
+
+def wait_until_sent(outbox, outbox_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = outbox.status(outbox_id)
+        if status and status['status'] == 'sent':
+            return status
+        time.sleep(0.05)
+    return outbox.status(outbox_id)
+
+
+def test_queued_mail_is_delivered_after_the_service_is_evicted(fake_gmail):
+    service = gmail_mcp.service_for((DEFAULT_TENANT, DEFAULT_USER))
+    outbox = service.outbox
+    service.close()  # what ClientCache eviction does
+    queued = outbox.enqueue(REQUEST)
+    assert wait_until_sent(outbox, queued['outbox_id'])['status'] == 'sent'
+
+
+def test_pending_mail_from_an_earlier_run_is_resumed_at_startup(fake_gmail):
+    # Left behind by an earlier process: queued, never started
+    mailbox_key = f"{fake_gmail.base_url}:me@example.com"
+    earlier = GmailOutbox(lambda: None, lambda service, request: {}, mailbox_key=mailbox_key,
+                          owner=(DEFAULT_TENANT, DEFAULT_USER))
+    queued = earlier.enqueue(REQUEST)
+
+    gmail_mcp.resume_outboxes()
+    assert wait_until_sent(gmail_mcp.outboxes[mailbox_key], queued['outbox_id'])['status'] == 'sent'
+
+
+def test_diagnostics_report_outbox_and_result_size_stats(fake_gmail):
+    service = gmail_mcp.service_for((DEFAULT_TENANT, DEFAULT_USER))
+    queued = service.outbox.enqueue(REQUEST)
+    wait_until_sent(service.outbox, queued['outbox_id'])
+    asyncio.run(gmail_mcp.call_tool("list_emails", {"limit": 1}))
+
+    diagnostics = json.loads(asyncio.run(gmail_mcp.call_tool("get_diagnostics", {}))[0].text)
+    assert diagnostics['outbox']['sent'] == 1 and diagnostics['outbox']['pending'] == 0
+    assert diagnostics['result_sizes']['list_emails']['calls'] >= 1
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import pytest
+
+import calendar_mcp
+import credential_store
+import zoom_mcp
+from credential_store import TENANT_ARG, USER_ARG
+from fake_apis import BackgroundServer, create_app
+
+ACME_ALICE = {TENANT_ARG: "acme", USER_ARG: "alice"}
+
+
+@pytest.fixture
+def fake_api(tmp_path, monkeypatch):
+    server = BackgroundServer(create_app(events=2, meetings=2)).start()
+    # No credential store: nobody has connected an account
+    monkeypatch.setenv("CREDENTIAL_STORE_PATH", str(tmp_path / "credentials.db"))
+    monkeypatch.setattr(credential_store, "_store", None)
+    for name, value in (("ZOOM_API_BASE_URL", server.base_url), ("ZOOM_ACCOUNT_ID", "acct"),
+                        ("ZOOM_CLIENT_ID", "cid"), ("ZOOM_CLIENT_SECRET", "secret")):
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(zoom_mcp, "zoom_service", None)
+    monkeypatch.setenv("MCP_CACHE_GENERATIONS_PATH", str(tmp_path / "generations.db"))
+    monkeypatch.setattr(zoom_mcp.tool_cache, "_shared", None)
+    yield server
+    server.stop()
+
+
+def call(module, name, arguments):
+    return asyncio.run(module.call_tool(name, dict(arguments)))[0].text
+
+
+def test_non_default_identity_books_on_the_shared_zoom_account(fake_api):
+    text = call(zoom_mcp, "create_meeting", {**ACME_ALICE, "topic": "Intro call",
+                                             "start_time": "2026-11-02T15:00:00Z", "duration": 30})
+    meeting = json.loads(text)
+    assert meeting["join_url"] and meeting["topic"] == "Intro call"
+
+
+def test_non_default_identity_without_google_account_fails_closed(fake_api):
+    text = call(calendar_mcp, "list_events", ACME_ALICE)
+    assert "No Google account is connected" in text
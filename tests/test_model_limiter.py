@@ -0,0 +1,16 @@
+import asyncio
+
+from model_limiter import ModelRateLimiter
+
+
+def test_oversized_estimate_is_settled_against_the_capped_debit():
+    limiter = ModelRateLimiter(rpm=0, tpm=1000)
+
+    async def call():
+        debited = await limiter.acquire(5000)
+        limiter.settle(debited, 1200)
+        return debited
+
+    assert asyncio.run(call()) == 1000
+    # The call used 1200 tokens of a full 1000-token bucket: it is overdrawn, not refilled
+    assert limiter.tokens.level < 0
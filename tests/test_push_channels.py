@@ -0,0 +1,18 @@
+import os
+import stat
+
+from push_channels import PushRegistry, push_enabled, registry_path
+
+
+def test_registry_is_private_and_absent_until_push_is_configured(tmp_path, monkeypatch):
+    monkeypatch.setenv("CREDENTIAL_STORE_PATH", str(tmp_path / "credentials.db"))
+    monkeypatch.delenv("PUSH_WEBHOOK_BASE_URL", raising=False)
+    monkeypatch.delenv("GMAIL_PUSH_TOPIC", raising=False)
+    assert not push_enabled()
+    assert not os.path.exists(registry_path())
+
+    monkeypatch.setenv("GMAIL_PUSH_TOPIC", "projects/fake/topics/gmail")
+    assert push_enabled()
+    registry = PushRegistry()
+    registry.publish("gmail", "me@example.com", {"history_id": 1})
+    assert stat.S_IMODE(os.stat(registry.path).st_mode) == 0o600
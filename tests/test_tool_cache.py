@@ -0,0 +1,37 @@
+from tool_cache import ToolCache
+
+EVENT_READS = ["list_events", "find_free_slots"]
+
+
+def calendar_cache(path):
+    return ToolCache(name="calendar", ttls={"find_free_slots": 30},
+                     invalidates={"create_event": EVENT_READS}, generations_path=str(path), enabled=True)
+
+
+def test_write_in_one_pooled_instance_invalidates_the_other(tmp_path):
+    # Two instances of the calendar server, as mcp_pool.py runs them, sharing the generations file
+    first, second = calendar_cache(tmp_path / "generations.db"), calendar_cache(tmp_path / "generations.db")
+    slots = {"value": ["10:00", "11:00"]}
+
+    def find_free_slots():
+        return list(slots["value"])
+
+    args = {"duration_minutes": 30}
+    assert second.get("alice@example.com", "find_free_slots", args, find_free_slots) == ["10:00", "11:00"]
+    assert first.get("alice@example.com", "find_free_slots", args, find_free_slots) == ["10:00", "11:00"]
+
+    # The booking goes to the first instance
+    slots["value"] = ["11:00"]
+    first.after_write("alice@example.com", "create_event")
+
+    assert second.get("alice@example.com", "find_free_slots", args, find_free_slots) == ["11:00"]
+    assert first.get("alice@example.com", "find_free_slots", args, find_free_slots) == ["11:00"]
+
+
+def test_other_scopes_stay_cached(tmp_path):
+    first, second = calendar_cache(tmp_path / "generations.db"), calendar_cache(tmp_path / "generations.db")
+    calls = []
+    second.get("bob@example.com", "find_free_slots", {}, lambda: calls.append(1) or ["09:00"])
+    first.after_write("alice@example.com", "create_event")
+    second.get("bob@example.com", "find_free_slots", {}, lambda: calls.append(1) or ["09:00"])
+    assert len(calls) == 1
@@ -0,0 +1,261 @@
+import asyncio
+import contextvars
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.agent_tool import AgentTool
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+from mcp.types import CallToolResult
+
+# Conversation record-and-replay for performance regression testing.
+#
+# TurnRecorder is an ADK plugin that captures, for one /api/chat turn, the input,
+# every ADK event, every model request/response and every tool call/result
+# (including the ones made by agents nested in AgentTool) and appends it as one
+# line to a gzip-compressed JSONL file. Enable it with CHAT_RECORD_DIR.
+#
+# ReplayPlugin substitutes the recorded model responses and tool results so the
+# same conversation can be re-run against the current code (benchmarks/replay.py).
+
+logger = logging.getLogger(__name__)
+
+RECORD_VERSION = 1
+
+_current_turn: contextvars.ContextVar[Optional["TurnRecord"]] = contextvars.ContextVar("current_turn", default=None)
+
+
+def to_jsonable(value: Any) -> Any:
+    """Converts pydantic models (ADK/genai/MCP types) and containers to plain JSON data."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return str(value)
+
+
+def dump_request(llm_request: LlmRequest) -> Dict:
+    config = llm_request.config
+    system_instruction = config.system_instruction if config else None
+    return {
+        "model": llm_request.model,
+        "system_instruction": to_jsonable(system_instruction),
+        "tools": sorted(llm_request.tools_dict),
+        "contents": [to_jsonable(c) for c in llm_request.contents],
+    }
+
+
+def _strip_none(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_none(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_strip_none(v) for v in value]
+    return value
+
+
+def estimate_request_tokens(request: Dict) -> int:
+    """Model-independent prompt size estimate (~4 characters per token) for comparing versions."""
+    size = len(json.dumps(request.get("system_instruction") or ""))
+    for content in request.get("contents", []):
+        size += len(json.dumps(_strip_none(content.get("parts", []))))
+    return size // 4
+
+
+def usage_of(response: Dict) -> Dict:
+    usage = response.get("usage_metadata") or {}
+    return {
+        "prompt": usage.get("prompt_token_count"),
+        "candidates": usage.get("candidates_token_count"),
+        "total": usage.get("total_token_count"),
+    }
+
+
+class TurnRecord:
+    """Everything observed while serving one chat turn."""
+
+    def __init__(self, conversation_id: str, user_id: str, new_message: str,
+                 agent: Optional[str] = None, route: Optional[str] = None):
+        self.data: Dict[str, Any] = {
+            "version": RECORD_VERSION,
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "input": new_message,
+            # The agent the turn ran on (intent_router may send it to the light agent)
+            "agent": agent,
+            "route": route,
+            "events": [],
+            "model_calls": [],
+            "tool_calls": [],
+        }
+        self.started = time.perf_counter()
+        self._pending_models: Dict[str, Deque[Dict]] = defaultdict(deque)
+        self._pending_tools: Dict[str, Dict] = {}
+
+
+class TurnRecorder(BasePlugin):
+    """ADK plugin that records turns started with start_turn() to compressed JSONL."""
+
+    def __init__(self, directory: str):
+        super().__init__(name="turn_recorder")
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["TurnRecorder"]:
+        directory = os.getenv("CHAT_RECORD_DIR")
+        return cls(directory) if directory else None
+
+    # --- Turn lifecycle (called by chat_endpoint) ---
+    def start_turn(self, conversation_id: str, user_id: str, new_message: str,
+                   agent: Optional[str] = None, route: Optional[str] = None) -> TurnRecord:
+        record = TurnRecord(conversation_id, user_id, new_message, agent, route)
+        _current_turn.set(record)
+        return record
+
+    async def finish_turn(self, record: TurnRecord, response_text: Optional[str] = None,
+                          error: Optional[str] = None):
+        record.data["latency_ms"] = round((time.perf_counter() - record.started) * 1000, 2)
+        record.data["response_text"] = response_text
+        record.data["error"] = error
+        line = json.dumps(record.data, separators=(",", ":"))
+        try:
+            await asyncio.to_thread(self._append, line)
+        except OSError as e:
+            logger.error(f"Could not write turn recording: {e}")
+
+    def _append(self, line: str):
+        path = os.path.join(self.directory, f"turns-{datetime.now(timezone.utc):%Y%m%d}.jsonl.gz")
+        with self._lock:
+            # Each append adds a gzip member; gzip.open reads them back as one stream.
+            with gzip.open(path, "at", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    # --- Plugin callbacks ---
+    async def on_event_callback(self, *, invocation_context: InvocationContext, event: Event) -> Optional[Event]:
+        record = _current_turn.get()
+        if record:
+            record.data["events"].append(to_jsonable(event))
+        return None
+
+    async def before_model_callback(self, *, callback_context: CallbackContext,
+                                    llm_request: LlmRequest) -> Optional[LlmResponse]:
+        record = _current_turn.get()
+        if record:
+            call = {"agent": callback_context.agent_name, "request": dump_request(llm_request),
+                    "response": None, "_started": time.perf_counter()}
+            record.data["model_calls"].append(call)
+            record._pending_models[callback_context.agent_name].append(call)
+        return None
+
+    async def after_model_callback(self, *, callback_context: CallbackContext,
+                                   llm_response: LlmResponse) -> Optional[LlmResponse]:
+        record = _current_turn.get()
+        pending = record._pending_models.get(callback_context.agent_name) if record else None
+        if pending:
+            call = pending[0]
+            call["response"] = to_jsonable(llm_response)
+            if not llm_response.partial:
+                pending.popleft()
+                call["latency_ms"] = round((time.perf_counter() - call.pop("_started")) * 1000, 2)
+                call["usage"] = usage_of(call["response"])
+        return None
+
+    async def before_tool_callback(self, *, tool: BaseTool, tool_args: Dict[str, Any],
+                                   tool_context: ToolContext) -> Optional[Dict]:
+        record = _current_turn.get()
+        if record:
+            call = {"agent": tool_context.agent_name, "tool": tool.name, "args": to_jsonable(tool_args),
+                    "result": None, "_started": time.perf_counter()}
+            record.data["tool_calls"].append(call)
+            record._pending_tools[tool_context.function_call_id or tool.name] = call
+        return None
+
+    async def after_tool_callback(self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext,
+                                  result: Dict) -> Optional[Dict]:
+        record = _current_turn.get()
+        call = record._pending_tools.pop(tool_context.function_call_id or tool.name, None) if record else None
+        if call:
+            call["result"] = to_jsonable(result)
+            # MCP tools return a CallToolResult object; replay rebuilds it so prompts match production.
+            call["result_type"] = type(result).__name__
+            call["latency_ms"] = round((time.perf_counter() - call.pop("_started")) * 1000, 2)
+        return None
+
+
+# --- Replay ---
+def load_recordings(paths: List[str]) -> List[Dict]:
+    """Reads turn records from .jsonl.gz (or plain .jsonl) files in start order."""
+    turns = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            turns.extend(json.loads(line) for line in f if line.strip())
+    turns.sort(key=lambda t: t["started_at"])
+    return turns
+
+
+class ReplayPlugin(BasePlugin):
+    """Serves recorded model responses and tool results instead of calling Gemini or MCP."""
+
+    def __init__(self):
+        super().__init__(name="turn_replay")
+        self.load({"model_calls": [], "tool_calls": []})
+
+    def load(self, turn: Dict):
+        """Queues the responses recorded for one turn and resets per-turn counters."""
+        self._models: Dict[str, Deque[Dict]] = defaultdict(deque)
+        for call in turn["model_calls"]:
+            if call.get("response") is not None:
+                self._models[call["agent"]].append(call["response"])
+        self._tools: Dict[tuple, Deque[Any]] = defaultdict(deque)
+        for call in turn["tool_calls"]:
+            self._tools[(call["agent"], call["tool"])].append((call.get("result_type"), call["result"]))
+        self.requests: List[Dict] = []
+        self.tool_calls = 0
+        self.misses: List[str] = []
+
+    async def before_model_callback(self, *, callback_context: CallbackContext,
+                                    llm_request: LlmRequest) -> Optional[LlmResponse]:
+        self.requests.append(dump_request(llm_request))
+        queue = self._models.get(callback_context.agent_name)
+        if not queue:
+            self.misses.append(f"model:{callback_context.agent_name}")
+            return LlmResponse(content=types.Content(role="model", parts=[types.Part(text="(replay: no recorded response)")]))
+        return LlmResponse.model_validate(queue.popleft())
+
+    async def before_tool_callback(self, *, tool: BaseTool, tool_args: Dict[str, Any],
+                                   tool_context: ToolContext) -> Optional[Dict]:
+        if isinstance(tool, AgentTool):
+            # Run nested agents for real so their own (recorded) model and tool calls are replayed too.
+            return None
+        self.tool_calls += 1
+        queue = self._tools.get((tool_context.agent_name, tool.name))
+        if not queue:
+            self.misses.append(f"tool:{tool_context.agent_name}.{tool.name}")
+            return {"error": "replay: no recorded result"}
+        result_type, result = queue.popleft()
+        if result_type == "CallToolResult":
+            return CallToolResult.model_validate(result)
+        return result if isinstance(result, dict) else {"result": result}